@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/6.0/ref/settings/
 """
 
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -41,6 +42,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # First, so its timings cover every other middleware
+    'users.metrics.RequestMetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -54,7 +57,8 @@ ROOT_URLCONF = 'myproject.urls'
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        # DjangoTemplates that also times renders for the request metrics
+        'BACKEND': 'users.metrics.TimedDjangoTemplates',
         'DIRS': [],
         'APP_DIRS': True,
         'OPTIONS': {
@@ -62,6 +66,7 @@ TEMPLATES = [
                 'django.template.context_processors.request',
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
+                'users.context_processors.cache_versions',
             ],
         },
     },
@@ -80,6 +85,31 @@ DATABASES = {
     }
 }
 
+# Production database profile: WAL so readers and the writer don't block
+# each other, a busy timeout instead of instant "database is locked" errors,
+# BEGIN IMMEDIATE for transactions (see users.transactions) and persistent
+# connections. Compare both profiles with `manage.py benchmark_database`.
+PRODUCTION_DATABASE = os.environ.get('PRODUCTION_DATABASE') == '1'
+
+SQLITE_PRODUCTION_PROFILE = {
+    'OPTIONS': {
+        'init_command': (
+            'PRAGMA journal_mode=WAL;'
+            'PRAGMA synchronous=NORMAL;'
+            'PRAGMA busy_timeout=10000;'
+            'PRAGMA cache_size=-20000;'  # KiB, i.e. 20 MB per connection
+            'PRAGMA mmap_size=134217728;'
+            'PRAGMA temp_store=MEMORY;'
+        ),
+        'transaction_mode': 'IMMEDIATE',
+    },
+    'CONN_MAX_AGE': 600,
+    'CONN_HEALTH_CHECKS': True,
+}
+
+if PRODUCTION_DATABASE:
+    DATABASES['default'].update(SQLITE_PRODUCTION_PROFILE)
+
 
 # Password validation
 # https://docs.djangoproject.com/en/6.0/ref/settings/#auth-password-validators
@@ -115,14 +145,117 @@ USE_TZ = True
 
 STATIC_URL = '/static/'
 STATICFILES_DIRS = [BASE_DIR / 'static']
+STATIC_ROOT = BASE_DIR / 'staticfiles'
+
+# Production asset delivery: manifest-hashed static names with .gz/.br
+# variants written by collectstatic, and static/media served by users.assets
+# with long-lived caching. Needs `manage.py collectstatic` before starting.
+PRODUCTION_ASSETS = os.environ.get('PRODUCTION_ASSETS') == '1'
+
+if PRODUCTION_ASSETS:
+    STORAGES = {
+        'default': {'BACKEND': 'django.core.files.storage.FileSystemStorage'},
+        'staticfiles': {'BACKEND': 'users.storage.PrecompressedManifestStaticFilesStorage'},
+    }
 
 
 import mimetypes
 mimetypes.add_type("text/css", ".css", True)
+mimetypes.add_type("image/webp", ".webp", True)
+mimetypes.add_type("image/avif", ".avif", True)
 
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
 
+# Uploads under these prefixes are never rewritten in place, so they are
+# served with immutable caching, as are content-addressed uploads (named by
+# their hash); everything else is revalidated by ETag.
+IMMUTABLE_MEDIA_PREFIXES = ['avatars/', 'renditions/']
+
+# Loads the user's profiles together with the user on every request.
+# ModelBackend stays listed for sessions signed in before ProfileBackend:
+# they name it as their backend and would otherwise be logged out. New
+# logins go through ProfileBackend, which is tried first.
+AUTHENTICATION_BACKENDS = ['users.backends.ProfileBackend', 'django.contrib.auth.backends.ModelBackend']
+
+# Runs the tests with the settings they need process-wide (a temporary
+# MEDIA_ROOT, no background view counter flusher).
+TEST_RUNNER = 'myproject.test_runner.TestRunner'
+
 LOGIN_REDIRECT_URL = 'home'
 LOGOUT_REDIRECT_URL = 'home'
 
+
+# Featured photos on the homepage: size of the cached pool of candidate IDs
+# and how often (in seconds) it is rebuilt.
+FEATURED_POOL_SIZE = 300
+FEATURED_POOL_TTL = 600
+
+# How long (in seconds) specialists match counts are cached per filter combination.
+SPECIALISTS_COUNT_TTL = 60
+
+# Threads per process that compress uploaded images in the background.
+# Set to 0 to leave queued photos to `manage.py process_images`.
+IMAGE_WORKERS = 2
+
+# Processes used to compress multi-photo uploads in parallel.
+IMAGE_PROCESSES = os.cpu_count() or 1
+
+# Widths (in px) of the resized copies generated for every uploaded image.
+RENDITION_WIDTHS = [160, 400, 800, 1600]
+
+# Formats the resized copies are written in, best first. JPEG is always
+# written; the others are skipped if the Pillow build can't encode them.
+RENDITION_FORMATS = ['avif', 'webp', 'jpeg']
+
+# How often (in seconds) buffered profile views are written to the database.
+# Set to 0 to start no background flusher: views are then written only at
+# process exit. The tests run with 0 and flush explicitly.
+VIEW_COUNTER_FLUSH_INTERVAL = 10
+
+# Completed bookings older than this (in days) are moved to the archive
+# table by `manage.py archive_bookings`.
+BOOKING_ARCHIVE_DAYS = 180
+
+# Full-text search uses SQLite's FTS5 table when the database has one.
+# Set to False to use the in-process index instead (the fallback without FTS5).
+SEARCH_USE_FTS5 = True
+
+# Requests slower than this (in seconds) are logged with their costliest SQL.
+SLOW_REQUEST_THRESHOLD = float(os.environ.get('SLOW_REQUEST_THRESHOLD', 1.0))
+
+# Bearer token Prometheus sends to scrape /metrics (the `authorization`
+# section of its scrape config). Without one /metrics is switched off. The
+# client address can't stand in for it: behind a reverse proxy on the same
+# host every request comes from 127.0.0.1.
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN', '')
+
+# Local memory by default. Set CACHE_BACKEND to
+# django.core.cache.backends.filebased.FileBasedCache and CACHE_LOCATION to a
+# directory to share the cache between worker processes.
+# Rendered pages and template fragments go to their own 'pages' cache: they
+# are large and numerous, and in 'default' they would evict the small entries
+# (cache versions, match counts, rendition manifests, the featured pool)
+# that are expensive to lose.
+CACHE_BACKEND = os.environ.get('CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache')
+CACHE_LOCATION = os.environ.get('CACHE_LOCATION', 'world-photo')
+CACHES = {
+    'default': {
+        'BACKEND': CACHE_BACKEND,
+        'LOCATION': CACHE_LOCATION,
+        'TIMEOUT': 300,
+        'OPTIONS': {'MAX_ENTRIES': 20000},
+    },
+    'pages': {
+        'BACKEND': CACHE_BACKEND,
+        'LOCATION': f'{CACHE_LOCATION}-pages',
+        'TIMEOUT': 300,
+        'OPTIONS': {'MAX_ENTRIES': 5000},
+    },
+}
+
+# How long (in seconds) public pages and template fragments are cached.
+# Entries are also dropped as soon as the data they show changes, except
+# for profile view counts: the buffered counter (users.counters) doesn't
+# invalidate pages, so cached cards may show a count up to this old.
+PUBLIC_PAGE_CACHE_TTL = 300
@@ -0,0 +1,31 @@
+import shutil
+import tempfile
+
+from django.test.runner import DiscoverRunner
+from django.test.utils import override_settings
+
+
+class TestRunner(DiscoverRunner):
+    """
+    DiscoverRunner with settings overridden for the whole run.
+
+    Files the tests store (uploads, renditions, initials avatars) go to a
+    temporary MEDIA_ROOT that is removed afterwards, not into media/. No
+    background thread writes buffered profile views: it would write in the
+    middle of other tests. Views left unwritten are discarded at the end
+    rather than flushed into the real database at exit.
+    """
+
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        self.media_root = tempfile.mkdtemp(prefix='worldphoto-media-')
+        self.test_settings = override_settings(MEDIA_ROOT=self.media_root, VIEW_COUNTER_FLUSH_INTERVAL=0)
+        self.test_settings.enable()
+
+    def teardown_test_environment(self, **kwargs):
+        from users.counters import discard_views
+
+        discard_views()
+        self.test_settings.disable()
+        shutil.rmtree(self.media_root, ignore_errors=True)
+        super().teardown_test_environment(**kwargs)
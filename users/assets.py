@@ -0,0 +1,143 @@
+"""
+Static and media delivery for the production asset mode (PRODUCTION_ASSETS).
+
+A small replacement for django.views.static.serve that:
+- answers If-None-Match / If-Modified-Since with 304,
+- serves single byte ranges (206) so video-style seeking and resumed
+  downloads work,
+- sends precompressed .br/.gz variants written by collectstatic,
+- marks hashed static files and content-addressed uploads as immutable, so
+  browsers fetch them once.
+"""
+import mimetypes
+import os
+import posixpath
+import re
+
+from django.conf import settings
+from django.http import FileResponse, Http404, HttpResponse, StreamingHttpResponse
+from django.utils._os import safe_join
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.http import http_date, parse_http_date_safe, quote_etag
+
+from .storage import is_content_addressed
+
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+REVALIDATE_CACHE_CONTROL = 'public, no-cache'
+# Names written by ManifestStaticFilesStorage: styles.1a2b3c4d5e6f.css
+HASHED_NAME_RE = re.compile(r'\.[0-9a-f]{12}\.[^./]+$')
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+# Accept-Encoding token -> suffix of the precompressed variant, best first
+ENCODINGS = [('br', '.br'), ('gzip', '.gz')]
+CHUNK_SIZE = 64 * 1024
+
+
+def serve_static(request, path):
+    immutable = bool(HASHED_NAME_RE.search(path))
+    return serve_file(request, path, settings.STATIC_ROOT, immutable=immutable, precompressed=True)
+
+
+def serve_media(request, path):
+    immutable = path.startswith(tuple(settings.IMMUTABLE_MEDIA_PREFIXES)) or is_content_addressed(path)
+    return serve_file(request, path, settings.MEDIA_ROOT, immutable=immutable)
+
+
+def _accepted_variant(request, fullpath):
+    accepted = {
+        token.split(';')[0].strip()
+        for token in request.headers.get('accept-encoding', '').split(',')
+    }
+    for encoding, suffix in ENCODINGS:
+        if encoding in accepted and os.path.isfile(fullpath + suffix):
+            return encoding, fullpath + suffix
+    return None, fullpath
+
+
+def _parse_range(header, size):
+    """Returns (start, end) inclusive for a single satisfiable range, 'invalid', or None to send everything."""
+    match = RANGE_RE.match(header.strip())
+    if not match:
+        # Malformed or multi-range: answering with the whole file is allowed
+        return None
+    first, last = match.groups()
+    if not first and not last:
+        return None
+    if not first:
+        # Suffix range: the last N bytes
+        length = int(last)
+        if length == 0:
+            return 'invalid'
+        return max(0, size - length), size - 1
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size or start > end:
+        return 'invalid'
+    return start, end
+
+
+def _read_range(path, start, length):
+    with open(path, 'rb') as f:
+        f.seek(start)
+        while length > 0:
+            chunk = f.read(min(CHUNK_SIZE, length))
+            if not chunk:
+                break
+            length -= len(chunk)
+            yield chunk
+
+
+def serve_file(request, path, document_root, immutable=False, precompressed=False):
+    path = posixpath.normpath(path).lstrip('/')
+    try:
+        fullpath = safe_join(document_root, path)
+    except ValueError:
+        raise Http404("Invalid path")
+    if not os.path.isfile(fullpath):
+        raise Http404("File not found")
+
+    encoding, sendpath = _accepted_variant(request, fullpath) if precompressed else (None, fullpath)
+    stat = os.stat(sendpath)
+    size = stat.st_size
+    # Encoded variants are different bytes, so they get their own ETag
+    etag = quote_etag(f"{int(stat.st_mtime)}-{size}-{encoding or 'identity'}")
+    last_modified = int(stat.st_mtime)
+
+    def finish(response):
+        response.headers['ETag'] = etag
+        response.headers['Last-Modified'] = http_date(last_modified)
+        response.headers['Cache-Control'] = IMMUTABLE_CACHE_CONTROL if immutable else REVALIDATE_CACHE_CONTROL
+        response.headers['Accept-Ranges'] = 'bytes'
+        if precompressed:
+            patch_vary_headers(response, ['Accept-Encoding'])
+        return response
+
+    not_modified = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if not_modified is not None:
+        return finish(not_modified)
+
+    content_type, _ = mimetypes.guess_type(fullpath)
+    content_type = content_type or 'application/octet-stream'
+
+    byte_range = None
+    range_header = request.headers.get('range')
+    if range_header and request.method in ('GET', 'HEAD'):
+        # If-Range: only honour the range if the client's copy is still current
+        if_range = request.headers.get('if-range')
+        if not if_range or if_range == etag or parse_http_date_safe(if_range) == last_modified:
+            byte_range = _parse_range(range_header, size)
+
+    if byte_range == 'invalid':
+        response = HttpResponse(status=416)
+        response.headers['Content-Range'] = f"bytes */{size}"
+        return finish(response)
+
+    if byte_range is None:
+        response = FileResponse(open(sendpath, 'rb'), content_type=content_type, filename=os.path.basename(fullpath))
+    else:
+        start, end = byte_range
+        response = StreamingHttpResponse(_read_range(sendpath, start, end - start + 1), status=206, content_type=content_type)
+        response.headers['Content-Range'] = f"bytes {start}-{end}/{size}"
+        response.headers['Content-Length'] = str(end - start + 1)
+    if encoding:
+        response.headers['Content-Encoding'] = encoding
+    return finish(response)
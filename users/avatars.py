@@ -0,0 +1,76 @@
+"""
+Initials avatars for users without a profile image, rendered locally with
+Pillow instead of fetched from ui-avatars.com.
+
+Each avatar is stored once under avatars/<hash[:2]>/<hash>.png, where the
+hash covers everything that affects the picture (initials, colours, size).
+A name therefore always maps to the same immutable file, and a changed name
+simply gets a new one. Which avatars exist is remembered in the cache, so
+rendering a page doesn't touch the disk.
+"""
+import hashlib
+from io import BytesIO
+
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from PIL import Image, ImageDraw, ImageFont
+
+AVATAR_SIZE = 128
+BRAND_BACKGROUND = '#e0bbd8'
+TEXT_COLOR = '#ffffff'
+# Used for background="random": picked by name, so it is stable per user
+PALETTE = ['#e0bbd8', '#8e7cc3', '#6fa8dc', '#76a5af', '#93c47d', '#f6b26b', '#e06666', '#c27ba0']
+# Looked up in the system font directories; the first one found wins.
+# They cover Cyrillic, which Pillow's built-in font does not.
+FONT_CANDIDATES = ['DejaVuSans-Bold.ttf', 'DejaVuSans.ttf', 'LiberationSans-Bold.ttf', 'arialbd.ttf', 'arial.ttf']
+
+_font_cache = {}
+
+
+def initials(name):
+    words = name.split()
+    letters = ''.join(word[0] for word in words[:2]).upper()
+    return letters or '?'
+
+
+def _font(size):
+    if size not in _font_cache:
+        for candidate in FONT_CANDIDATES:
+            try:
+                _font_cache[size] = ImageFont.truetype(candidate, size)
+                break
+            except OSError:
+                continue
+        else:
+            _font_cache[size] = ImageFont.load_default(size)
+    return _font_cache[size]
+
+
+def render_avatar(text, background, size=AVATAR_SIZE):
+    """Returns PNG bytes of `text` centred on a `background` square."""
+    img = Image.new('RGB', (size, size), background)
+    draw = ImageDraw.Draw(img)
+    draw.text((size / 2, size / 2), text, fill=TEXT_COLOR, font=_font(int(size * 0.42)), anchor='mm')
+    output = BytesIO()
+    img.save(output, format='PNG', optimize=True)
+    return output.getvalue()
+
+
+def avatar_url(name, background=BRAND_BACKGROUND, size=AVATAR_SIZE, storage=default_storage):
+    """Returns the URL of the initials avatar for `name`, generating it on first use."""
+    text = initials(name)
+    if background == 'random':
+        background = PALETTE[int(hashlib.md5(name.encode()).hexdigest(), 16) % len(PALETTE)]
+
+    key = hashlib.sha1(f"{text}|{background}|{TEXT_COLOR}|{size}".encode()).hexdigest()
+    path = f"avatars/{key[:2]}/{key}.png"
+    cache_key = f"avatar:{key}"
+    if not cache.get(cache_key):
+        if not storage.exists(path):
+            saved = storage.save(path, ContentFile(render_avatar(text, background, size)))
+            if saved != path:
+                # Another request wrote it first; keep theirs
+                storage.delete(saved)
+        cache.set(cache_key, True, None)
+    return storage.url(path)
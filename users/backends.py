@@ -0,0 +1,23 @@
+from django.contrib.auth import get_user_model
+from django.contrib.auth.backends import ModelBackend
+
+UserModel = get_user_model()
+
+
+class ProfileBackend(ModelBackend):
+    """
+    ModelBackend that loads the user's photographer and client profiles in
+    the same query as the user itself.
+
+    AuthenticationMiddleware runs this query once per request anyway, so the
+    profile behind every `request.user` comes for free (see users.profiles).
+    """
+
+    def get_user(self, user_id):
+        try:
+            user = UserModel._default_manager.select_related(
+                'photographerprofile', 'clientprofile'
+            ).get(pk=user_id)
+        except UserModel.DoesNotExist:
+            return None
+        return user if self.user_can_authenticate(user) else None
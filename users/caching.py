@@ -0,0 +1,152 @@
+"""
+Versioned cache keys for public pages and template fragments, and
+conditional GET (ETag / Last-Modified) for pages with a cheap validator.
+
+Every cached entry is keyed on the current version of the namespaces whose
+data it shows ('photos', 'photographers', 'news', 'favorites'). Changing a
+model bumps its namespace (see users.signals), which makes every key built
+on the old version unreachable at once; the stale entries just expire.
+"""
+import hashlib
+import time
+from calendar import timegm
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache, caches
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date, quote_etag
+
+NAMESPACES = ('photos', 'photographers', 'news', 'favorites')
+
+
+def _version_key(namespace):
+    return f"cache-version:{namespace}"
+
+
+def initial_version():
+    # A version lost with the cache starts again from the clock rather than
+    # 0, so it never repeats one handed out before: clients still hold ETags
+    # built on the old versions
+    return time.time_ns() // 1000
+
+
+def get_versions(*namespaces):
+    """Returns {namespace: version} for the given namespaces in one cache round trip."""
+    keys = {_version_key(namespace): namespace for namespace in namespaces}
+    found = cache.get_many(keys)
+    missing = [key for key in keys if key not in found]
+    if missing:
+        start = initial_version()
+        for key in missing:
+            cache.add(key, start, None)
+        found.update(cache.get_many(missing))
+    return {namespace: found.get(key, 0) for key, namespace in keys.items()}
+
+
+def bump_version(namespace):
+    key = _version_key(namespace)
+    # add() only succeeds if the key is missing, so an incr() race can't lose a bump
+    if not cache.add(key, initial_version(), None):
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, initial_version(), None)
+
+
+def versioned_key(prefix, namespaces, *parts):
+    versions = get_versions(*namespaces)
+    raw = '|'.join([*(f"{ns}={versions[ns]}" for ns in namespaces), *map(str, parts)])
+    return f"{prefix}:{hashlib.md5(raw.encode()).hexdigest()}"
+
+
+def cache_public_page(*namespaces, timeout=None):
+    """
+    Caches the responses of a view for anonymous visitors.
+
+    Only GET requests without pending flash messages are served from the
+    cache. Responses that set cookies or used a CSRF token are never stored,
+    since they carry per-visitor data.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if (request.method != 'GET' or request.user.is_authenticated
+                    or request.COOKIES.get('messages')):
+                return view(request, *args, **kwargs)
+
+            key = versioned_key(
+                f"page:{view.__name__}", namespaces,
+                request.get_full_path(), request.headers.get('x-requested-with', ''),
+            )
+            response = caches['pages'].get(key)
+            if response is not None:
+                return response
+
+            response = view(request, *args, **kwargs)
+            if (response.status_code == 200 and not response.cookies
+                    and not request.META.get('CSRF_COOKIE_NEEDS_UPDATE')):
+                if hasattr(response, 'render') and callable(response.render):
+                    response.render()
+                caches['pages'].set(key, response, timeout if timeout is not None else settings.PUBLIC_PAGE_CACHE_TTL)
+            return response
+        return wrapper
+    return decorator
+
+
+def _etag(request, last_modified, token):
+    session = getattr(request, 'session', None)
+    raw = '|'.join(map(str, (
+        request.user.pk, session and session.session_key, request.META.get('CSRF_COOKIE', ''),
+        last_modified, token,
+        request.get_full_path(), request.headers.get('x-requested-with', ''),
+    )))
+    return quote_etag(hashlib.md5(raw.encode()).hexdigest())
+
+
+def conditional_page(validator):
+    """
+    Answers GET/HEAD with 304 Not Modified when the client's copy is current,
+    without calling the view.
+
+    `validator(request, *args, **kwargs)` returns (last_modified, token)
+    computed from the data the page shows, where `token` catches changes the
+    timestamp can't, such as deletions. It may return None (e.g. for a missing
+    object) to always run the view. The ETag also covers the signed-in user,
+    the session and the CSRF secret, since the header and forms differ per
+    visitor: a copy from before a new login or a rotated CSRF token would
+    post a stale csrfmiddlewaretoken and fail with 403.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if request.method not in ('GET', 'HEAD') or request.COOKIES.get('messages'):
+                return view(request, *args, **kwargs)
+
+            validated = validator(request, *args, **kwargs)
+            if validated is None:
+                return view(request, *args, **kwargs)
+
+            last_modified, token = validated
+            timestamp = timegm(last_modified.utctimetuple()) if last_modified else None
+
+            response = get_conditional_response(request, etag=_etag(request, last_modified, token), last_modified=timestamp)
+            if response is None:
+                response = view(request, *args, **kwargs)
+                if response.status_code != 200:
+                    return response
+
+            # Computed again: rendering may have just issued the CSRF cookie
+            etag = _etag(request, last_modified, token)
+            response.headers['ETag'] = etag
+            if timestamp is not None:
+                response.headers['Last-Modified'] = http_date(timestamp)
+
+            # Always revalidate; signed-in pages must not sit in shared caches
+            if request.user.is_authenticated:
+                patch_cache_control(response, no_cache=True, private=True)
+            else:
+                patch_cache_control(response, no_cache=True)
+            return response
+        return wrapper
+    return decorator
@@ -0,0 +1,47 @@
+import bisect
+
+from .indexes import VersionedIndex
+from .models import PhotographerProfile, normalize_city
+
+INDEX_VERSION_KEY = 'city_index_version'
+
+
+def _load_index():
+    cities = {}
+    rows = (
+        PhotographerProfile.objects
+        .exclude(city_normalized='')
+        .values_list('city_normalized', 'city')
+        .order_by('city_normalized')
+    )
+    for normalized, city in rows:
+        cities.setdefault(normalized, ' '.join(city.split()))
+    return sorted(cities.items())
+
+
+# Sorted list of (normalized, display) city names shared by the whole process
+_index = VersionedIndex(INDEX_VERSION_KEY, _load_index)
+
+
+def invalidate_city_index():
+    _index.invalidate()
+
+
+def get_city_index():
+    return _index.get()
+
+
+def suggest_cities(query, limit=10):
+    """Returns up to `limit` city names starting with `query`, using a binary search."""
+    prefix = normalize_city(query)
+    if not prefix:
+        return []
+
+    index = get_city_index()
+    start = bisect.bisect_left(index, (prefix,))
+    suggestions = []
+    for normalized, city in index[start:]:
+        if not normalized.startswith(prefix) or len(suggestions) >= limit:
+            break
+        suggestions.append(city)
+    return suggestions
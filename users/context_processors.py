@@ -0,0 +1,16 @@
+from django.conf import settings
+from django.utils.functional import SimpleLazyObject
+
+from .caching import NAMESPACES, get_versions
+
+
+def cache_versions(request):
+    """
+    Exposes the cache namespace versions to templates for {% cache %} keys.
+    Lazy, so pages without cached fragments don't touch the cache.
+    """
+    return {
+        'cache_versions': SimpleLazyObject(lambda: get_versions(*NAMESPACES)),
+        'fragment_cache_ttl': settings.PUBLIC_PAGE_CACHE_TTL,
+    }
+
@@ -0,0 +1,89 @@
+"""
+Buffered profile view counter.
+
+photographer_detail only bumps an in-process counter; a background thread
+writes the accumulated increments every VIEW_COUNTER_FLUSH_INTERVAL seconds
+as atomic `views_count = views_count + n` updates, one UPDATE per distinct n.
+Profile GETs therefore never write to the database themselves. With
+VIEW_COUNTER_FLUSH_INTERVAL = 0 no thread is started and the views are only
+written by flush_views() calls and at exit.
+"""
+import atexit
+import logging
+import threading
+import time
+from collections import Counter, defaultdict
+
+from django.conf import settings
+from django.db import connections, transaction
+from django.db.models import F
+
+from .models import PhotographerProfile
+
+logger = logging.getLogger(__name__)
+
+_pending = Counter()
+_lock = threading.Lock()
+_flusher = None
+
+
+def record_view(photographer_id):
+    with _lock:
+        _pending[photographer_id] += 1
+    _ensure_flusher()
+
+
+def pending_views(photographer_id):
+    """Views recorded by this process that haven't been written yet."""
+    return _pending.get(photographer_id, 0)
+
+
+def discard_views():
+    """Forgets the views recorded by this process without writing them."""
+    with _lock:
+        _pending.clear()
+
+
+def flush_views():
+    global _pending
+    with _lock:
+        batch, _pending = _pending, Counter()
+    if not batch:
+        return
+
+    by_increment = defaultdict(list)
+    for photographer_id, count in batch.items():
+        by_increment[count].append(photographer_id)
+
+    try:
+        # One write transaction for the whole batch rather than one per UPDATE
+        with transaction.atomic():
+            for count, ids in by_increment.items():
+                PhotographerProfile.objects.filter(pk__in=ids).update(views_count=F('views_count') + count)
+    except Exception:
+        # Nothing was written; put the views back so the next flush retries them
+        logger.exception("Failed to flush profile views")
+        with _lock:
+            _pending.update(batch)
+
+
+def _flush_loop():
+    while True:
+        time.sleep(settings.VIEW_COUNTER_FLUSH_INTERVAL)
+        try:
+            flush_views()
+        finally:
+            connections.close_all()
+
+
+def _ensure_flusher():
+    global _flusher
+    if _flusher is not None or not settings.VIEW_COUNTER_FLUSH_INTERVAL:
+        return
+    with _lock:
+        if _flusher is None:
+            _flusher = threading.Thread(target=_flush_loop, name='view-counter', daemon=True)
+            _flusher.start()
+
+
+atexit.register(flush_views)
@@ -0,0 +1,52 @@
+import random
+
+from django.conf import settings
+from django.core.cache import cache
+
+from .models import Photo
+
+POOL_CACHE_KEY = 'featured_photo_pool'
+
+
+def get_featured_pool():
+    """Returns the cached list of candidate photo IDs, rebuilding it when stale."""
+    pool = cache.get(POOL_CACHE_KEY)
+    if pool is None:
+        pool = refresh_featured_pool()
+    return pool
+
+
+def refresh_featured_pool():
+    # The pool is bounded, so rebuilding it is cheap and only happens once per TTL
+    # instead of loading the whole Photo table on every homepage hit. The IDs
+    # come from the status index alone and are sampled here: ORDER BY RANDOM()
+    # would sort every ready photo.
+    pool_size = getattr(settings, 'FEATURED_POOL_SIZE', 300)
+    ids = list(Photo.objects.filter(status=Photo.STATUS_READY).values_list('id', flat=True))
+    pool = random.sample(ids, min(len(ids), pool_size))
+    cache.set(POOL_CACHE_KEY, pool, getattr(settings, 'FEATURED_POOL_TTL', 600))
+    return pool
+
+
+def forget_featured_photo(photo_id):
+    """Drops the pool if it holds `photo_id`, e.g. after the photo was deleted."""
+    pool = cache.get(POOL_CACHE_KEY)
+    if pool is not None and photo_id in pool:
+        cache.delete(POOL_CACHE_KEY)
+
+
+def get_featured_photos(count=6):
+    pool = get_featured_pool()
+    # A few spares stand in for photos that stopped being ready since the
+    # pool was built
+    ids = random.sample(pool, min(len(pool), count * 2))
+    if not ids:
+        return []
+
+    # Single primary-key lookup; photographer and user are joined up front
+    # so the template doesn't query them per photo.
+    photos = list(
+        Photo.objects.filter(id__in=ids, status=Photo.STATUS_READY).select_related('photographer__user')
+    )
+    random.shuffle(photos)
+    return photos[:count]
@@ -0,0 +1,105 @@
+from PIL import Image
+from django.core.files.uploadedfile import UploadedFile
+import logging
+import os
+import tempfile
+import threading
+
+from .metrics import image_timer
+
+logger = logging.getLogger(__name__)
+
+# Uploads bigger than this are rejected before decoding (about a 100 MP camera)
+MAX_IMAGE_PIXELS = 100_000_000
+# Bytes of decoded pixel data allowed in flight per process; concurrent
+# compressions wait for each other instead of pushing the worker into OOM
+DECODE_MEMORY_BUDGET = 512 * 1024 * 1024
+# Compressed output stays in memory up to this size, then spills to a temp file
+SPOOL_MAX_SIZE = 2 * 1024 * 1024
+
+
+class _MemoryBudget:
+    def __init__(self, limit):
+        self.limit = limit
+        self.in_use = 0
+        self.condition = threading.Condition()
+
+    def acquire(self, amount):
+        # Anything larger than the whole budget still runs, just on its own
+        amount = min(amount, self.limit)
+        with self.condition:
+            self.condition.wait_for(lambda: self.in_use + amount <= self.limit)
+            self.in_use += amount
+        return amount
+
+    def release(self, amount):
+        with self.condition:
+            self.in_use -= amount
+            self.condition.notify_all()
+
+
+_decode_budget = _MemoryBudget(DECODE_MEMORY_BUDGET)
+
+def encode_jpeg(source, output, quality=70, max_width=1920):
+    img = Image.open(source)
+    if img.width * img.height > MAX_IMAGE_PIXELS:
+        raise ValueError(f"Image is too large: {img.width}x{img.height}")
+
+    # Resize if width > max_width
+    if img.width > max_width:
+        output_size = (max_width, int(img.height * (max_width / img.width)))
+        # For JPEGs, let libjpeg decode straight at 1/2, 1/4 or 1/8 scale
+        # (DCT scaling) instead of decoding every pixel of the full frame
+        img.draft('RGB', output_size)
+    else:
+        output_size = None
+
+    # The decoded frame plus a converted/resized copy of it
+    cost = _decode_budget.acquire(img.width * img.height * len(img.getbands()) * 2)
+    try:
+        if img.mode in ('RGBA', 'LA', 'PA') or 'transparency' in img.info:
+            # JPEG has no alpha: flatten onto white instead of the black
+            # that convert('RGB') would leave behind transparent pixels
+            rgba = img.convert('RGBA')
+            img = Image.new('RGB', rgba.size, 'white')
+            img.paste(rgba, mask=rgba.getchannel('A'))
+        elif img.mode != 'RGB':
+            img = img.convert('RGB')
+        if output_size:
+            img.thumbnail(output_size)
+        img.save(output, format='JPEG', quality=quality)
+    finally:
+        img.close()
+        _decode_budget.release(cost)
+
+def compress_image(image_field, quality=70, max_width=1920):
+    if not image_field:
+        return image_field
+
+    output = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_SIZE)
+    try:
+        with image_timer('compress_image'):
+            encode_jpeg(image_field, output, quality=quality, max_width=max_width)
+        size = output.tell()
+        output.seek(0)
+
+        return UploadedFile(
+            output,
+            f"{image_field.name.split('.')[0]}.jpg",
+            'image/jpeg',
+            size,
+        )
+    except Exception:
+        output.close()
+        logger.exception("Failed to compress image %s", image_field.name)
+        return image_field
+
+def compress_to_path(source_path, target_path, quality=70, max_width=1920):
+    """
+    Compresses the image at `source_path` into a JPEG at `target_path` and
+    returns its size in bytes. Only touches the filesystem and Pillow, so it
+    can run in a worker process.
+    """
+    with open(target_path, 'wb') as output:
+        encode_jpeg(source_path, output, quality=quality, max_width=max_width)
+    return os.path.getsize(target_path)
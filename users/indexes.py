@@ -0,0 +1,39 @@
+"""
+In-process indexes kept in sync across worker processes.
+
+A VersionedIndex is a structure built from the database and held by every
+process (the city autocomplete list, the search index without FTS5).
+Changes bump its version in the shared cache; each process notices the new
+version on its next lookup and rebuilds its copy.
+"""
+import threading
+
+from django.core.cache import cache
+
+from .caching import initial_version
+
+
+class VersionedIndex:
+    def __init__(self, version_key, build):
+        self.version_key = version_key
+        self.build = build
+        self._index = None
+        self._version = None
+        self._lock = threading.Lock()
+
+    def invalidate(self):
+        try:
+            cache.incr(self.version_key)
+        except ValueError:
+            # Not in the cache (yet or any more)
+            cache.set(self.version_key, initial_version(), None)
+
+    def get(self):
+        version = cache.get_or_set(self.version_key, initial_version, None)
+        if version != self._version:
+            # One build per version even if several threads notice it at once
+            with self._lock:
+                if version != self._version:
+                    self._index = self.build()
+                    self._version = version
+        return self._index
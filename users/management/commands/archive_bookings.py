@@ -0,0 +1,40 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from users.models import ArchivedBooking, BookingRequest
+
+ARCHIVED_FIELDS = [
+    'id', 'client_id', 'photographer_id', 'status', 'message', 'contact_phone',
+    'created_at', 'updated_at', 'is_deleted_by_client', 'is_deleted_by_photographer',
+]
+
+
+class Command(BaseCommand):
+    help = "Moves old completed bookings out of the booking table into the archive."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=settings.BOOKING_ARCHIVE_DAYS,
+                            help="Archive completed bookings created more than this many days ago.")
+        parser.add_argument('--batch', type=int, default=500, help="Bookings to move per transaction.")
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - timedelta(days=options['days'])
+        old = BookingRequest.objects.filter(status='completed', created_at__lt=cutoff)
+
+        moved = 0
+        while True:
+            # Each chunk is copied and deleted atomically, so a booking is
+            # always in exactly one of the two tables
+            with transaction.atomic():
+                rows = list(old.order_by('id').values(*ARCHIVED_FIELDS)[:options['batch']])
+                if not rows:
+                    break
+                ArchivedBooking.objects.bulk_create(ArchivedBooking(**row) for row in rows)
+                BookingRequest.objects.filter(id__in=[row['id'] for row in rows]).delete()
+            moved += len(rows)
+
+        self.stdout.write(f"Archived {moved} booking(s)")
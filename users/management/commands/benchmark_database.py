@@ -0,0 +1,139 @@
+import os
+import shutil
+import sqlite3
+import tempfile
+import threading
+import time
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import OperationalError, connections, transaction
+from django.db.models import F
+
+from users.models import Favorite, Photo, PhotographerProfile
+
+# Django's defaults. The journal mode is reset explicitly because a copy of a
+# database that has run with the production profile is still in WAL mode.
+DEFAULT_PROFILE = {'OPTIONS': {'init_command': 'PRAGMA journal_mode=DELETE'}, 'CONN_MAX_AGE': 0, 'CONN_HEALTH_CHECKS': False}
+
+
+class Command(BaseCommand):
+    help = (
+        "Compares read throughput of the default and the production SQLite "
+        "profiles while other threads write, on a copy of the database."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--readers', type=int, default=4, help="Threads running page queries.")
+        parser.add_argument('--writers', type=int, default=2, help="Threads toggling favorites and counting views.")
+        parser.add_argument('--seconds', type=float, default=5.0, help="How long each profile runs.")
+
+    def handle(self, *args, **options):
+        source = settings.DATABASES['default']
+        if source['ENGINE'] != 'django.db.backends.sqlite3':
+            raise CommandError("benchmark_database only works with SQLite.")
+
+        workdir = tempfile.mkdtemp(prefix='db-bench-')
+        try:
+            results = {}
+            for label, profile in [('default', DEFAULT_PROFILE), ('production', settings.SQLITE_PRODUCTION_PROFILE)]:
+                path = os.path.join(workdir, f'{label}.sqlite3')
+                # The backup API gives a consistent copy even if the site is running
+                with sqlite3.connect(source['NAME']) as src, sqlite3.connect(path) as dst:
+                    src.backup(dst)
+                results[label] = self.run_profile(label, path, profile, options)
+
+            self.stdout.write(f"Readers: {options['readers']}, writers: {options['writers']}, {options['seconds']:.0f}s per profile")
+            self.stdout.write(f"{'profile':<12}{'reads/s':>10}{'writes/s':>10}{'locked':>8}{'p95 read ms':>13}")
+            for label, (reads, writes, locked, p95) in results.items():
+                self.stdout.write(f"{label:<12}{reads:>10.0f}{writes:>10.0f}{locked:>8}{p95:>13.1f}")
+        finally:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    def run_profile(self, label, path, profile, options):
+        alias = f'benchmark_{label}'
+        connections.settings[alias] = {**connections['default'].settings_dict, **profile, 'NAME': path}
+        try:
+            photographer_id, user_ids = self.prepare(alias, options['writers'])
+
+            deadline = time.monotonic() + options['seconds']
+            stats = {'reads': 0, 'writes': 0, 'locked': 0, 'latencies': []}
+            lock = threading.Lock()
+            threads = [
+                threading.Thread(target=self.reader, args=(alias, deadline, stats, lock))
+                for _ in range(options['readers'])
+            ] + [
+                threading.Thread(target=self.writer, args=(alias, deadline, stats, lock, photographer_id, user_id))
+                for user_id in user_ids
+            ]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        finally:
+            del connections.settings[alias]
+
+        latencies = sorted(stats['latencies']) or [0]
+        p95 = latencies[int((len(latencies) - 1) * 0.95)] * 1000
+        seconds = options['seconds']
+        return stats['reads'] / seconds, stats['writes'] / seconds, stats['locked'], p95
+
+    def prepare(self, alias, writers):
+        """Makes sure the copy has a photographer and one client per writer thread."""
+        photographer = PhotographerProfile.objects.using(alias).first()
+        if photographer is None:
+            owner = User.objects.db_manager(alias).create(username='benchmark-photographer')
+            photographer = PhotographerProfile.objects.using(alias).create(user=owner, short_intro='', bio='')
+        user_ids = []
+        for i in range(writers):
+            user, _ = User.objects.db_manager(alias).get_or_create(username=f'benchmark-client-{i}')
+            user_ids.append(user.pk)
+        connections[alias].close()
+        return photographer.pk, user_ids
+
+    def reader(self, alias, deadline, stats, lock):
+        reads, locked, latencies = 0, 0, []
+        try:
+            while time.monotonic() < deadline:
+                start = time.perf_counter()
+                try:
+                    # Roughly what the gallery and specialists pages ask for
+                    list(Photo.objects.using(alias).filter(status=Photo.STATUS_READY).order_by('-uploaded_at')[:24])
+                    list(PhotographerProfile.objects.using(alias).select_related('user').order_by('-views_count')[:12])
+                    PhotographerProfile.objects.using(alias).count()
+                    reads += 1
+                    latencies.append(time.perf_counter() - start)
+                except OperationalError:
+                    locked += 1
+                # What request_finished does: close unless CONN_MAX_AGE keeps it
+                connections[alias].close_if_unusable_or_obsolete()
+        finally:
+            connections[alias].close()
+        with lock:
+            stats['reads'] += reads
+            stats['locked'] += locked
+            stats['latencies'].extend(latencies)
+
+    def writer(self, alias, deadline, stats, lock, photographer_id, user_id):
+        writes, locked = 0, 0
+        try:
+            while time.monotonic() < deadline:
+                try:
+                    # Same shape as toggle_favorite: read, then write, in one transaction
+                    with transaction.atomic(using=alias):
+                        favorites = Favorite.objects.using(alias).filter(user_id=user_id, photographer_id=photographer_id)
+                        if favorites.exists():
+                            favorites.delete()
+                        else:
+                            Favorite.objects.using(alias).create(user_id=user_id, photographer_id=photographer_id)
+                        PhotographerProfile.objects.using(alias).filter(pk=photographer_id).update(views_count=F('views_count') + 1)
+                    writes += 1
+                except OperationalError:
+                    locked += 1
+                connections[alias].close_if_unusable_or_obsolete()
+        finally:
+            connections[alias].close()
+        with lock:
+            stats['writes'] += writes
+            stats['locked'] += locked
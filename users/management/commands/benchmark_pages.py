@@ -0,0 +1,297 @@
+import json
+import statistics
+import tempfile
+import threading
+import time
+import tracemalloc
+import urllib.request
+from io import StringIO
+from itertools import cycle
+from pathlib import Path
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import caches
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.core.servers.basehttp import ThreadedWSGIServer, WSGIRequestHandler
+from django.core.wsgi import get_wsgi_application
+from django.db import connection
+from django.db.models import Count
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.urls import reverse
+
+from users.counters import flush_views
+from users.models import PhotographerProfile
+
+# Filter combinations the specialists scenarios cycle through
+SPECIALISTS_FILTERS = [
+    {},
+    {'specialization': 'wedding'},
+    {'city': 'Москва', 'sort': 'views'},
+    {'price_min': 2000, 'price_max': 8000, 'sort': 'price'},
+    {'language': 'en', 'specialization': 'portrait'},
+    {'page': 3},
+]
+# Latency regressions smaller than this (ms) are treated as noise
+LATENCY_FLOOR_MS = 5.0
+
+
+class QuietHandler(WSGIRequestHandler):
+    def log_message(self, *args):
+        pass
+
+
+class Command(BaseCommand):
+    help = (
+        "Seeds a throwaway database and measures the public pages and the dashboard "
+        "through the test client and a local WSGI server. Compares the query counts with "
+        "the stored baseline, and latencies and memory with a timings baseline of the same "
+        "machine if one is given, and fails on regressions."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--photographers', type=int, default=2000)
+        parser.add_argument('--photos', type=int, default=10, help="Photos per photographer.")
+        parser.add_argument('--clients', type=int, default=1000)
+        parser.add_argument('--bookings', type=int, default=10000)
+        parser.add_argument('--news', type=int, default=200)
+        parser.add_argument('--requests', type=int, default=50, help="Measured requests per scenario.")
+        parser.add_argument('--warmup', type=int, default=5, help="Unmeasured requests per scenario first.")
+        parser.add_argument('--concurrency', type=int, default=4, help="Client threads against the WSGI server.")
+        parser.add_argument('--cold', action='store_true', help="Clear the cache before every request.")
+        parser.add_argument(
+            '--baseline', default=str(Path(settings.BASE_DIR, 'benchmarks', 'pages.json')),
+            help="Query counts per scenario. They don't depend on the machine, so this one is committed.",
+        )
+        parser.add_argument(
+            '--timings-baseline',
+            help="Latencies and peak memory per scenario. Only comparable on the machine that recorded "
+                 "them, so they are kept apart and only checked when this is given.",
+        )
+        parser.add_argument('--save-baseline', action='store_true', help="Store this run as the new baseline(s).")
+        parser.add_argument('--latency-tolerance', type=float, default=0.25, help="Allowed p95 slowdown, as a fraction.")
+        parser.add_argument('--memory-tolerance', type=float, default=0.25, help="Allowed peak memory growth, as a fraction.")
+
+    def handle(self, *args, **options):
+        self.options = options
+        workdir = tempfile.mkdtemp(prefix='page-bench-')
+        # A private cache and media directory, so nothing leaks into the real site;
+        # DEBUG off so connection.queries doesn't grow for the whole run
+        overrides = override_settings(
+            DEBUG=False,
+            ALLOWED_HOSTS=['testserver', '127.0.0.1'],
+            MEDIA_ROOT=workdir,
+            IMAGE_WORKERS=0,
+            CACHES={
+                'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'page-bench'},
+                'pages': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'page-bench-pages'},
+            },
+        )
+        test_settings = connection.settings_dict.setdefault('TEST', {})
+        old_test_name = test_settings.get('NAME')
+        # A file rather than SQLite's in-memory test database, to measure real I/O
+        test_settings['NAME'] = str(Path(workdir, 'benchmark.sqlite3'))
+        with overrides:
+            old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+            try:
+                self.seed()
+                scenarios = self.scenarios()
+                results = self.run_client(scenarios)
+                results_wsgi = self.run_wsgi(scenarios)
+            finally:
+                # Pending profile views would otherwise be written to the real database at exit
+                flush_views()
+                connection.creation.destroy_test_db(old_name, verbosity=0)
+                test_settings['NAME'] = old_test_name
+
+        for name, stats in results_wsgi.items():
+            results[name]['wsgi_p95_ms'] = stats['p95_ms']
+        self.report(results, results_wsgi)
+
+        queries = {name: {'queries': r['queries']} for name, r in results.items()}
+        timings = {name: {key: value for key, value in r.items() if key != 'queries'} for name, r in results.items()}
+        baselines = [(Path(options['baseline']), queries)]
+        if options['timings_baseline']:
+            baselines.append((Path(options['timings_baseline']), timings))
+
+        if options['save_baseline']:
+            for path, data in baselines:
+                path.parent.mkdir(parents=True, exist_ok=True)
+                path.write_text(json.dumps(data, indent=2, sort_keys=True) + '\n')
+                self.stdout.write(f"Baseline saved to {path}")
+            return
+
+        regressions = []
+        for path, data in baselines:
+            if path.exists():
+                regressions += self.compare(data, json.loads(path.read_text()))
+            else:
+                self.stdout.write(f"No baseline at {path}; run with --save-baseline to store one")
+        if regressions:
+            for regression in regressions:
+                self.stderr.write(f"REGRESSION {regression}")
+            raise CommandError(f"{len(regressions)} regression(s) against the baseline")
+        self.stdout.write("No regressions against the baseline")
+
+    def seed(self):
+        start = time.perf_counter()
+        call_command(
+            'seed_content',
+            photographers=self.options['photographers'], photos=self.options['photos'],
+            clients=self.options['clients'], bookings=self.options['bookings'], news=self.options['news'],
+            stdout=self.stdout if self.options['verbosity'] > 1 else StringIO(),
+        )
+        self.stdout.write(f"Seeded in {time.perf_counter() - start:.1f}s")
+
+    def scenarios(self):
+        """Returns {name: (user or None, [(path, headers), ...])}; requests cycle through the list."""
+        xhr = {'x-requested-with': 'XMLHttpRequest'}
+        specialists = reverse('specialists')
+        # The busiest accounts: the dashboard cost grows with bookings
+        photographer = PhotographerProfile.objects.annotate(bookings=Count('bookings_received')).order_by('-bookings').first()
+        client = User.objects.annotate(bookings=Count('bookings_made')).order_by('-bookings').first()
+        profiles = list(PhotographerProfile.objects.order_by('pk').values_list('pk', flat=True)[:20])
+        return {
+            'home': (None, [(reverse('home'), {})]),
+            'specialists': (None, [(f"{specialists}?{urlencode(f)}", {}) for f in SPECIALISTS_FILTERS]),
+            'specialists_xhr': (None, [(f"{specialists}?{urlencode(f)}", xhr) for f in SPECIALISTS_FILTERS]),
+            'photographer_detail': (None, [(reverse('photographer_detail', args=[pk]), {}) for pk in profiles]),
+            'gallery': (None, [(reverse('gallery'), {})]),
+            'news': (None, [(reverse('news'), {})]),
+            'dashboard_photographer': (photographer.user, [(reverse('dashboard'), {})]),
+            'dashboard_client': (client, [(reverse('dashboard'), {})]),
+        }
+
+    def run_client(self, scenarios):
+        """Latency, queries and peak memory of every scenario through the test client."""
+        results = {}
+        for name, (user, requests) in scenarios.items():
+            client = Client()
+            if user is not None:
+                client.force_login(user)
+            targets = cycle(requests)
+            for _ in range(self.options['warmup']):
+                self.get(client, *next(targets))
+
+            latencies, queries = [], []
+            for _ in range(self.options['requests']):
+                if self.options['cold']:
+                    self.clear_caches()
+                with CaptureQueriesContext(connection) as captured:
+                    start = time.perf_counter()
+                    self.get(client, *next(targets))
+                    latencies.append((time.perf_counter() - start) * 1000)
+                queries.append(len(captured))
+
+            # Measured separately: tracing allocations slows requests down a lot
+            if self.options['cold']:
+                self.clear_caches()
+            tracemalloc.start()
+            try:
+                self.get(client, *next(targets))
+                peak = tracemalloc.get_traced_memory()[1]
+            finally:
+                tracemalloc.stop()
+
+            results[name] = {
+                **self.percentiles(latencies),
+                'queries': max(queries),
+                'peak_kib': round(peak / 1024),
+            }
+        return results
+
+    def clear_caches(self):
+        for backend in caches.all():
+            backend.clear()
+
+    def get(self, client, path, headers):
+        response = client.get(path, headers=headers)
+        if response.status_code != 200:
+            raise CommandError(f"GET {path} returned {response.status_code}")
+
+    def run_wsgi(self, scenarios):
+        """Latency of every scenario from concurrent clients against a local WSGI server."""
+        server = ThreadedWSGIServer(('127.0.0.1', 0), QuietHandler, allow_reuse_address=False)
+        server.set_app(get_wsgi_application())
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        base = f"http://127.0.0.1:{server.server_port}"
+        try:
+            results = {}
+            for name, (user, requests) in scenarios.items():
+                cookie = self.session_cookie(user)
+                urls = [(base + path, {**headers, **cookie}) for path, headers in requests]
+                latencies = []
+                lock = threading.Lock()
+
+                def worker(offset):
+                    own = []
+                    for i in range(self.options['requests']):
+                        url, headers = urls[(offset + i) % len(urls)]
+                        start = time.perf_counter()
+                        with urllib.request.urlopen(urllib.request.Request(url, headers=headers)) as response:
+                            response.read()
+                        own.append((time.perf_counter() - start) * 1000)
+                    with lock:
+                        latencies.extend(own)
+
+                start = time.perf_counter()
+                workers = [threading.Thread(target=worker, args=(i,)) for i in range(self.options['concurrency'])]
+                for w in workers:
+                    w.start()
+                for w in workers:
+                    w.join()
+                elapsed = time.perf_counter() - start
+                results[name] = {**self.percentiles(latencies), 'rps': round(len(latencies) / elapsed, 1)}
+            return results
+        finally:
+            server.shutdown()
+            server.server_close()
+
+    def session_cookie(self, user):
+        if user is None:
+            return {}
+        client = Client()
+        client.force_login(user)
+        return {'Cookie': f"{settings.SESSION_COOKIE_NAME}={client.cookies[settings.SESSION_COOKIE_NAME].value}"}
+
+    def percentiles(self, latencies):
+        cuts = statistics.quantiles(latencies, n=100, method='inclusive')
+        return {
+            'p50_ms': round(cuts[49], 2),
+            'p95_ms': round(cuts[94], 2),
+            'p99_ms': round(cuts[98], 2),
+        }
+
+    def report(self, results, results_wsgi):
+        self.stdout.write(f"\nTest client ({self.options['requests']} requests per scenario{', cold cache' if self.options['cold'] else ''}):")
+        self.stdout.write(f"{'scenario':<24}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'queries':>9}{'peak KiB':>10}")
+        for name, r in results.items():
+            self.stdout.write(f"{name:<24}{r['p50_ms']:>9.1f}{r['p95_ms']:>9.1f}{r['p99_ms']:>9.1f}{r['queries']:>9}{r['peak_kib']:>10}")
+
+        self.stdout.write(f"\nWSGI server ({self.options['concurrency']} concurrent clients):")
+        self.stdout.write(f"{'scenario':<24}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'req/s':>9}")
+        for name, r in results_wsgi.items():
+            self.stdout.write(f"{name:<24}{r['p50_ms']:>9.1f}{r['p95_ms']:>9.1f}{r['p99_ms']:>9.1f}{r['rps']:>9.1f}")
+
+    def compare(self, results, baseline):
+        """Returns the regressions of `results` against `baseline`, for the keys the baseline has."""
+        regressions = []
+        latency_limit = 1 + self.options['latency_tolerance']
+        memory_limit = 1 + self.options['memory_tolerance']
+        for name, base in baseline.items():
+            current = results.get(name)
+            if current is None:
+                continue
+            # Query counts don't depend on the machine, so any increase is a regression
+            if 'queries' in base and current['queries'] > base['queries']:
+                regressions.append(f"{name}: {current['queries']} queries (baseline {base['queries']})")
+            for key in ('p95_ms', 'wsgi_p95_ms'):
+                if key in base and current[key] > base[key] * latency_limit and current[key] - base[key] > LATENCY_FLOOR_MS:
+                    regressions.append(f"{name}: {key} {current[key]:.1f} (baseline {base[key]:.1f})")
+            if 'peak_kib' in base and current['peak_kib'] > base['peak_kib'] * memory_limit:
+                regressions.append(f"{name}: peak {current['peak_kib']} KiB (baseline {base['peak_kib']} KiB)")
+        return regressions
@@ -0,0 +1,62 @@
+import os
+import shutil
+import tempfile
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from PIL import Image
+
+from users.images import compress_to_path
+from users.models import Photo
+from users.tasks import compress_batch
+
+
+class Command(BaseCommand):
+    help = "Compares serial and process-pool compression of a batch of synthetic uploads."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--count', type=int, default=50, help="Images in the batch.")
+        parser.add_argument('--width', type=int, default=4000)
+        parser.add_argument('--height', type=int, default=3000)
+
+    def handle(self, *args, **options):
+        workdir = tempfile.mkdtemp(prefix='upload-bench-')
+        try:
+            jobs = self.make_jobs(workdir, options['count'], options['width'], options['height'])
+
+            start = time.perf_counter()
+            for job in jobs:
+                compress_to_path(*job)
+            serial = time.perf_counter() - start
+
+            # Warm the pool up first so process start-up isn't counted
+            compress_batch(jobs[:2])
+            start = time.perf_counter()
+            results = compress_batch(jobs)
+            parallel = time.perf_counter() - start
+
+            errors = [r for r in results if isinstance(r, Exception)]
+            if errors:
+                self.stderr.write(f"{len(errors)} job(s) failed: {errors[0]}")
+
+            self.stdout.write(f"Images:    {len(jobs)} x {options['width']}x{options['height']}")
+            self.stdout.write(f"Processes: {settings.IMAGE_PROCESSES}")
+            self.stdout.write(f"Serial:    {serial:.2f}s")
+            self.stdout.write(f"Parallel:  {parallel:.2f}s")
+            self.stdout.write(f"Speedup:   {serial / parallel:.2f}x")
+        finally:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    def make_jobs(self, workdir, count, width, height):
+        source = os.path.join(workdir, 'source.png')
+        # A gradient rather than a flat colour so the encoder has real work to do
+        gradient = Image.linear_gradient('L').resize((width, height))
+        Image.merge('RGB', (gradient, gradient.transpose(Image.Transpose.ROTATE_180), gradient)).save(source)
+
+        jobs = []
+        for i in range(count):
+            path = os.path.join(workdir, f'upload_{i}.png')
+            shutil.copyfile(source, path)
+            jobs.append((path, os.path.join(workdir, f'upload_{i}.jpg'), Photo.IMAGE_QUALITY, Photo.IMAGE_MAX_WIDTH))
+        return jobs
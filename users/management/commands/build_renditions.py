@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+
+from users.models import ClientProfile, News, Photo, PhotographerProfile
+from users.renditions import build_renditions
+
+
+class Command(BaseCommand):
+    help = "Generates missing renditions for every stored photo, profile and news image."
+
+    def handle(self, *args, **options):
+        names = set(Photo.objects.filter(status=Photo.STATUS_READY).values_list('image', flat=True))
+        for model in (PhotographerProfile, ClientProfile):
+            names.update(model.objects.exclude(profile_image='').exclude(profile_image=None).values_list('profile_image', flat=True))
+        names.update(News.objects.exclude(image='').values_list('image', flat=True))
+
+        failed = 0
+        for name in sorted(names):
+            try:
+                build_renditions(name)
+            except Exception as e:
+                failed += 1
+                self.stderr.write(f"{name}: {e}")
+
+        self.stdout.write(f"Built renditions for {len(names) - failed} image(s), {failed} failed")
@@ -0,0 +1,24 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from users.tasks import process_pending_photos
+
+
+class Command(BaseCommand):
+    help = "Compresses uploaded photos that are still waiting in the processing queue."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help="Drain the queue and exit instead of polling.")
+        parser.add_argument('--interval', type=float, default=5, help="Seconds to sleep when the queue is empty.")
+        parser.add_argument('--batch', type=int, default=50, help="Photos to pick up per batch.")
+
+    def handle(self, *args, **options):
+        while True:
+            processed = process_pending_photos(limit=options['batch'])
+            if processed:
+                self.stdout.write(f"Processed {processed} photo(s)")
+                continue
+            if options['once']:
+                break
+            time.sleep(options['interval'])
@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+
+from users.search import fts_enabled, rebuild_index
+
+
+class Command(BaseCommand):
+    help = "Rebuilds the full-text search index, e.g. after loading data with signals off."
+
+    def handle(self, *args, **options):
+        count = rebuild_index()
+        backend = 'FTS5' if fts_enabled() else 'in-process index'
+        self.stdout.write(f"Indexed {count} document(s) ({backend})")
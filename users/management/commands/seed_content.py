@@ -0,0 +1,335 @@
+import os
+import random
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+from itertools import islice
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.files.base import ContentFile
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Count
+from PIL import Image
+
+from users.caching import NAMESPACES, bump_version
+from users.cities import invalidate_city_index
+from users.images import encode_jpeg
+from users.models import BookingRequest, ClientProfile, News, Photo, PhotographerProfile, normalize_city
+from users.renditions import build_renditions
+from users.search import rebuild_index
+from users.storage import get_upload_storage
+
+try:
+    import requests
+    from requests.adapters import HTTPAdapter
+except ImportError:  # optional: only needed to fetch images with --urls
+    requests = None
+
+IMAGE_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.webp'}
+FETCH_TIMEOUT = (5, 30)  # connect, read (seconds)
+
+FIRST_NAMES = ['Александр', 'Мария', 'Дмитрий', 'Анна', 'Иван', 'Елена', 'Сергей', 'Ольга', 'Михаил', 'Наталья', 'Алексей', 'Юлия']
+LAST_NAMES = ['Смирнов', 'Иванова', 'Кузнецов', 'Попова', 'Соколов', 'Лебедева', 'Козлов', 'Новикова', 'Морозов', 'Волкова']
+CITIES = ['Москва', 'Санкт-Петербург', 'Казань', 'Новосибирск', 'Екатеринбург', 'Сочи', 'Калининград', 'Нижний Новгород', 'Самара', 'Владивосток']
+INTROS = [
+    'Профессиональный свадебный фотограф', 'Художественная портретная съемка', 'Пейзажная и travel-фотография',
+    'Репортажная съемка мероприятий', 'Fashion и предметная съемка', 'Семейные и детские фотосессии',
+]
+BIO_SENTENCES = [
+    'Снимаю больше десяти лет.', 'Работаю со светом и естественными эмоциями.', 'Люблю живые кадры без постановки.',
+    'Выезжаю в любой город.', 'Обработка и готовые фотографии за две недели.', 'Есть своя студия в центре города.',
+    'Снимаю на среднеформатную камеру.', 'Помогу с выбором локации и образа.',
+]
+NEWS_TOPICS = ['Выставка', 'Мастер-класс', 'Фотоконкурс', 'Обзор техники', 'Интервью', 'Фестиваль']
+NEWS_SUBJECTS = ['городской пейзаж', 'портретная съемка', 'свадебная фотография', 'природа родного края', 'уличная фотография']
+
+
+def _chunks(rows, size):
+    rows = iter(rows)
+    while chunk := list(islice(rows, size)):
+        yield chunk
+
+
+def _rng(seed, *key):
+    # One generator per row: the same row always gets the same data, however
+    # many rows were created before it or in which run
+    return random.Random('-'.join(map(str, (seed, *key))))
+
+
+class Command(BaseCommand):
+    help = (
+        "Fills the database with generated photographers, clients, photos, bookings and news "
+        "for performance testing. Only missing rows are added, so it can be run again to top up."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--photographers', type=int, default=1000)
+        parser.add_argument('--photos', type=int, default=10, help="Photos per photographer.")
+        parser.add_argument('--clients', type=int, default=1000)
+        parser.add_argument('--bookings', type=int, default=5000)
+        parser.add_argument('--news', type=int, default=200)
+        parser.add_argument('--images', help="Directory of local images to use. Synthetic images are generated without it.")
+        parser.add_argument('--urls', help="File with image URLs, one per line, to download instead (e.g. users/fixtures/seed_image_urls.txt).")
+        parser.add_argument('--fetch-workers', type=int, default=8, help="Concurrent downloads for --urls.")
+        parser.add_argument('--batch', type=int, default=1000, help="Rows per INSERT.")
+        parser.add_argument('--prefix', default='seed', help="Username prefix of the generated accounts.")
+        parser.add_argument('--seed', type=int, default=0, help="Random seed; the same seed gives the same data.")
+
+    def handle(self, *args, **options):
+        self.options = options
+        self.storage = get_upload_storage()
+        self.password = make_password('password123')  # hashed once: hashing per user would take minutes
+
+        sources = self.load_sources()
+        if not sources:
+            raise CommandError("No usable images found.")
+        self.stdout.write(f"Using {len(sources)} source image(s)")
+
+        # Every source is compressed and stored once per upload directory;
+        # all rows share those files (see ContentAddressedStorage)
+        photo_names = self.store_images(sources, 'photographs/seed.jpg', Photo)
+        avatar_names = self.store_images(sources, 'profile_images/seed.jpg', PhotographerProfile)
+        news_names = self.store_images(sources, 'news_images/seed.jpg', Photo)
+        used = Counter()
+
+        self.create_users('photographer')
+        self.create_users('client')
+        self.report('photographers', self.create_photographers(avatar_names, used))
+        self.report('clients', self.create_clients())
+        self.report('photos', self.create_photos(photo_names, used))
+        self.report('bookings', self.create_bookings())
+        self.report('news', self.create_news(news_names, used))
+
+        # Take one reference per row using a file, then drop the one store_images()
+        # held, which removes the files no row ended up using
+        for name in dict.fromkeys(photo_names + avatar_names + news_names):
+            if used[name]:
+                self.storage.add_reference(name, used[name])
+                build_renditions(name)
+            self.storage.delete(name)
+
+        # bulk_create() sends no signals: refresh everything they would have
+        for namespace in NAMESPACES:
+            bump_version(namespace)
+        invalidate_city_index()
+        self.stdout.write(f"Search index: {rebuild_index()} document(s)")
+
+    def report(self, label, count):
+        self.stdout.write(f"Created {count} {label}")
+
+    # Images
+
+    def load_sources(self):
+        if self.options['urls']:
+            return self.fetch(self.options['urls'])
+        if self.options['images']:
+            directory = self.options['images']
+            paths = sorted(
+                os.path.join(directory, name) for name in os.listdir(directory)
+                if os.path.splitext(name)[1].lower() in IMAGE_EXTENSIONS
+            )
+            sources = []
+            for path in paths:
+                with open(path, 'rb') as f:
+                    sources.append(f.read())
+            return sources
+        return [self.synthetic_image(i) for i in range(12)]
+
+    def synthetic_image(self, i):
+        # A coloured gradient per image, so every one has different bytes
+        rng = _rng(self.options['seed'], 'image', i)
+        gradient = Image.linear_gradient('L').resize((1600, 1067))
+        tint = Image.new('L', gradient.size, rng.randrange(256))
+        channels = [gradient, tint, gradient.transpose(Image.Transpose.ROTATE_180)]
+        rng.shuffle(channels)
+        output = BytesIO()
+        Image.merge('RGB', channels).save(output, format='PNG')
+        return output.getvalue()
+
+    def fetch(self, path):
+        if requests is None:
+            raise CommandError("--urls needs the requests package.")
+        with open(path) as f:
+            urls = list(dict.fromkeys(line.strip() for line in f if line.strip()))
+
+        workers = max(1, self.options['fetch_workers'])
+        # One session, so connections to the same host are kept alive and reused
+        session = requests.Session()
+        session.mount('https://', HTTPAdapter(pool_connections=workers, pool_maxsize=workers, max_retries=2))
+        session.mount('http://', HTTPAdapter(pool_connections=workers, pool_maxsize=workers, max_retries=2))
+
+        def download(url):
+            try:
+                with session.get(url, timeout=FETCH_TIMEOUT, stream=True) as response:
+                    response.raise_for_status()
+                    output = BytesIO()
+                    for chunk in response.iter_content(64 * 1024):
+                        output.write(chunk)
+                    return output.getvalue()
+            except requests.RequestException as e:
+                self.stderr.write(f"Error downloading {url}: {e}")
+                return None
+
+        with session, ThreadPoolExecutor(max_workers=workers) as pool:
+            return [content for content in pool.map(download, urls) if content]
+
+    def store_images(self, sources, name, model):
+        names = []
+        for source in sources:
+            output = BytesIO()
+            try:
+                encode_jpeg(BytesIO(source), output, quality=model.IMAGE_QUALITY, max_width=model.IMAGE_MAX_WIDTH)
+            except Exception as e:
+                self.stderr.write(f"Skipping an unreadable image: {e}")
+                continue
+            names.append(self.storage.save(name, ContentFile(output.getvalue())))
+        return names
+
+    # Rows
+
+    def username_prefix(self, role):
+        return f"{self.options['prefix']}_{role}_"
+
+    def usernames(self, role):
+        return [f"{self.username_prefix(role)}{i:06d}" for i in range(self.options[f'{role}s'])]
+
+    def create_users(self, role):
+        wanted = self.usernames(role)
+        existing = set(User.objects.filter(username__startswith=self.username_prefix(role)).values_list('username', flat=True))
+        users = (
+            self.make_user(username, i)
+            for i, username in enumerate(wanted) if username not in existing
+        )
+        created = 0
+        for chunk in _chunks(users, self.options['batch']):
+            User.objects.bulk_create(chunk)
+            created += len(chunk)
+        self.report(f'{role} accounts', created)
+
+    def make_user(self, username, i):
+        rng = _rng(self.options['seed'], username)
+        first_name = rng.choice(FIRST_NAMES)
+        last_name = rng.choice(LAST_NAMES)
+        if first_name.endswith('а') and not last_name.endswith('а'):
+            last_name += 'а'
+        elif not first_name.endswith('а') and last_name.endswith('а'):
+            last_name = last_name[:-1]
+        return User(
+            username=username, first_name=first_name, last_name=last_name,
+            email=f"{username}@example.com", password=self.password,
+        )
+
+    def users_without(self, role, profile_lookup):
+        # Read up front: SQLite would show the rows being inserted to a query still being iterated
+        return list(
+            User.objects
+            .filter(username__startswith=self.username_prefix(role), **{f'{profile_lookup}__isnull': True})
+            .order_by('pk')
+            .values_list('pk', 'username')
+        )
+
+    def create_photographers(self, avatar_names, used):
+        specializations = [value for value, _ in PhotographerProfile.SPECIALIZATION_CHOICES]
+
+        def rows():
+            for user_id, username in self.users_without('photographer', 'photographerprofile'):
+                rng = _rng(self.options['seed'], username, 'profile')
+                city = rng.choice(CITIES)
+                # About half have a photo; the rest get initials avatars
+                avatar = rng.choice(avatar_names) if avatar_names and rng.random() < 0.5 else None
+                if avatar:
+                    used[avatar] += 1
+                yield PhotographerProfile(
+                    user_id=user_id,
+                    short_intro=rng.choice(INTROS),
+                    bio=' '.join(rng.sample(BIO_SENTENCES, 4)),
+                    city=city,
+                    city_normalized=normalize_city(city),  # save() isn't called by bulk_create()
+                    specialization=rng.choice(specializations),
+                    price=rng.randrange(1000, 15001, 500),
+                    language=rng.choice(['ru', 'ru', 'ru', 'en']),
+                    profile_image=avatar,
+                    views_count=rng.randrange(5000),
+                )
+
+        return self.bulk_create(PhotographerProfile, rows())
+
+    def create_clients(self):
+        def rows():
+            for user_id, username in self.users_without('client', 'clientprofile'):
+                rng = _rng(self.options['seed'], username, 'profile')
+                yield ClientProfile(user_id=user_id, phone_number=f"+7 9{rng.randrange(10**9):09d}")
+
+        return self.bulk_create(ClientProfile, rows())
+
+    def create_photos(self, photo_names, used):
+        profiles = list(
+            PhotographerProfile.objects
+            .filter(user__username__startswith=self.username_prefix('photographer'))
+            .annotate(photo_count=Count('photos'))
+            .order_by('pk')
+            .values_list('pk', 'photo_count')
+        )
+
+        def rows():
+            for profile_id, photo_count in profiles:
+                for j in range(photo_count, self.options['photos']):
+                    name = _rng(self.options['seed'], 'photo', profile_id, j).choice(photo_names)
+                    used[name] += 1
+                    yield Photo(photographer_id=profile_id, image=name, status=Photo.STATUS_READY)
+
+        return self.bulk_create(Photo, rows())
+
+    def create_bookings(self):
+        clients = list(
+            User.objects.filter(username__startswith=self.username_prefix('client')).order_by('pk').values_list('pk', flat=True)
+        )
+        photographers = list(
+            PhotographerProfile.objects.filter(user__username__startswith=self.username_prefix('photographer'))
+            .order_by('pk').values_list('pk', flat=True)
+        )
+        if not clients or not photographers:
+            return 0
+        existing = BookingRequest.objects.filter(client__username__startswith=self.username_prefix('client')).count()
+        statuses = [value for value, _ in BookingRequest.STATUS_CHOICES]
+
+        def rows():
+            for i in range(existing, self.options['bookings']):
+                rng = _rng(self.options['seed'], 'booking', i)
+                yield BookingRequest(
+                    client_id=rng.choice(clients),
+                    photographer_id=rng.choice(photographers),
+                    status=rng.choice(statuses),
+                    message=f"Здравствуйте! Хотим заказать съемку: {rng.choice(NEWS_SUBJECTS)}.",
+                    contact_phone=f"+7 9{rng.randrange(10**9):09d}",
+                )
+
+        return self.bulk_create(BookingRequest, rows())
+
+    def create_news(self, news_names, used):
+        titles = []
+        for i in range(self.options['news']):
+            rng = _rng(self.options['seed'], 'news', i)
+            # The number keeps titles unique, which is what makes reruns find them
+            titles.append(f"{rng.choice(NEWS_TOPICS)}: {rng.choice(NEWS_SUBJECTS)} №{i + 1}")
+        existing = set(News.objects.filter(title__in=titles).values_list('title', flat=True))
+
+        def rows():
+            for i, title in enumerate(titles):
+                if title in existing:
+                    continue
+                rng = _rng(self.options['seed'], 'news', i, 'body')
+                image = rng.choice(news_names) if news_names else ''
+                if image:
+                    used[image] += 1
+                yield News(title=title, content=' '.join(rng.sample(BIO_SENTENCES, 5)), image=image)
+
+        return self.bulk_create(News, rows())
+
+    def bulk_create(self, model, rows):
+        created = 0
+        for chunk in _chunks(rows, self.options['batch']):
+            model.objects.bulk_create(chunk)
+            created += len(chunk)
+        return created
@@ -0,0 +1,234 @@
+"""
+Per-request performance metrics, kept in memory and exposed in the
+Prometheus text format on /metrics.
+
+RequestMetricsMiddleware times every request and labels it with its URL
+name. It also records the queries run on the default database
+(connection.execute_wrapper) and the time spent rendering templates
+(TimedDjangoTemplates). Image work is timed with image_timer(), whether it
+runs inside a request or in the background workers. Requests slower than
+SLOW_REQUEST_THRESHOLD are logged together with their most expensive SQL.
+
+The histograms belong to the process: with several worker processes each
+one is scraped on its own. Scrapers authenticate with METRICS_TOKEN.
+"""
+import bisect
+import hmac
+import logging
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import connection
+from django.http import Http404, HttpResponse, HttpResponseForbidden
+from django.template.backends.django import DjangoTemplates, Template
+
+logger = logging.getLogger(__name__)
+
+# Seconds; roughly Prometheus' defaults
+TIME_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200)
+# How many statements the slow-request log shows
+SLOW_LOG_STATEMENTS = 5
+
+# Timings of the request being handled in this thread (None outside requests)
+_current = ContextVar('request_metrics', default=None)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(names, values, extra=()):
+    pairs = [*zip(names, values), *extra]
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+
+def _number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    def __init__(self, name, documentation, labelnames):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self.values = defaultdict(int)
+        self.lock = threading.Lock()
+
+    def inc(self, *labels, amount=1):
+        with self.lock:
+            self.values[labels] += amount
+
+    def expose(self):
+        yield f"# HELP {self.name} {self.documentation}"
+        yield f"# TYPE {self.name} counter"
+        with self.lock:
+            values = sorted(self.values.items())
+        for labels, value in values:
+            yield f"{self.name}{_labels(self.labelnames, labels)} {_number(value)}"
+
+
+class Histogram:
+    def __init__(self, name, documentation, labelnames, buckets=TIME_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self.buckets = buckets
+        # labels -> [count per bucket (not cumulative) ..., count above the last bucket]
+        self.counts = {}
+        self.sums = defaultdict(float)
+        self.lock = threading.Lock()
+
+    def observe(self, *labels, value):
+        index = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            counts = self.counts.setdefault(labels, [0] * (len(self.buckets) + 1))
+            counts[index] += 1
+            self.sums[labels] += value
+
+    def expose(self):
+        yield f"# HELP {self.name} {self.documentation}"
+        yield f"# TYPE {self.name} histogram"
+        with self.lock:
+            series = sorted((labels, list(counts), self.sums[labels]) for labels, counts in self.counts.items())
+        for labels, counts, total in series:
+            cumulative = 0
+            for bound, count in zip([*self.buckets, '+Inf'], counts):
+                cumulative += count
+                le = bound if bound == '+Inf' else _number(bound)
+                yield f"{self.name}_bucket{_labels(self.labelnames, labels, [('le', le)])} {cumulative}"
+            yield f"{self.name}_sum{_labels(self.labelnames, labels)} {_number(total)}"
+            yield f"{self.name}_count{_labels(self.labelnames, labels)} {cumulative}"
+
+
+REQUESTS = Counter('worldphoto_requests_total', "Requests handled, by URL name and status code.", ('view', 'status'))
+REQUEST_SECONDS = Histogram('worldphoto_request_duration_seconds', "Wall time of a request.", ('view',))
+QUERY_COUNT = Histogram('worldphoto_db_queries_per_request', "Database queries run by a request.", ('view',), QUERY_COUNT_BUCKETS)
+QUERY_SECONDS = Histogram('worldphoto_db_query_duration_seconds', "Time a request spent in database queries.", ('view',))
+TEMPLATE_SECONDS = Histogram('worldphoto_template_render_seconds', "Time a request spent rendering templates.", ('view',))
+IMAGE_SECONDS = Histogram('worldphoto_image_processing_seconds', "Time spent compressing and resizing images.", ('operation',))
+METRICS = [REQUESTS, REQUEST_SECONDS, QUERY_COUNT, QUERY_SECONDS, TEMPLATE_SECONDS, IMAGE_SECONDS]
+
+
+class RequestTimings:
+    def __init__(self):
+        self.queries = []  # (sql, seconds)
+        self.template_seconds = 0.0
+        self.image_seconds = 0.0
+
+    @property
+    def query_seconds(self):
+        return sum(seconds for _, seconds in self.queries)
+
+    def record_query(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            # The SQL without its parameters: repeats of one statement group together
+            self.queries.append((sql, time.perf_counter() - start))
+
+    def costliest_queries(self):
+        """The statements that took the most time in total, with how often each ran."""
+        totals = defaultdict(lambda: [0, 0.0])
+        for sql, seconds in self.queries:
+            totals[sql][0] += 1
+            totals[sql][1] += seconds
+        return sorted(totals.items(), key=lambda item: -item[1][1])[:SLOW_LOG_STATEMENTS]
+
+
+@contextmanager
+def image_timer(operation):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        seconds = time.perf_counter() - start
+        IMAGE_SECONDS.observe(operation, value=seconds)
+        timings = _current.get()
+        if timings is not None:
+            timings.image_seconds += seconds
+
+
+class TimedTemplate(Template):
+    def render(self, context=None, request=None):
+        timings = _current.get()
+        if timings is None:
+            return super().render(context, request)
+        start = time.perf_counter()
+        try:
+            return super().render(context, request)
+        finally:
+            timings.template_seconds += time.perf_counter() - start
+
+
+class TimedDjangoTemplates(DjangoTemplates):
+    """The Django template backend, timing each render for the request metrics."""
+
+    def from_string(self, template_code):
+        return TimedTemplate(self.engine.from_string(template_code), self)
+
+    def get_template(self, template_name):
+        template = super().get_template(template_name)
+        return TimedTemplate(template.template, self)
+
+
+def _view_name(request):
+    match = getattr(request, 'resolver_match', None)
+    # view_name falls back to the dotted path of views without a URL name
+    return match.view_name if match else '<unmatched>'
+
+
+class RequestMetricsMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        timings = RequestTimings()
+        token = _current.set(timings)
+        start = time.perf_counter()
+        try:
+            with connection.execute_wrapper(timings.record_query):
+                response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        seconds = time.perf_counter() - start
+
+        view = _view_name(request)
+        REQUESTS.inc(view, response.status_code)
+        REQUEST_SECONDS.observe(view, value=seconds)
+        QUERY_COUNT.observe(view, value=len(timings.queries))
+        QUERY_SECONDS.observe(view, value=timings.query_seconds)
+        TEMPLATE_SECONDS.observe(view, value=timings.template_seconds)
+
+        if seconds >= settings.SLOW_REQUEST_THRESHOLD:
+            self.log_slow_request(request, view, seconds, timings)
+        return response
+
+    def log_slow_request(self, request, view, seconds, timings):
+        lines = [
+            f"Slow request: {request.method} {request.get_full_path()} ({view}) took {seconds * 1000:.0f}ms: "
+            f"{len(timings.queries)} queries in {timings.query_seconds * 1000:.0f}ms, "
+            f"templates {timings.template_seconds * 1000:.0f}ms, images {timings.image_seconds * 1000:.0f}ms",
+        ]
+        for sql, (count, total) in timings.costliest_queries():
+            lines.append(f"  {total * 1000:.1f}ms x{count}: {sql}")
+        logger.warning('\n'.join(lines))
+
+
+def metrics_view(request):
+    # The numbers reveal traffic and timings: only scrapers holding the token get them
+    token = settings.METRICS_TOKEN
+    if not token:
+        raise Http404
+    scheme, _, credentials = request.headers.get('Authorization', '').partition(' ')
+    if scheme.lower() != 'bearer' or not hmac.compare_digest(credentials.encode(), token.encode()):
+        return HttpResponseForbidden()
+    body = '\n'.join(line for metric in METRICS for line in metric.expose()) + '\n'
+    return HttpResponse(body, content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -0,0 +1,17 @@
+# Generated by Django 6.0 on 2026-10-17 20:48
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0006_bookingrequest_is_deleted_by_client_and_more'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='photo',
+            index=models.Index(fields=['-uploaded_at', '-id'], name='photo_uploaded_id_idx'),
+        ),
+    ]
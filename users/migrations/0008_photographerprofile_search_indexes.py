@@ -0,0 +1,35 @@
+# Generated by Django 6.0 on 2026-10-17 21:05
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0007_photo_uploaded_id_idx'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='photographerprofile',
+            index=models.Index(fields=['specialization', 'price'], name='profile_spec_price_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='photographerprofile',
+            index=models.Index(fields=['language', 'price'], name='profile_lang_price_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='photographerprofile',
+            index=models.Index(fields=['price'], name='profile_price_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='photographerprofile',
+            index=models.Index(fields=['city'], name='profile_city_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='photographerprofile',
+            index=models.Index(fields=['-views_count'], name='profile_views_idx'),
+        ),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 6.0 on 2026-10-17 21:20
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+def normalize_cities(apps, schema_editor):
+    PhotographerProfile = apps.get_model('users', 'PhotographerProfile')
+    profiles = list(PhotographerProfile.objects.exclude(city=None).exclude(city=''))
+    for profile in profiles:
+        profile.city_normalized = ' '.join(profile.city.split()).casefold().replace('ё', 'е')
+    PhotographerProfile.objects.bulk_update(profiles, ['city_normalized'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0008_photographerprofile_search_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='photographerprofile',
+            name='profile_city_idx',
+        ),
+        migrations.AddField(
+            model_name='photographerprofile',
+            name='city_normalized',
+            field=models.CharField(blank=True, default='', editable=False, max_length=100),
+        ),
+        migrations.AddIndex(
+            model_name='photographerprofile',
+            index=models.Index(fields=['city_normalized'], name='profile_city_norm_idx'),
+        ),
+        migrations.RunPython(normalize_cities, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 6.0 on 2026-10-17 21:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0009_photographerprofile_city_normalized'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='photo',
+            name='status',
+            field=models.CharField(choices=[('processing', 'Обрабатывается'), ('ready', 'Готово'), ('failed', 'Ошибка обработки')], db_index=True, default='ready', max_length=20),
+        ),
+    ]
@@ -0,0 +1,59 @@
+# Generated by Django 6.0 on 2026-10-17 22:30
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0010_photo_status'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedBooking',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('status', models.CharField(choices=[('new', 'Новая'), ('in_progress', 'В работе'), ('completed', 'Выполнена'), ('cancelled', 'Отменена')], max_length=20)),
+                ('message', models.TextField(verbose_name='Сообщение')),
+                ('contact_phone', models.CharField(max_length=20, verbose_name='Телефон для связи')),
+                ('created_at', models.DateTimeField()),
+                ('updated_at', models.DateTimeField()),
+                ('is_deleted_by_client', models.BooleanField(default=False)),
+                ('is_deleted_by_photographer', models.BooleanField(default=False)),
+                ('archived_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'ordering': ['-created_at'],
+            },
+        ),
+        migrations.AddIndex(
+            model_name='bookingrequest',
+            index=models.Index(fields=['photographer', 'is_deleted_by_photographer', 'status', '-created_at'], name='booking_received_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='bookingrequest',
+            index=models.Index(fields=['client', 'is_deleted_by_client', 'status', '-created_at'], name='booking_sent_idx'),
+        ),
+        migrations.AddField(
+            model_name='archivedbooking',
+            name='client',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='archived_bookings_made', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddField(
+            model_name='archivedbooking',
+            name='photographer',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='archived_bookings_received', to='users.photographerprofile'),
+        ),
+        migrations.AddIndex(
+            model_name='archivedbooking',
+            index=models.Index(fields=['photographer', 'is_deleted_by_photographer', '-created_at'], name='archived_received_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='archivedbooking',
+            index=models.Index(fields=['client', 'is_deleted_by_client', '-created_at'], name='archived_sent_idx'),
+        ),
+    ]
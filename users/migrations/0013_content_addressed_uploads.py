@@ -0,0 +1,42 @@
+# Generated by Django 6.0 on 2026-10-17 23:40
+
+import users.storage
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0012_updated_at'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StoredFile',
+            fields=[
+                ('name', models.CharField(max_length=255, primary_key=True, serialize=False)),
+                ('refs', models.PositiveIntegerField(default=0)),
+                ('compressed', models.CharField(blank=True, max_length=255)),
+            ],
+        ),
+        migrations.AlterField(
+            model_name='clientprofile',
+            name='profile_image',
+            field=models.ImageField(blank=True, null=True, storage=users.storage.get_upload_storage, upload_to='client_images'),
+        ),
+        migrations.AlterField(
+            model_name='news',
+            name='image',
+            field=models.ImageField(blank=True, storage=users.storage.get_upload_storage, upload_to='news_images'),
+        ),
+        migrations.AlterField(
+            model_name='photo',
+            name='image',
+            field=models.ImageField(storage=users.storage.get_upload_storage, upload_to='photographs'),
+        ),
+        migrations.AlterField(
+            model_name='photographerprofile',
+            name='profile_image',
+            field=models.ImageField(blank=True, null=True, storage=users.storage.get_upload_storage, upload_to='profile_images'),
+        ),
+    ]
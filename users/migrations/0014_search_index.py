@@ -0,0 +1,57 @@
+# Generated by Django 6.0 on 2026-10-18 00:20
+
+from django.db import OperationalError, migrations
+
+# A copy of the table as users.search created it at this point; migrations
+# must not depend on the current app code
+SEARCH_TABLE = 'users_search'
+
+# The stems are computed in Python (users.stemmer), which a migration can't
+# rely on either, so existing rows are copied as plain text. Stems are
+# prefixes of their words and queries match by prefix, so this text is found
+# as well; `manage.py rebuild_search_index` (or saving a row) stores the stems.
+# rowid = pk * 2 + 0 for photographers, + 1 for news (users.search.KINDS)
+BACKFILL = [
+    f"""
+    INSERT INTO {SEARCH_TABLE} (rowid, title, body)
+    SELECT p.id * 2,
+           lower(u.first_name || ' ' || u.last_name || ' ' || u.username || ' ' || coalesce(p.city, '')),
+           lower(p.short_intro || ' ' || p.bio)
+    FROM users_photographerprofile p JOIN auth_user u ON u.id = p.user_id
+    """,
+    f"""
+    INSERT INTO {SEARCH_TABLE} (rowid, title, body)
+    SELECT id * 2 + 1, lower(title), lower(content) FROM users_news
+    """,
+]
+
+
+def create_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    try:
+        schema_editor.execute(
+            f"CREATE VIRTUAL TABLE {SEARCH_TABLE} USING fts5("
+            f"title, body, tokenize = 'unicode61 remove_diacritics 2', prefix = '3 4')"
+        )
+    except OperationalError:
+        # SQLite built without FTS5: users.search uses its in-process index
+        return
+    for sql in BACKFILL:
+        schema_editor.execute(sql)
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'sqlite':
+        schema_editor.execute(f"DROP TABLE IF EXISTS {SEARCH_TABLE}")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0013_content_addressed_uploads'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
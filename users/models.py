@@ -1,60 +1,67 @@
-from django.db import models
+from django.db import models, transaction
 from django.contrib.auth.models import User
-from PIL import Image
-from io import BytesIO
-from django.core.files.uploadedfile import InMemoryUploadedFile
-import sys
-
-def compress_image(image_field, quality=70, max_width=1920):
-    if not image_field:
-        return image_field
-    
-    try:
-        img = Image.open(image_field)
-        
-        if img.mode != 'RGB':
-            img = img.convert('RGB')
-            
-        # Resize if width > max_width
-        if img.width > max_width:
-            output_size = (max_width, int(img.height * (max_width / img.width)))
-            img.thumbnail(output_size)
-            
-        output = BytesIO()
-        img.save(output, format='JPEG', quality=quality)
-        output.seek(0)
-        
-        return InMemoryUploadedFile(
-            output,
-            'ImageField',
-            f"{image_field.name.split('.')[0]}.jpg",
-            'image/jpeg',
-            sys.getsizeof(output),
-            None
-        )
-    except Exception as e:
-        print(f"Error compressing image: {e}")
-        return image_field
+
+from .images import compress_image  # noqa: F401  (kept importable from users.models)
+from .storage import get_upload_storage
+
+def normalize_city(city):
+    """Casefolds, trims and collapses spaces in a city name, treating ё as е."""
+    return ' '.join((city or '').split()).casefold().replace('ё', 'е')
+
+def _replaced_image(profile, update_fields):
+    """The stored profile image name that saving `profile` is about to replace or clear."""
+    if profile.pk is None or (update_fields is not None and 'profile_image' not in update_fields):
+        return None
+    # Only a new upload or a cleared field can replace the stored image
+    if profile.profile_image and profile.profile_image._committed:
+        return None
+    old_name = type(profile).objects.filter(pk=profile.pk).values_list('profile_image', flat=True).first()
+    return old_name or None
+
+
+def _release_image(profile, name):
+    # Drops this profile's reference to the old file once the new name is
+    # committed. Even re-uploaded identical bytes took a reference of their
+    # own; the content-addressed storage removes the file with its last one
+    storage = profile.profile_image.storage
+    transaction.on_commit(lambda: storage.delete(name))
+
 
 class ClientProfile(models.Model):
+    # Image quality and size the workers compress uploads to
+    IMAGE_QUALITY = 60
+    IMAGE_MAX_WIDTH = 800
+
     user = models.OneToOneField(User, on_delete=models.CASCADE)
-    profile_image = models.ImageField(upload_to='client_images', blank=True, null=True)
+    profile_image = models.ImageField(upload_to='client_images', storage=get_upload_storage, blank=True, null=True)
     phone_number = models.CharField(max_length=20, blank=True, null=True, verbose_name="Номер телефона")
 
     def save(self, *args, **kwargs):
-        if self.profile_image and isinstance(self.profile_image.file, InMemoryUploadedFile):
-             self.profile_image = compress_image(self.profile_image, quality=60, max_width=800)
+        # Fresh uploads are stored as-is and compressed by the image workers
+        new_image = bool(self.profile_image) and not self.profile_image._committed
+        replaced = _replaced_image(self, kwargs.get('update_fields'))
         super().save(*args, **kwargs)
+        if replaced:
+            _release_image(self, replaced)
+        if new_image:
+            from .tasks import enqueue_profile_image
+            enqueue_profile_image(self)
 
     def __str__(self):
         return f"Client: {self.user.username}"
 
 
 class PhotographerProfile(models.Model):
+    # Image quality and size the workers compress uploads to
+    IMAGE_QUALITY = 60
+    IMAGE_MAX_WIDTH = 800
+
     user = models.OneToOneField(User, on_delete=models.CASCADE)
     short_intro = models.CharField(max_length=250)
     bio = models.TextField()
     city = models.CharField(max_length=100, blank=True, null=True)
+    # Search key for `city`, kept in sync in save()
+    city_normalized = models.CharField(max_length=100, blank=True, default='', editable=False)
     
     SPECIALIZATION_CHOICES = [
         ('wedding', 'Свадьба'),
@@ -73,49 +80,79 @@ class PhotographerProfile(models.Model):
     ]
     language = models.CharField(max_length=10, choices=LANGUAGE_CHOICES, default='ru')
     
-    profile_image = models.ImageField(upload_to='profile_images', blank=True, null=True)
+    profile_image = models.ImageField(upload_to='profile_images', storage=get_upload_storage, blank=True, null=True)
     views_count = models.PositiveIntegerField(default=0)
+    # Not touched by the buffered views_count updates, only by real edits
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
 
-    def save(self, *args, **kwargs):
-        if self.profile_image and not self.id: # Only compress on initial upload or handle update logic carefully
-             # Simple check: if image is being updated. 
-             # Ideally we compare with old instance, but for simplicity in this homework, 
-             # we can just compress. However, compressing already compressed image might degrade quality repeatedly.
-             # Better approach: check if it's a new file.
-             pass
-             
-        # For simplicity, we will apply compression if it looks like a raw upload (has file path)
-        # In a real app, we'd check if self.pk is None or if 'profile_image' in changed_fields
-        if self.profile_image:
-             # This is a bit risky without state tracking, but acceptable for a prototype if we don't save repeatedly.
-             # Actually, let's just do it. The user wants the feature.
-             # To avoid re-compression, we could check a flag or just assume new uploads.
-             # We will try to compress.
-             if hasattr(self.profile_image, 'file') and not isinstance(self.profile_image.file, InMemoryUploadedFile):
-                 # It might be a file from disk (management command) or fresh upload
-                 pass
-             
-             # Let's rely on the fact that forms send InMemoryUploadedFile.
-             # If we just save, we might re-compress.
-             # Safe bet: Compress if no ID (create) or if we implement a check in View.
-             # Let's put the logic here but only if it is an InMemoryUploadedFile (fresh upload).
-             if isinstance(self.profile_image.file, InMemoryUploadedFile):
-                 self.profile_image = compress_image(self.profile_image, quality=60, max_width=800)
+    class Meta:
+        indexes = [
+            # Specialists filter panel: equality filters first, then the price range
+            models.Index(fields=['specialization', 'price'], name='profile_spec_price_idx'),
+            models.Index(fields=['language', 'price'], name='profile_lang_price_idx'),
+            models.Index(fields=['price'], name='profile_price_idx'),
+            models.Index(fields=['city_normalized'], name='profile_city_norm_idx'),
+            models.Index(fields=['-views_count'], name='profile_views_idx'),
+        ]
 
+    def save(self, *args, **kwargs):
+        # Fresh uploads are stored as-is and compressed by the image workers
+        new_image = bool(self.profile_image) and not self.profile_image._committed
+
+        self.city_normalized = normalize_city(self.city)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None:
+            update_fields = {*update_fields, 'updated_at'}
+            if 'city' in update_fields:
+                update_fields.add('city_normalized')
+            kwargs['update_fields'] = update_fields
+
+        replaced = _replaced_image(self, update_fields)
         super().save(*args, **kwargs)
+        if replaced:
+            _release_image(self, replaced)
+        if new_image:
+            from .tasks import enqueue_profile_image
+            enqueue_profile_image(self)
 
     def __str__(self):
         return self.user.username
 
 class Photo(models.Model):
+    STATUS_PROCESSING = 'processing'
+    STATUS_READY = 'ready'
+    STATUS_FAILED = 'failed'
+    STATUS_CHOICES = [
+        (STATUS_PROCESSING, 'Обрабатывается'),
+        (STATUS_READY, 'Готово'),
+        (STATUS_FAILED, 'Ошибка обработки'),
+    ]
+
+    # Image quality and size the workers compress uploads to
+    IMAGE_QUALITY = 70
+    IMAGE_MAX_WIDTH = 1600
+
     photographer = models.ForeignKey(PhotographerProfile, on_delete=models.CASCADE, related_name='photos')
-    image = models.ImageField(upload_to='photographs')
+    image = models.ImageField(upload_to='photographs', storage=get_upload_storage)
     uploaded_at = models.DateTimeField(auto_now_add=True)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=STATUS_READY, db_index=True)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
+
+    class Meta:
+        indexes = [
+            # Keyset pagination of the gallery: ORDER BY uploaded_at DESC, id DESC
+            models.Index(fields=['-uploaded_at', '-id'], name='photo_uploaded_id_idx'),
+        ]
 
     def save(self, *args, **kwargs):
-        if self.image and isinstance(self.image.file, InMemoryUploadedFile):
-             self.image = compress_image(self.image, quality=70, max_width=1600)
+        # Fresh uploads are stored as-is and queued; public pages only show ready photos
+        new_image = bool(self.image) and not self.image._committed
+        if new_image:
+            self.status = self.STATUS_PROCESSING
         super().save(*args, **kwargs)
+        if new_image:
+            from .tasks import enqueue_photos
+            enqueue_photos([self.pk])
 
     def __str__(self):
         return f"Photo by {self.photographer.user.username}"
@@ -138,12 +175,62 @@ class BookingRequest(models.Model):
     is_deleted_by_client = models.BooleanField(default=False)
     is_deleted_by_photographer = models.BooleanField(default=False)
 
+    is_archived = False
+
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            # Dashboard lists: a user's side of the bookings by status, newest first
+            models.Index(fields=['photographer', 'is_deleted_by_photographer', 'status', '-created_at'], name='booking_received_idx'),
+            models.Index(fields=['client', 'is_deleted_by_client', 'status', '-created_at'], name='booking_sent_idx'),
+        ]
 
     def __str__(self):
         return f"Booking {self.id} from {self.client.username}"
 
+class ArchivedBooking(models.Model):
+    """
+    Completed bookings moved out of BookingRequest by `manage.py archive_bookings`.
+    Keeps the original id, so history pages continue seamlessly into the archive.
+    """
+    id = models.BigIntegerField(primary_key=True)
+    client = models.ForeignKey(User, on_delete=models.CASCADE, related_name='archived_bookings_made')
+    photographer = models.ForeignKey(PhotographerProfile, on_delete=models.CASCADE, related_name='archived_bookings_received')
+    status = models.CharField(max_length=20, choices=BookingRequest.STATUS_CHOICES)
+    message = models.TextField(verbose_name="Сообщение")
+    contact_phone = models.CharField(max_length=20, verbose_name="Телефон для связи")
+    created_at = models.DateTimeField()
+    updated_at = models.DateTimeField()
+    is_deleted_by_client = models.BooleanField(default=False)
+    is_deleted_by_photographer = models.BooleanField(default=False)
+    archived_at = models.DateTimeField(auto_now_add=True)
+
+    is_archived = True
+
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['photographer', 'is_deleted_by_photographer', '-created_at'], name='archived_received_idx'),
+            models.Index(fields=['client', 'is_deleted_by_client', '-created_at'], name='archived_sent_idx'),
+        ]
+
+    def __str__(self):
+        return f"Archived booking {self.id} from {self.client.username}"
+
+class StoredFile(models.Model):
+    """
+    Reference count of a content-addressed upload (see users.storage).
+    Rows outlive their files so a re-upload of the same bytes can still
+    find its compressed version.
+    """
+    name = models.CharField(max_length=255, primary_key=True)
+    refs = models.PositiveIntegerField(default=0)
+    # The compressed file the image workers made from this (raw) upload
+    compressed = models.CharField(max_length=255, blank=True)
+
+    def __str__(self):
+        return f"{self.name} ({self.refs} refs)"
+
 class Favorite(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='favorites')
     photographer = models.ForeignKey(PhotographerProfile, on_delete=models.CASCADE, related_name='favorited_by')
@@ -159,8 +246,9 @@ class Favorite(models.Model):
 class News(models.Model):
     title = models.CharField(max_length=200)
     content = models.TextField()
-    image = models.ImageField(upload_to='news_images', blank=True)
+    image = models.ImageField(upload_to='news_images', storage=get_upload_storage, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
 
     def __str__(self):
         return self.title
@@ -0,0 +1,79 @@
+import base64
+from datetime import datetime
+
+from django.core.cache import cache
+from django.core.paginator import Paginator
+from django.db.models import Q
+from django.utils.functional import cached_property
+
+
+def encode_cursor(timestamp, pk):
+    raw = f"{timestamp.isoformat()}|{pk}"
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+# Largest id the database can compare with; bigger ones make the query fail
+MAX_ID = 2 ** 63 - 1
+
+
+def decode_cursor(cursor):
+    """Returns (timestamp, pk) from a cursor string, or None if it is malformed."""
+    if not cursor:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(cursor.encode()).decode()
+        timestamp, pk = raw.rsplit('|', 1)
+        timestamp, pk = datetime.fromisoformat(timestamp), int(pk)
+    except (ValueError, UnicodeDecodeError):
+        return None
+    # encode_cursor() only writes aware timestamps and real ids
+    if timestamp.tzinfo is None or not 0 < pk <= MAX_ID:
+        return None
+    return timestamp, pk
+
+
+def keyset_page(queryset, cursor, page_size, field):
+    """
+    Returns one page of `queryset` ordered newest first by (field, id),
+    together with the cursor of the next page (None on the last page).
+
+    Seeks past the cursor with a WHERE clause instead of OFFSET, so every page
+    costs the same single query on the composite (field, id) index. An
+    invalid cursor gives an empty last page.
+    """
+    queryset = queryset.order_by(f'-{field}', '-id')
+    position = decode_cursor(cursor)
+    if cursor and position is None:
+        # A malformed or tampered cursor ends the list rather than starting
+        # it over, which infinite scroll would repeat forever
+        return [], None
+    if position:
+        timestamp, pk = position
+        queryset = queryset.filter(
+            Q(**{f'{field}__lt': timestamp}) | Q(**{field: timestamp, 'id__lt': pk})
+        )
+
+    items = list(queryset[:page_size + 1])
+    next_cursor = None
+    if len(items) > page_size:
+        items = items[:page_size]
+        last = items[-1]
+        next_cursor = encode_cursor(getattr(last, field), last.pk)
+    return items, next_cursor
+
+
+class CachedCountPaginator(Paginator):
+    """Paginator that keeps the COUNT(*) of its queryset in the cache for `timeout` seconds."""
+
+    def __init__(self, object_list, per_page, cache_key, timeout=60, **kwargs):
+        super().__init__(object_list, per_page, **kwargs)
+        self.cache_key = cache_key
+        self.timeout = timeout
+
+    @cached_property
+    def count(self):
+        count = cache.get(self.cache_key)
+        if count is None:
+            count = super().count
+            cache.set(self.cache_key, count, self.timeout)
+        return count
@@ -0,0 +1,35 @@
+"""
+Resolving which profile (photographer or client) a user has.
+
+`request.user` arrives with both profiles already joined in by
+users.backends.ProfileBackend, so get_profile() usually costs no query.
+Users loaded any other way are resolved with one joined query, and the
+result is kept on the user object for the rest of the request.
+"""
+from django.contrib.auth.models import User
+
+from .models import PhotographerProfile
+
+PROFILE_RELATIONS = (User.photographerprofile.related, User.clientprofile.related)
+
+
+def get_profile(user):
+    """Returns the user's PhotographerProfile, else their ClientProfile, else None."""
+    if not user.is_authenticated:
+        return None
+
+    if not all(relation.is_cached(user) for relation in PROFILE_RELATIONS):
+        loaded = User.objects.select_related('photographerprofile', 'clientprofile').filter(pk=user.pk).first()
+        for relation in PROFILE_RELATIONS:
+            relation.set_cached_value(user, relation.get_cached_value(loaded) if loaded else None)
+
+    for relation in PROFILE_RELATIONS:
+        profile = relation.get_cached_value(user)
+        if profile is not None:
+            return profile
+    return None
+
+
+def get_photographer_profile(user):
+    profile = get_profile(user)
+    return profile if isinstance(profile, PhotographerProfile) else None
@@ -0,0 +1,190 @@
+"""
+Resized copies ("renditions") of stored images for responsive <img srcset>.
+
+Renditions live under renditions/<hash[:2]>/<hash>/<width>.<ext>, where the
+hash is the SHA-256 of the source's bytes: content-addressed uploads carry
+it in their name, older uploads are hashed when their renditions are built.
+A rendition name therefore always refers to the same picture and is served
+as immutable, even if a non-hashed source name is later reused for another
+file, and a rendition is generated once and reused. Every width is written
+as JPEG, which all browsers can show, and in the modern formats of
+RENDITION_FORMATS the Pillow build supports (AVIF, WebP), which also get a
+full-size copy and keep transparency. Templates offer them through <picture>
+sources. Which source hash, widths and formats a stored name has is recorded
+in a manifest.json under a hash of the name. The cache only holds a copy of
+it, so rendering a page usually doesn't touch the disk, and a cache miss (a
+restart, another worker, an evicted entry) costs one small read rather than
+a rebuild. Images without a manifest fall back to the original and are
+queued; a rebuild with a current manifest doesn't decode the source.
+"""
+import hashlib
+import json
+import posixpath
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from io import BytesIO
+from PIL import Image, features
+
+from .storage import is_content_addressed
+
+RENDITION_QUALITY = 75
+# format name -> (Pillow format, file extension, MIME type, save options)
+FORMATS = {
+    'avif': ('AVIF', 'avif', 'image/avif', {'quality': 50}),
+    'webp': ('WEBP', 'webp', 'image/webp', {'quality': RENDITION_QUALITY, 'method': 4}),
+    'jpeg': ('JPEG', 'jpg', 'image/jpeg', {'quality': RENDITION_QUALITY, 'optimize': True}),
+}
+
+
+def rendition_key(name):
+    return hashlib.sha1(name.encode()).hexdigest()
+
+
+def rendition_name(source, width, fmt='jpeg'):
+    """The name of a rendition of the image whose bytes hash to `source`."""
+    return f"renditions/{source[:2]}/{source}/{width}.{FORMATS[fmt][1]}"
+
+
+def source_hash(name, storage):
+    """The SHA-256 of the stored image `name`; read from the name when it is content-addressed."""
+    if is_content_addressed(name):
+        return posixpath.splitext(posixpath.basename(name))[0]
+    digest = hashlib.sha256()
+    with storage.open(name, 'rb') as f:
+        for chunk in f.chunks():
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def modern_formats():
+    """The formats of RENDITION_FORMATS besides JPEG that this Pillow build can write."""
+    return [fmt for fmt in settings.RENDITION_FORMATS if fmt != 'jpeg' and fmt in FORMATS and features.check(fmt)]
+
+
+def _cache_key(name):
+    return f"renditions:{rendition_key(name)}"
+
+
+def _manifest_name(name):
+    key = rendition_key(name)
+    return f"renditions/{key[:2]}/{key}/manifest.json"
+
+
+def _get_manifest(name, storage):
+    """Returns what build_renditions() recorded for `name`, or None if it never ran."""
+    entry = cache.get(_cache_key(name))
+    if entry is None:
+        try:
+            with storage.open(_manifest_name(name), 'rb') as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+        cache.set(_cache_key(name), entry, None)
+    return entry
+
+
+def _save_manifest(name, entry, storage):
+    target = _manifest_name(name)
+    # Storage never overwrites; the old manifest only ever lists fewer files
+    storage.delete(target)
+    saved = storage.save(target, ContentFile(json.dumps(entry).encode()))
+    if saved != target:
+        storage.delete(saved)
+    cache.set(_cache_key(name), entry, None)
+
+
+def _is_current(entry, source):
+    if entry.get('source') != source:
+        # Built from other bytes under the same name, or before renditions were keyed by content
+        return False
+    widths = sorted(width for width in settings.RENDITION_WIDTHS if width < entry['source_width'])
+    return entry['formats'] == modern_formats() and entry['widths'] == widths
+
+
+def _save(img, target, fmt, storage):
+    if storage.exists(target):
+        return
+    pillow_format, _, _, options = FORMATS[fmt]
+    if fmt == 'jpeg' and img.mode == 'RGBA':
+        # JPEG has no alpha: flatten onto white rather than the black
+        # that dropping the channel would reveal
+        flat = Image.new('RGB', img.size, 'white')
+        flat.paste(img, mask=img.getchannel('A'))
+        img = flat
+    output = BytesIO()
+    img.save(output, format=pillow_format, **options)
+    saved = storage.save(target, ContentFile(output.getvalue()))
+    if saved != target:
+        # Another worker wrote it first; keep theirs
+        storage.delete(saved)
+
+
+def build_renditions(name, storage=default_storage):
+    """Generates the missing renditions of the stored image `name` and returns get_renditions()."""
+    source = source_hash(name, storage)
+    entry = _get_manifest(name, storage)
+    if entry is not None and _is_current(entry, source):
+        return get_renditions(name, storage)
+
+    with storage.open(name, 'rb') as f:
+        img = Image.open(f)
+        img.load()
+    has_alpha = img.mode in ('RGBA', 'LA', 'PA') or 'transparency' in img.info
+    img = img.convert('RGBA' if has_alpha else 'RGB')
+    source_width = img.width
+
+    # The original file is the full-size fallback; modern formats get their own copy
+    formats = modern_formats()
+    for fmt in formats:
+        _save(img, rendition_name(source, source_width, fmt), fmt, storage)
+
+    # Largest first, each one resized from the previous one, which is much
+    # cheaper than going back to the full-size source every time
+    widths = []
+    for width in sorted(settings.RENDITION_WIDTHS, reverse=True):
+        if width >= source_width:
+            continue
+        widths.append(width)
+        targets = [(rendition_name(source, width, fmt), fmt) for fmt in [*formats, 'jpeg']]
+        if all(storage.exists(target) for target, _ in targets):
+            continue
+        img = img.resize((width, max(1, round(img.height * width / img.width))), Image.Resampling.LANCZOS)
+        for target, fmt in targets:
+            _save(img, target, fmt, storage)
+
+    _save_manifest(name, {
+        'source': source, 'source_width': source_width, 'widths': sorted(widths), 'formats': formats,
+    }, storage)
+    return get_renditions(name, storage)
+
+
+def get_renditions(name, storage=default_storage):
+    """
+    Returns {width: url} for the renditions of `name`, the original included,
+    or None if they haven't been generated yet.
+    """
+    entry = _get_manifest(name, storage)
+    if entry is None or 'source' not in entry:
+        return None
+    renditions = {width: storage.url(rendition_name(entry['source'], width)) for width in entry['widths']}
+    renditions[entry['source_width']] = storage.url(name)
+    return renditions
+
+
+def get_rendition_sources(name, storage=default_storage):
+    """
+    Returns [(mime type, {width: url})] of the modern-format renditions of
+    `name`, best format first, or None if they are missing or were built
+    before the current RENDITION_FORMATS.
+    """
+    entry = _get_manifest(name, storage)
+    if entry is None or 'source' not in entry or entry.get('formats') != modern_formats():
+        return None
+    widths = [*entry['widths'], entry['source_width']]
+    return [
+        (FORMATS[fmt][2], {width: storage.url(rendition_name(entry['source'], width, fmt)) for width in widths})
+        for fmt in entry['formats']
+    ]
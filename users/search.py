@@ -0,0 +1,313 @@
+"""
+Full-text search over photographers and news.
+
+Text is split into words, common words dropped and the rest reduced to
+their stems (users.stemmer), so "свадебные фотографии" also finds
+"свадебная фотография". Each query stem matches every indexed stem it
+starts with, and a document has to match all of them.
+
+On SQLite with FTS5 the stems are stored in the users_search virtual table,
+kept up to date row by row from signals and ranked with bm25(). Without
+FTS5 (or with SEARCH_USE_FTS5 off) they go into an inverted index held by
+each process instead, a VersionedIndex like the city index.
+"""
+import bisect
+import math
+import re
+from abc import ABC, abstractmethod
+from collections import Counter, defaultdict, namedtuple
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.utils.functional import cached_property
+from django.utils.html import strip_tags
+
+from .indexes import VersionedIndex
+from .models import News, PhotographerProfile
+from .stemmer import stem
+
+SEARCH_TABLE = 'users_search'
+INDEX_VERSION_KEY = 'search_index_version'
+# A document's rowid is pk * len(KINDS) + the position of its kind
+KINDS = ['photographer', 'news']
+# Fields that change a photographer's document
+PHOTOGRAPHER_FIELDS = {'short_intro', 'bio', 'city'}
+USER_FIELDS = {'first_name', 'last_name', 'username'}
+# A title match counts as much as this many body matches
+TITLE_WEIGHT = 10.0
+# Shorter stems only match exactly, or "в" would match half the index
+MIN_PREFIX = 3
+# BM25 parameters of the in-process index (the FTS5 defaults)
+K1 = 1.2
+B = 0.75
+
+WORD_RE = re.compile(r'\w+')
+STOP_WORDS = {
+    'а', 'без', 'в', 'во', 'все', 'вы', 'да', 'для', 'до', 'его', 'ее', 'ей', 'же', 'за', 'и', 'из', 'или',
+    'их', 'к', 'как', 'ко', 'ли', 'мы', 'на', 'над', 'не', 'него', 'нет', 'ни', 'но', 'о', 'об', 'он', 'она',
+    'они', 'оно', 'от', 'по', 'под', 'при', 'с', 'со', 'так', 'также', 'то', 'только', 'у', 'что', 'это', 'я',
+}
+
+Hit = namedtuple('Hit', 'kind object')
+
+# Whether each database has the FTS5 table, by database name
+_tables = {}
+
+
+def terms(text):
+    words = WORD_RE.findall((text or '').lower().replace('ё', 'е'))
+    return [stem(word) for word in words if word not in STOP_WORDS]
+
+
+def photographer_document(profile):
+    user = profile.user
+    title = ' '.join([user.first_name, user.last_name, user.username, profile.city or ''])
+    return title, f"{profile.short_intro} {profile.bio}"
+
+
+def news_document(news):
+    return news.title, strip_tags(news.content)
+
+
+def _rowid(kind, pk):
+    return pk * len(KINDS) + KINDS.index(kind)
+
+
+def _key(rowid):
+    pk, position = divmod(rowid, len(KINDS))
+    return KINDS[position], pk
+
+
+def _has_table(using):
+    connection = connections[using]
+    if connection.vendor != 'sqlite':
+        return False
+    name = connection.settings_dict['NAME']
+    if name not in _tables:
+        _tables[name] = SEARCH_TABLE in connection.introspection.table_names()
+    return _tables[name]
+
+
+def fts_enabled(using=DEFAULT_DB_ALIAS):
+    return settings.SEARCH_USE_FTS5 and _has_table(using)
+
+
+def _row(kind, pk, title, body):
+    return _rowid(kind, pk), ' '.join(terms(title)), ' '.join(terms(body))
+
+
+def index_document(kind, pk, title, body, using=DEFAULT_DB_ALIAS):
+    # The FTS table is written even while SEARCH_USE_FTS5 is off, so it
+    # is current whenever it gets switched on
+    if _has_table(using):
+        with connections[using].cursor() as cursor:
+            cursor.execute(f'DELETE FROM {SEARCH_TABLE} WHERE rowid = %s', [_rowid(kind, pk)])
+            cursor.execute(f'INSERT INTO {SEARCH_TABLE} (rowid, title, body) VALUES (%s, %s, %s)', _row(kind, pk, title, body))
+    invalidate_search_index()
+
+
+def remove_document(kind, pk, using=DEFAULT_DB_ALIAS):
+    if _has_table(using):
+        with connections[using].cursor() as cursor:
+            cursor.execute(f'DELETE FROM {SEARCH_TABLE} WHERE rowid = %s', [_rowid(kind, pk)])
+    invalidate_search_index()
+
+
+def index_photographer(profile):
+    index_document('photographer', profile.pk, *photographer_document(profile))
+
+
+def index_news(news):
+    index_document('news', news.pk, *news_document(news))
+
+
+def _documents(photographers, news):
+    for profile in photographers:
+        yield ('photographer', profile.pk, *photographer_document(profile))
+    for item in news:
+        yield ('news', item.pk, *news_document(item))
+
+
+def rebuild_index(photographers=None, news=None, using=DEFAULT_DB_ALIAS):
+    """
+    Re-creates the FTS table contents from scratch and returns the number of
+    documents. The migration passes querysets of its historical models.
+    """
+    if photographers is None:
+        photographers = PhotographerProfile.objects.using(using).select_related('user')
+    if news is None:
+        news = News.objects.using(using).all()
+    _tables.clear()
+    rows = [_row(*document) for document in _documents(photographers, news)]
+    if _has_table(using):
+        with connections[using].cursor() as cursor:
+            cursor.execute(f'DELETE FROM {SEARCH_TABLE}')
+            cursor.executemany(f'INSERT INTO {SEARCH_TABLE} (rowid, title, body) VALUES (%s, %s, %s)', rows)
+    invalidate_search_index()
+    return len(rows)
+
+
+class MemoryIndex:
+    """Inverted index of stems with BM25 ranking, for databases without FTS5."""
+
+    def __init__(self, documents):
+        self.postings = defaultdict(dict)
+        self.lengths = {}
+        for kind, pk, title, body in documents:
+            weights = Counter()
+            for term in terms(title):
+                weights[term] += TITLE_WEIGHT
+            for term in terms(body):
+                weights[term] += 1
+            self.lengths[kind, pk] = sum(weights.values())
+            for term, weight in weights.items():
+                self.postings[term][kind, pk] = weight
+        self.terms = sorted(self.postings)
+        self.average_length = sum(self.lengths.values()) / len(self.lengths) if self.lengths else 1
+
+    def expand(self, stem):
+        """Indexed terms that `stem` matches: itself and, if long enough, every term it starts."""
+        if len(stem) < MIN_PREFIX:
+            return [stem] if stem in self.postings else []
+        start = bisect.bisect_left(self.terms, stem)
+        matched = []
+        for term in self.terms[start:]:
+            if not term.startswith(stem):
+                break
+            matched.append(term)
+        return matched
+
+    def search(self, stems, kind=None):
+        """Returns (kind, pk) of the documents matching every stem, best first."""
+        scores = None
+        for stem in stems:
+            stem_scores = defaultdict(float)
+            for term in self.expand(stem):
+                postings = self.postings[term]
+                idf = math.log(1 + (len(self.lengths) - len(postings) + 0.5) / (len(postings) + 0.5))
+                for key, weight in postings.items():
+                    norm = weight + K1 * (1 - B + B * self.lengths[key] / self.average_length)
+                    stem_scores[key] += idf * weight * (K1 + 1) / norm
+            if scores is not None:
+                stem_scores = {key: score + scores[key] for key, score in stem_scores.items() if key in scores}
+            scores = stem_scores
+            if not scores:
+                return []
+        keys = [key for key in scores or () if kind is None or key[0] == kind]
+        return sorted(keys, key=lambda key: (-scores[key], -key[1]))
+
+
+def _load_memory_index():
+    return MemoryIndex(_documents(
+        PhotographerProfile.objects.select_related('user').iterator(),
+        News.objects.iterator(),
+    ))
+
+
+# Per-process copy of the index used without FTS5
+_memory_index = VersionedIndex(INDEX_VERSION_KEY, _load_memory_index)
+
+
+def invalidate_search_index():
+    _memory_index.invalidate()
+
+
+def get_memory_index():
+    return _memory_index.get()
+
+
+def _hydrate(keys):
+    by_kind = defaultdict(list)
+    for kind, pk in keys:
+        by_kind[kind].append(pk)
+    querysets = {'photographer': PhotographerProfile.objects.select_related('user'), 'news': News.objects.all()}
+    found = {kind: querysets[kind].in_bulk(pks) for kind, pks in by_kind.items()}
+    # A document deleted since it was ranked is skipped
+    return [Hit(kind, found[kind][pk]) for kind, pk in keys if pk in found[kind]]
+
+
+class SearchResults(ABC):
+    """
+    Ranked hits for a query, fetched one slice at a time, so they can be
+    handed to Paginator as they are.
+    """
+
+    def __init__(self, stems, kind=None, using=DEFAULT_DB_ALIAS):
+        self.stems = stems
+        self.kind = kind
+        self.using = using
+
+    @abstractmethod
+    def count(self):
+        """The number of matching documents."""
+
+    @abstractmethod
+    def ranked(self, offset, limit):
+        """(kind, pk) of the matching documents ranked offset to offset + limit."""
+
+    def __len__(self):
+        return self.count()
+
+    def __getitem__(self, index):
+        if not isinstance(index, slice):
+            return self[index:index + 1][0]
+        start = index.start or 0
+        stop = self.count() if index.stop is None else index.stop
+        if not self.stems or stop <= start:
+            return []
+        return _hydrate(self.ranked(start, stop - start))
+
+
+class FTSResults(SearchResults):
+    @cached_property
+    def match(self):
+        # Stems are \w+ only, so quoting them is all the escaping FTS5 needs
+        return ' '.join(f'"{stem}"*' if len(stem) >= MIN_PREFIX else f'"{stem}"' for stem in self.stems)
+
+    def _where(self):
+        where, params = f'{SEARCH_TABLE} MATCH %s', [self.match]
+        if self.kind:
+            where += ' AND rowid %% %s = %s'
+            params += [len(KINDS), KINDS.index(self.kind)]
+        return where, params
+
+    @cached_property
+    def _count(self):
+        if not self.stems:
+            return 0
+        where, params = self._where()
+        with connections[self.using].cursor() as cursor:
+            cursor.execute(f'SELECT count(*) FROM {SEARCH_TABLE} WHERE {where}', params)
+            return cursor.fetchone()[0]
+
+    def count(self):
+        return self._count
+
+    def ranked(self, offset, limit):
+        where, params = self._where()
+        with connections[self.using].cursor() as cursor:
+            cursor.execute(
+                f'SELECT rowid FROM {SEARCH_TABLE} WHERE {where} '
+                f'ORDER BY bm25({SEARCH_TABLE}, {TITLE_WEIGHT}, 1.0), rowid DESC LIMIT %s OFFSET %s',
+                params + [limit, offset],
+            )
+            return [_key(rowid) for rowid, in cursor.fetchall()]
+
+
+class MemoryResults(SearchResults):
+    @cached_property
+    def keys(self):
+        return get_memory_index().search(self.stems, self.kind) if self.stems else []
+
+    def count(self):
+        return len(self.keys)
+
+    def ranked(self, offset, limit):
+        return self.keys[offset:offset + limit]
+
+
+def search_documents(query, kind=None, using=DEFAULT_DB_ALIAS):
+    """Returns the SearchResults for `query`, optionally only of one of KINDS."""
+    stems = list(dict.fromkeys(terms(query)))
+    results = FTSResults if fts_enabled(using) else MemoryResults
+    return results(stems, kind, using)
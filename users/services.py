@@ -0,0 +1,194 @@
+from collections import defaultdict
+
+from django.db import transaction
+from django.db.models import Count, F, Q, Window
+from django.db.models.functions import RowNumber
+
+from .caching import versioned_key
+from .models import ArchivedBooking, BookingRequest, Photo, PhotographerProfile, normalize_city
+from .pagination import encode_cursor, keyset_page
+
+SPECIALISTS_ORDERING = {
+    'newest': ('-id',),
+    'price': ('price', 'id'),
+    'price_desc': ('-price', '-id'),
+    'views': ('-views_count', '-id'),
+}
+
+
+def upload_photos(photographer, files):
+    """
+    Stores a batch of uploaded images as queued photos.
+
+    All rows are inserted with one bulk_create in a single transaction; the
+    files are compressed afterwards by the image workers.
+    """
+    from .tasks import enqueue_photos
+
+    with transaction.atomic():
+        photos = Photo.objects.bulk_create(
+            Photo(photographer=photographer, image=image, status=Photo.STATUS_PROCESSING)
+            for image in files
+        )
+        enqueue_photos([photo.pk for photo in photos])
+    return photos
+
+
+def filter_photographers(params):
+    """
+    Applies the specialists filter panel to the photographer queryset.
+
+    Returns the queryset together with the normalized filters that were
+    actually applied, which callers use as a cache key.
+    """
+    photographers = PhotographerProfile.objects.select_related('user')
+    filters = {}
+
+    specialization = params.get('specialization')
+    if specialization and specialization != 'any':
+        filters['specialization'] = specialization
+
+    language = params.get('language')
+    if language and language != 'any':
+        filters['language'] = language
+
+    # Prefix match as a range on the indexed normalized column, so SQLite can
+    # seek instead of scanning with LIKE '%...%'
+    city = normalize_city(params.get('city'))
+    if city:
+        filters['city_normalized__gte'] = city
+        filters['city_normalized__lt'] = city + '\U0010ffff'
+
+    for param, lookup in (('price_min', 'price__gte'), ('price_max', 'price__lte')):
+        try:
+            filters[lookup] = int(params.get(param))
+        except (TypeError, ValueError):
+            pass
+
+    return photographers.filter(**filters), filters
+
+
+def filters_cache_key(prefix, filters):
+    # On the photographers version too, so counts drop as soon as a profile changes
+    return versioned_key(prefix, ('photographers',), *(f'{key}={value}' for key, value in sorted(filters.items())))
+
+
+def attach_portfolio_previews(photographers, count=3):
+    """
+    Sets `preview_photos` on every photographer to their `count` latest photos.
+
+    All previews are loaded with one windowed query instead of a
+    `photographer.photos.all` query per card.
+    """
+    photographers = list(photographers)
+    previews = defaultdict(list)
+    if photographers:
+        photos = (
+            Photo.objects
+            .filter(photographer__in=[p.pk for p in photographers], status=Photo.STATUS_READY)
+            .annotate(row_number=Window(
+                RowNumber(),
+                partition_by=F('photographer_id'),
+                order_by=[F('uploaded_at').desc(), F('id').desc()],
+            ))
+            .filter(row_number__lte=count)
+            .order_by('photographer_id', 'row_number')
+        )
+        for photo in photos:
+            previews[photo.photographer_id].append(photo)
+
+    for photographer in photographers:
+        photographer.preview_photos = previews[photographer.pk]
+    return photographers
+
+
+BOOKING_PAGE_SIZE = 20
+# Prefix of the archive cursors of earlier versions; they hold a plain position
+ARCHIVE_CURSOR_PREFIX = 'archive-'
+
+
+def booking_history(user, profile, box, cursor=None, page_size=BOOKING_PAGE_SIZE):
+    """
+    Returns one page of completed bookings for the 'received' or 'sent' box
+    and the cursor of the next page.
+
+    Pages run newest first through BookingRequest and ArchivedBooking
+    together. The archive isn't simply older than the hot table (a booking
+    made long ago may be completed after an archive run), so every page
+    takes the next rows of both tables and merges them by (created_at, id);
+    archived rows keep their original ids, so the pair is unique across both.
+    """
+    if box == 'received':
+        if profile is None:
+            return [], None
+        side = {'photographer': profile, 'is_deleted_by_photographer': False}
+    else:
+        side = {'client': user, 'is_deleted_by_client': False}
+
+    cursor = cursor and cursor.removeprefix(ARCHIVE_CURSOR_PREFIX)
+    hot = BookingRequest.objects.filter(status='completed', **side).select_related('client', 'photographer__user')
+    archived = ArchivedBooking.objects.filter(**side).select_related('client', 'photographer__user')
+    hot_items, hot_more = keyset_page(hot, cursor, page_size, 'created_at')
+    archived_items, archived_more = keyset_page(archived, cursor, page_size, 'created_at')
+
+    merged = sorted(hot_items + archived_items, key=lambda booking: (booking.created_at, booking.pk), reverse=True)
+    items = merged[:page_size]
+    if len(merged) > page_size or hot_more or archived_more:
+        return items, encode_cursor(items[-1].created_at, items[-1].pk)
+    return items, None
+
+
+def build_dashboard(user, profile=None):
+    """
+    Collects everything the dashboard page shows for `user` (and their
+    photographer `profile`, if any) in a fixed number of queries.
+    """
+    # Clients have no received bookings; pk IS NULL matches nothing
+    received = Q(photographer=profile, is_deleted_by_photographer=False) if profile else Q(pk__isnull=True)
+    sent = Q(client=user, is_deleted_by_client=False)
+    completed = Q(status='completed')
+
+    # Active received and sent bookings in one query, split up in Python
+    bookings = (
+        BookingRequest.objects
+        .filter(received | sent)
+        .exclude(completed)
+        .select_related('client', 'photographer__user')
+        .order_by('-created_at')
+    )
+    data = {
+        'received_active_bookings': [],
+        'sent_active_bookings': [],
+    }
+    for booking in bookings:
+        if profile and booking.photographer_id == profile.pk and not booking.is_deleted_by_photographer:
+            data['received_active_bookings'].append(booking)
+        if booking.client_id == user.pk and not booking.is_deleted_by_client:
+            data['sent_active_bookings'].append(booking)
+
+    # Completed bookings pile up, so only their first page is rendered;
+    # the rest is loaded through the dashboard_bookings endpoint
+    data['received_completed_bookings'], data['received_completed_cursor'] = booking_history(user, profile, 'received')
+    data['sent_completed_bookings'], data['sent_completed_cursor'] = booking_history(user, profile, 'sent')
+
+    # All counters from a single conditional aggregate per table; archived
+    # bookings are all completed, and are listed with the completed ones
+    counts = BookingRequest.objects.filter(received | sent).aggregate(
+        received_active=Count('pk', filter=received & ~completed),
+        received_completed=Count('pk', filter=received & completed),
+        received_total=Count('pk', filter=received),
+        sent_active=Count('pk', filter=sent & ~completed),
+        sent_completed=Count('pk', filter=sent & completed),
+    )
+    archived = ArchivedBooking.objects.filter(received | sent).aggregate(
+        received_completed=Count('pk', filter=received),
+        received_total=Count('pk', filter=received),
+        sent_completed=Count('pk', filter=sent),
+    )
+    for key, count in archived.items():
+        counts[key] += count
+    data['booking_counts'] = counts
+
+    data['photos'] = list(profile.photos.order_by('-uploaded_at')) if profile else []
+    data['photo_count'] = len(data['photos'])
+    return data
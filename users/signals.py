@@ -0,0 +1,88 @@
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .caching import bump_version
+from .cities import invalidate_city_index
+from .featured import forget_featured_photo
+from .models import ClientProfile, Favorite, News, PhotographerProfile, Photo
+from . import search
+from .storage import is_content_addressed
+
+
+@receiver([post_save, post_delete], sender=PhotographerProfile)
+def photographer_profile_changed(sender, instance, **kwargs):
+    bump_version('photographers')
+
+    update_fields = kwargs.get('update_fields')
+    if update_fields and 'city' not in update_fields:
+        return
+    invalidate_city_index()
+
+
+@receiver([post_save, post_delete], sender=Photo)
+def photo_changed(sender, instance, **kwargs):
+    bump_version('photos')
+    # New photos can wait for the next pool; gone or hidden ones can't
+    if kwargs.get('signal') is post_delete or instance.status != Photo.STATUS_READY:
+        forget_featured_photo(instance.pk)
+
+
+@receiver([post_save, post_delete], sender=News)
+def news_changed(sender, instance, **kwargs):
+    bump_version('news')
+
+
+@receiver(post_save, sender=PhotographerProfile)
+def index_photographer(sender, instance, update_fields=None, **kwargs):
+    if update_fields and not search.PHOTOGRAPHER_FIELDS.intersection(update_fields):
+        return
+    search.index_photographer(instance)
+
+
+@receiver(post_save, sender=User)
+def index_photographer_name(sender, instance, created, update_fields=None, **kwargs):
+    # Logins save last_login only; names are part of the photographer's document
+    if created or (update_fields and not search.USER_FIELDS.intersection(update_fields)):
+        return
+    profile = PhotographerProfile.objects.filter(user=instance).first()
+    if profile is not None:
+        # Cached cards and pages show the name too
+        bump_version('photographers')
+        profile.user = instance
+        search.index_photographer(profile)
+
+
+@receiver(post_save, sender=News)
+def index_news(sender, instance, **kwargs):
+    search.index_news(instance)
+
+
+@receiver(post_delete, sender=PhotographerProfile)
+def unindex_photographer(sender, instance, **kwargs):
+    search.remove_document('photographer', instance.pk)
+
+
+@receiver(post_delete, sender=News)
+def unindex_news(sender, instance, **kwargs):
+    search.remove_document('news', instance.pk)
+
+
+@receiver([post_save, post_delete], sender=Favorite)
+def favorite_changed(sender, instance, **kwargs):
+    bump_version('favorites')
+
+
+@receiver(post_delete, sender=Photo)
+@receiver(post_delete, sender=News)
+@receiver(post_delete, sender=PhotographerProfile)
+@receiver(post_delete, sender=ClientProfile)
+def release_uploads(sender, instance, **kwargs):
+    # Content-addressed uploads are shared: drop this row's reference once
+    # the delete is committed; the file goes with its last reference
+    for field in instance._meta.fields:
+        if field.name in ('image', 'profile_image'):
+            file = getattr(instance, field.attname)
+            if file and is_content_addressed(file.name):
+                transaction.on_commit(lambda file=file: file.storage.delete(file.name))
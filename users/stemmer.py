@@ -0,0 +1,110 @@
+"""
+Russian stemmer (the Snowball algorithm) used by the search index.
+
+Part of the app rather than an optional dependency: the index stores stems,
+so documents and queries must always be stemmed by the same code.
+https://snowballstem.org/algorithms/russian/stemmer.html
+"""
+import re
+from functools import lru_cache
+
+VOWELS = 'аеиоуыэюя'
+
+
+def _endings(preceded, plain=()):
+    # (ending, must follow а/я) pairs, longest first: the longest ending wins
+    pairs = [(ending, True) for ending in preceded] + [(ending, False) for ending in plain]
+    return sorted(pairs, key=lambda pair: -len(pair[0]))
+
+
+PERFECTIVE_GERUND = _endings(['в', 'вши', 'вшись'], ['ив', 'ивши', 'ившись', 'ыв', 'ывши', 'ывшись'])
+ADJECTIVE = _endings([], [
+    'ее', 'ие', 'ые', 'ое', 'ими', 'ыми', 'ей', 'ий', 'ый', 'ой', 'ем', 'им', 'ым', 'ом',
+    'его', 'ого', 'ему', 'ому', 'их', 'ых', 'ую', 'юю', 'ая', 'яя', 'ою', 'ею',
+])
+PARTICIPLE = _endings(['ем', 'нн', 'вш', 'ющ', 'щ'], ['ивш', 'ывш', 'ующ'])
+REFLEXIVE = _endings([], ['ся', 'сь'])
+VERB = _endings(
+    ['ла', 'на', 'ете', 'йте', 'ли', 'й', 'л', 'ем', 'н', 'ло', 'но', 'ет', 'ют', 'ны', 'ть', 'ешь', 'нно'],
+    ['ила', 'ыла', 'ена', 'ейте', 'уйте', 'ите', 'или', 'ыли', 'ей', 'уй', 'ил', 'ыл', 'им', 'ым', 'ен',
+     'ило', 'ыло', 'ено', 'ят', 'ует', 'уют', 'ит', 'ыт', 'ены', 'ить', 'ыть', 'ишь', 'ую', 'ю'],
+)
+NOUN = _endings([], [
+    'а', 'ев', 'ов', 'ие', 'ье', 'е', 'иями', 'ями', 'ами', 'еи', 'ии', 'и', 'ией', 'ей', 'ой', 'ий', 'й',
+    'иям', 'ям', 'ием', 'ем', 'ам', 'ом', 'о', 'у', 'ах', 'иях', 'ях', 'ы', 'ь', 'ию', 'ью', 'ю', 'ия', 'ья', 'я',
+])
+DERIVATIONAL = _endings([], ['ост', 'ость'])
+SUPERLATIVE = _endings([], ['ейш', 'ейше'])
+
+CYRILLIC_RE = re.compile('[а-я]')
+
+
+def _regions(word):
+    """Returns the start of RV (after the first vowel) and of R2."""
+    rv = next((i + 1 for i, ch in enumerate(word) if ch in VOWELS), len(word))
+    r1 = _after_vowel_consonant(word, 0)
+    return rv, _after_vowel_consonant(word, r1)
+
+
+def _after_vowel_consonant(word, start):
+    for i in range(start + 1, len(word)):
+        if word[i] not in VOWELS and word[i - 1] in VOWELS:
+            return i + 1
+    return len(word)
+
+
+def _remove(word, start, endings):
+    """Strips the longest of `endings` that lies after `start`; None if there is none."""
+    for ending, after_a in endings:
+        cut = len(word) - len(ending)
+        if cut >= start and word.endswith(ending):
+            if after_a and not (cut - 1 >= start and word[cut - 1] in 'ая'):
+                return None
+            return word[:cut]
+    return None
+
+
+# Texts share most of their words, so stemming each distinct word once pays off
+@lru_cache(maxsize=100_000)
+def stem(word):
+    word = word.lower().replace('ё', 'е')
+    if not CYRILLIC_RE.search(word):
+        return word
+    rv, r2 = _regions(word)
+
+    # Step 1: one inflectional ending
+    stemmed = _remove(word, rv, PERFECTIVE_GERUND)
+    if stemmed is None:
+        reflexive = _remove(word, rv, REFLEXIVE)
+        if reflexive is not None:
+            word = reflexive
+        stemmed = _remove(word, rv, ADJECTIVE)
+        if stemmed is not None:
+            participle = _remove(stemmed, rv, PARTICIPLE)
+            if participle is not None:
+                stemmed = participle
+        else:
+            stemmed = _remove(word, rv, VERB)
+            if stemmed is None:
+                stemmed = _remove(word, rv, NOUN)
+    if stemmed is not None:
+        word = stemmed
+
+    # Step 2
+    if word.endswith('и') and len(word) - 1 >= rv:
+        word = word[:-1]
+
+    # Step 3: derivational ending in R2
+    stemmed = _remove(word, r2, DERIVATIONAL)
+    if stemmed is not None:
+        word = stemmed
+
+    # Step 4
+    stemmed = _remove(word, rv, SUPERLATIVE)
+    if stemmed is not None:
+        word = stemmed
+    if word.endswith('нн') and len(word) - 2 >= rv:
+        word = word[:-1]
+    elif stemmed is None and word.endswith('ь') and len(word) - 1 >= rv:
+        word = word[:-1]
+    return word
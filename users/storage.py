@@ -0,0 +1,155 @@
+import gzip
+import hashlib
+import os
+import posixpath
+import re
+
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage
+from django.db import IntegrityError, transaction
+from django.db.models import F
+
+try:
+    import brotli
+except ImportError:  # optional: only gzip variants are written without it
+    brotli = None
+
+# Images and fonts are already compressed; precompressing them gains nothing
+COMPRESSIBLE_EXTENSIONS = {'.css', '.js', '.svg', '.txt', '.html', '.json', '.xml', '.map', '.ico'}
+
+
+class PrecompressedManifestStaticFilesStorage(ManifestStaticFilesStorage):
+    """
+    Manifest storage that also writes .gz (and .br, when brotli is installed)
+    next to every hashed text file at collectstatic time, so the asset view
+    can send them as-is instead of compressing on each request.
+    """
+
+    def post_process(self, paths, dry_run=False, **options):
+        # CSS is processed in several passes; only compress the final names
+        final_names = {}
+        for name, hashed_name, processed in super().post_process(paths, dry_run, **options):
+            if hashed_name and not isinstance(processed, Exception):
+                final_names[name] = hashed_name
+            yield name, hashed_name, processed
+
+        if not dry_run:
+            for hashed_name in final_names.values():
+                self._precompress(hashed_name)
+
+    def _precompress(self, name):
+        if os.path.splitext(name)[1].lower() not in COMPRESSIBLE_EXTENSIONS:
+            return
+        path = self.path(name)
+        with open(path, 'rb') as source:
+            content = source.read()
+
+        variants = [('.gz', gzip.compress(content, compresslevel=9, mtime=0))]
+        if brotli is not None:
+            variants.append(('.br', brotli.compress(content)))
+        for suffix, compressed in variants:
+            # Tiny files can come out larger; the asset view falls back to the original
+            if len(compressed) < len(content):
+                with open(path + suffix, 'wb') as output:
+                    output.write(compressed)
+
+
+# <upload dir>/<first two hex digits>/<sha256 of the bytes><ext>
+CONTENT_NAME_RE = re.compile(r'(?:^|/)([0-9a-f]{2})/\1[0-9a-f]{62}\.\w+$')
+
+
+def is_content_addressed(name):
+    return bool(name and CONTENT_NAME_RE.search(name))
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    """
+    Stores uploads under the SHA-256 of their bytes, so identical files
+    share one copy on disk.
+
+    Every save() of the same bytes adds a reference and every delete()
+    drops one; the file is removed with its last reference (counted in
+    StoredFile). Names are never reused for different content, which makes
+    them safe to cache forever.
+
+    StoredFile also remembers which compressed file a raw upload turned
+    into, so the image workers can skip compressing bytes they have seen
+    before (see reuse_compressed()). Files stored under older, non-hashed
+    names are deleted as before.
+    """
+
+    def save(self, name, content, max_length=None):
+        if name is None:
+            name = content.name
+        if not hasattr(content, 'chunks'):
+            content = File(content, name)
+
+        digest = hashlib.sha256()
+        for chunk in content.chunks():
+            digest.update(chunk)
+        digest = digest.hexdigest()
+        ext = os.path.splitext(name)[1].lower()
+        target = posixpath.join(posixpath.dirname(name), digest[:2], digest + ext)
+
+        # Reference first: a concurrent delete() of the last reference then
+        # either finishes before this (and the file is written again below)
+        # or sees this reference and keeps the file
+        self._add_reference(target)
+        if not self.exists(target):
+            saved = self._save(target, content)
+            if saved != target:
+                # The same bytes were written concurrently under the target name
+                super().delete(saved)
+        return target
+
+    def delete(self, name):
+        if not is_content_addressed(name):
+            return super().delete(name)
+        from .models import StoredFile
+        with transaction.atomic():
+            StoredFile.objects.filter(name=name, refs__gt=0).update(refs=F('refs') - 1)
+            refs = StoredFile.objects.filter(name=name).values_list('refs', flat=True).first()
+            if not refs:
+                super().delete(name)
+
+    def add_reference(self, name, count=1):
+        """Takes `count` more references to a stored file. Returns False if it no longer exists."""
+        self._add_reference(name, count)
+        if self.exists(name):
+            return True
+        self.delete(name)
+        return False
+
+    def reuse_compressed(self, name):
+        """
+        Returns the compressed file previously made from the raw upload
+        `name`, with a new reference taken, or None if it has to be compressed.
+        """
+        from .models import StoredFile
+        compressed = StoredFile.objects.filter(name=name).exclude(compressed='').values_list('compressed', flat=True).first()
+        if compressed and self.add_reference(compressed):
+            return compressed
+        return None
+
+    def remember_compressed(self, name, compressed):
+        from .models import StoredFile
+        StoredFile.objects.filter(name=name).update(compressed=compressed)
+
+    def _add_reference(self, name, count=1):
+        from .models import StoredFile
+        if StoredFile.objects.filter(name=name).update(refs=F('refs') + count):
+            return
+        try:
+            with transaction.atomic():
+                StoredFile.objects.create(name=name, refs=count)
+        except IntegrityError:
+            # Created concurrently
+            StoredFile.objects.filter(name=name).update(refs=F('refs') + count)
+
+
+upload_storage = ContentAddressedStorage()
+
+
+def get_upload_storage():
+    return upload_storage
@@ -0,0 +1,298 @@
+"""
+Background image processing.
+
+Uploads are stored raw and compressed off the request by a local thread
+pool (IMAGE_WORKERS threads per process). Photos waiting for compression
+are kept in the database with status "processing", so the table itself is
+the queue: anything the pool didn't finish (restart, crash, IMAGE_WORKERS = 0)
+is picked up by `manage.py process_images`.
+
+Multi-photo uploads are compressed in parallel on a process pool
+(IMAGE_PROCESSES processes) and written back with one bulk update.
+
+Uploads are content-addressed (users.storage), so bytes that were already
+compressed once are not compressed again: the stored result is reused.
+"""
+import logging
+import multiprocessing
+import os
+import tempfile
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from django.apps import apps
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files import File
+from django.db import connections, transaction
+from django.utils import timezone
+
+from .caching import bump_version
+from .images import compress_image, compress_to_path
+from .metrics import image_timer
+from .models import Photo
+from .renditions import build_renditions, get_rendition_sources, rendition_key
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+_process_pool = None
+_executor_lock = threading.Lock()
+
+
+class ImageProcessingError(Exception):
+    pass
+
+
+def _get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=settings.IMAGE_WORKERS,
+                thread_name_prefix='image-worker',
+            )
+    return _executor
+
+
+def _run(func, *args):
+    try:
+        func(*args)
+    except Exception:
+        logger.exception("Image task %s%r failed", func.__name__, args)
+    finally:
+        # Worker threads open their own connections; don't leak them
+        connections.close_all()
+
+
+def _submit(func, *args):
+    """Runs `func` on the worker pool. Returns False if the pool is disabled."""
+    if not settings.IMAGE_WORKERS:
+        return False
+    _get_executor().submit(_run, func, *args)
+    return True
+
+
+def enqueue_photos(photo_ids):
+    photo_ids = list(photo_ids)
+    transaction.on_commit(lambda: _submit(process_photos, photo_ids))
+
+
+def enqueue_profile_image(profile):
+    label, pk = profile._meta.label, profile.pk
+
+    def dispatch():
+        if _submit(process_profile_image, label, pk):
+            return
+        # No worker pool: compress in the request, as before
+        try:
+            process_profile_image(label, pk)
+        except Exception:
+            logger.exception("Failed to process profile image of %s %s", label, pk)
+
+    transaction.on_commit(dispatch)
+
+
+def compress_stored_image(field_file, quality, max_width):
+    """Compresses an already stored image into a new file and returns the new name."""
+    storage = field_file.storage
+    known = storage.reuse_compressed(field_file.name)
+    if known:
+        return known
+
+    raw_name = field_file.name
+    with field_file.open('rb'):
+        compressed = compress_image(field_file, quality=quality, max_width=max_width)
+    if compressed is field_file:
+        raise ImageProcessingError(f"Could not compress {field_file.name}")
+
+    # FieldFile.save() runs upload_to again, so pass only the base name
+    field_file.save(os.path.basename(compressed.name), compressed, save=False)
+    storage.remember_compressed(raw_name, field_file.name)
+    return field_file.name
+
+
+def _get_process_pool():
+    global _process_pool
+    with _executor_lock:
+        if _process_pool is None:
+            # spawn, not fork: the parent is a threaded web server process
+            _process_pool = ProcessPoolExecutor(
+                max_workers=settings.IMAGE_PROCESSES,
+                mp_context=multiprocessing.get_context('spawn'),
+            )
+    return _process_pool
+
+
+def compress_batch(jobs):
+    """
+    Runs compress_to_path() for every (source_path, target_path, quality, max_width)
+    job and returns a list with the output size or the raised exception per job.
+
+    Batches are spread over a process pool of IMAGE_PROCESSES processes, so
+    decoding and encoding use every core instead of one thread.
+    """
+    with image_timer('compress_batch'):
+        return _compress_batch(jobs)
+
+
+def _compress_batch(jobs):
+    futures = []
+    if len(jobs) > 1 and settings.IMAGE_PROCESSES > 1:
+        try:
+            pool = _get_process_pool()
+            for job in jobs:
+                futures.append(pool.submit(compress_to_path, *job))
+        except Exception:
+            # Whatever couldn't be submitted is compressed in this thread instead
+            logger.exception("Image process pool unavailable")
+            _reset_process_pool()
+
+    results = []
+    for i, job in enumerate(jobs):
+        try:
+            results.append(futures[i].result() if i < len(futures) else compress_to_path(*job))
+        except BrokenProcessPool as e:
+            _reset_process_pool()
+            results.append(e)
+        except Exception as e:
+            results.append(e)
+    return results
+
+
+def _reset_process_pool():
+    global _process_pool
+    with _executor_lock:
+        _process_pool = None
+
+
+def process_photos(photo_ids):
+    photos = list(Photo.objects.filter(pk__in=photo_ids, status=Photo.STATUS_PROCESSING))
+    if not photos:
+        return
+
+    storage = photos[0].image.storage
+    raw_names = {photo.pk: photo.image.name for photo in photos}
+    done, failed = [], []
+
+    # Identical uploads (same raw name) share one compression job, and
+    # uploads compressed before reuse the stored result
+    groups = {}
+    for photo in photos:
+        known = storage.reuse_compressed(photo.image.name)
+        if known:
+            photo.image.name = known
+            done.append(photo)
+        else:
+            groups.setdefault(photo.image.name, []).append(photo)
+
+    jobs = []
+    for raw_name in groups:
+        fd, temp_path = tempfile.mkstemp(suffix='.jpg')
+        os.close(fd)
+        jobs.append((storage.path(raw_name), temp_path, Photo.IMAGE_QUALITY, Photo.IMAGE_MAX_WIDTH))
+
+    results = compress_batch(jobs) if jobs else []
+    for (raw_name, group), job, result in zip(groups.items(), jobs, results):
+        temp_path = job[1]
+        try:
+            if isinstance(result, Exception):
+                logger.error("Failed to process photo(s) %s: %s", [photo.pk for photo in group], result)
+                failed.extend(photo.pk for photo in group)
+                continue
+            with open(temp_path, 'rb') as output:
+                name = storage.save(group[0].image.field.generate_filename(group[0], 'photo.jpg'), File(output))
+            storage.remember_compressed(raw_name, name)
+            for i, photo in enumerate(group):
+                # save() took the first reference; the rest share the file
+                if i:
+                    storage.add_reference(name)
+                photo.image.name = name
+                done.append(photo)
+        finally:
+            os.remove(temp_path)
+
+    for photo in done:
+        photo.status = Photo.STATUS_READY
+
+    # bulk_update() and update() skip auto_now, so stamp updated_at by hand
+    now = timezone.now()
+    for photo in done:
+        photo.updated_at = now
+
+    with transaction.atomic():
+        # Skip rows that another worker finished (or that were re-uploaded) meanwhile
+        queued = dict(
+            Photo.objects
+            .filter(pk__in=[photo.pk for photo in done], status=Photo.STATUS_PROCESSING)
+            .values_list('pk', 'image')
+        )
+        fresh = [photo for photo in done if queued.get(photo.pk) == raw_names[photo.pk]]
+        Photo.objects.bulk_update(fresh, ['image', 'status', 'updated_at'])
+        Photo.objects.filter(pk__in=failed, status=Photo.STATUS_PROCESSING).update(
+            status=Photo.STATUS_FAILED, updated_at=now,
+        )
+
+    fresh_ids = {photo.pk for photo in fresh}
+    for photo in done:
+        storage.delete(raw_names[photo.pk] if photo.pk in fresh_ids else photo.image.name)
+
+    for name in {photo.image.name for photo in fresh}:
+        # Reused files usually have their renditions already
+        if get_rendition_sources(name) is None:
+            _build_renditions(name)
+
+    # bulk_update() sends no post_save, so drop cached pages by hand
+    if fresh or failed:
+        bump_version('photos')
+
+
+def process_pending_photos(limit=100):
+    """Processes up to `limit` queued photos and returns how many were picked up."""
+    photo_ids = list(
+        Photo.objects
+        .filter(status=Photo.STATUS_PROCESSING)
+        .order_by('uploaded_at')
+        .values_list('id', flat=True)[:limit]
+    )
+    if photo_ids:
+        process_photos(photo_ids)
+    return len(photo_ids)
+
+
+def process_profile_image(model_label, pk):
+    model = apps.get_model(model_label)
+    profile = model.objects.filter(pk=pk).first()
+    if profile is None or not profile.profile_image:
+        return
+
+    raw_name = profile.profile_image.name
+    storage = profile.profile_image.storage
+    new_name = compress_stored_image(profile.profile_image, model.IMAGE_QUALITY, model.IMAGE_MAX_WIDTH)
+
+    # update() rather than save() so the compressed file isn't queued again
+    changes = {'profile_image': new_name}
+    if hasattr(model, 'updated_at'):
+        changes['updated_at'] = timezone.now()
+    if model.objects.filter(pk=pk, profile_image=raw_name).update(**changes):
+        storage.delete(raw_name)
+        _build_renditions(new_name)
+        bump_version('photographers')
+    else:
+        storage.delete(new_name)
+
+
+def _build_renditions(name):
+    try:
+        with image_timer('renditions'):
+            build_renditions(name)
+    except Exception:
+        logger.exception("Failed to build renditions of %s", name)
+
+
+def enqueue_renditions(name):
+    """Schedules rendition generation for an image that doesn't have any yet."""
+    # Many pages can ask for the same image at once; only queue it once
+    if cache.add(f"renditions-pending:{rendition_key(name)}", True, 300):
+        _submit(_build_renditions, name)
@@ -0,0 +1,51 @@
+from django import template
+from django.utils.html import format_html, format_html_join
+
+from users.renditions import get_rendition_sources, get_renditions
+from users.tasks import enqueue_renditions
+
+register = template.Library()
+
+
+@register.simple_tag
+def responsive_img(image, sizes='100vw', width=800, **attrs):
+    """
+    Renders an <img> with a srcset of the image's renditions, wrapped in a
+    <picture> with AVIF/WebP sources when those have been generated.
+
+    `sizes` is passed through to the browser; `width` picks the rendition
+    used as the plain `src` for browsers without srcset support. Images
+    without renditions yet fall back to the original file and get queued.
+    """
+    if not image:
+        return ''
+
+    renditions = get_renditions(image.name)
+    sources = get_rendition_sources(image.name) if renditions else None
+    if renditions is None or sources is None:
+        # Never built, or built before the current RENDITION_FORMATS
+        enqueue_renditions(image.name)
+
+    attrs.setdefault('loading', 'lazy')
+    extra = format_html_join('', ' {}="{}"', attrs.items())
+    if not renditions or len(renditions) == 1:
+        img = format_html('<img src="{}"{}>', image.url, extra)
+    else:
+        widths = sorted(renditions)
+        src = renditions[next((w for w in widths if w >= width), widths[-1])]
+        img = format_html('<img src="{}" srcset="{}" sizes="{}"{}>', src, _srcset(renditions), sizes, extra)
+    if not sources:
+        return img
+
+    # The browser takes the first <source> whose type it supports
+    return format_html(
+        '<picture>{}{}</picture>',
+        format_html_join('', '<source type="{}" srcset="{}" sizes="{}">', (
+            (mime, _srcset(urls), sizes) for mime, urls in sources
+        )),
+        img,
+    )
+
+
+def _srcset(renditions):
+    return ', '.join(f"{renditions[w]} {w}w" for w in sorted(renditions))
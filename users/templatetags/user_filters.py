@@ -1,27 +1,24 @@
 from django import template
-from users.models import PhotographerProfile, ClientProfile
+from users.avatars import BRAND_BACKGROUND, avatar_url
+from users.counters import pending_views
+from users.profiles import get_profile
 
 register = template.Library()
 
 @register.filter
 def get_avatar_url(user):
-    # Check for photographer profile
-    try:
-        if hasattr(user, 'photographerprofile'):
-            profile = user.photographerprofile
-            if profile.profile_image:
-                return profile.profile_image.url
-    except Exception:
-        pass
+    # At most one query, and none for request.user (see users.profiles)
+    profile = get_profile(user)
+    if profile is not None and profile.profile_image:
+        return profile.profile_image.url
+    return avatar_url(user.get_full_name() or user.username)
 
-    # Check for client profile
-    try:
-        if hasattr(user, 'clientprofile'):
-            profile = user.clientprofile
-            if profile.profile_image:
-                return profile.profile_image.url
-    except Exception:
-        pass
-        
-    name = user.get_full_name() or user.username
-    return f"https://ui-avatars.com/api/?name={name}&background=e0bbd8&color=fff"
+@register.filter
+def initials_avatar(name, background=BRAND_BACKGROUND):
+    # {{ name|initials_avatar:"random" }} picks a per-name colour
+    return avatar_url(name, background)
+
+@register.filter
+def views_count(photographer):
+    # Includes views still waiting in this process's buffer
+    return photographer.views_count + pending_views(photographer.pk)
@@ -1,3 +1,929 @@
-from django.test import TestCase
+import tempfile
+import threading
+from datetime import timedelta
+from io import BytesIO, StringIO
+from pathlib import Path
+from unittest import mock
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.auth import BACKEND_SESSION_KEY
+from django.contrib.auth.models import User
+from django.core.cache import cache, caches
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.http import HttpResponse
+from django.db import connection
+from django.db.models import F
+from django.db.models.query import QuerySet
+from django.template import Context, Template
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from PIL import Image
+
+from .assets import serve_media
+from .caching import get_versions
+from .counters import discard_views, flush_views, pending_views, record_view
+from .featured import get_featured_photos, get_featured_pool
+from . import images
+from .images import _MemoryBudget, compress_image, encode_jpeg
+from .metrics import REQUESTS
+from .pagination import encode_cursor, keyset_page
+from .models import ArchivedBooking, BookingRequest, ClientProfile, News, PhotographerProfile, Photo, StoredFile, normalize_city
+from .renditions import build_renditions, get_renditions
+from .search import fts_enabled, search_documents
+from .services import booking_history, filter_photographers, upload_photos
+from .tasks import _run, process_pending_photos, process_photos
+from .transactions import write_transaction
+from .views import GALLERY_PAGE_SIZE
+from .templatetags.user_filters import get_avatar_url
+
+
+def clear_caches():
+    for backend in caches.all():
+        backend.clear()
+
+
+def create_photographer(username, photos=0, **kwargs):
+    user = User.objects.create_user(username=username, password='password123')
+    profile = PhotographerProfile.objects.create(
+        user=user, **{'short_intro': 'Фотограф', 'bio': 'Био', **kwargs}
+    )
+    # bulk_create skips Photo.save(), which would try to open the image file
+    Photo.objects.bulk_create(
+        Photo(photographer=profile, image=f'photographs/{username}_{i}.jpg')
+        for i in range(photos)
+    )
+    return profile
+
+
+# No background image workers: test photos have no files behind them
+@override_settings(IMAGE_WORKERS=0)
+class SpecialistsQueryTests(TestCase):
+    def count_queries(self, url):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(queries)
+
+    def test_query_count_does_not_grow_with_results(self):
+        for i in range(2):
+            create_photographer(f'small_{i}', photos=4)
+        small = self.count_queries(reverse('specialists'))
+
+        for i in range(8):
+            create_photographer(f'large_{i}', photos=4)
+        large = self.count_queries(reverse('specialists'))
+
+        self.assertEqual(small, large)
+
+    def test_previews_limited_to_three_latest(self):
+        profile = create_photographer('preview', photos=5)
+        response = self.client.get(reverse('specialists'))
+        card = next(p for p in response.context['photographers'] if p.pk == profile.pk)
+
+        latest = list(profile.photos.order_by('-uploaded_at', '-id')[:3])
+        self.assertEqual(card.preview_photos, latest)
+
+    def test_match_count_is_cached_until_photographers_change(self):
+        clear_caches()
+        for i in range(3):
+            create_photographer(f'counted_{i}', specialization='portrait')
+        # Signed in, so the page cache doesn't hide the queries
+        self.client.force_login(User.objects.create_user(username='visitor'))
+        url = reverse('specialists') + '?specialization=portrait'
+        headers = {'x-requested-with': 'XMLHttpRequest'}
+
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.client.get(url, headers=headers).json()['count'], 3)
+        with self.assertNumQueries(len(queries) - 1):
+            self.assertEqual(self.client.get(url, headers=headers).json()['count'], 3)
+
+        create_photographer('counted_new', specialization='portrait')
+        with self.assertNumQueries(len(queries)):
+            self.assertEqual(self.client.get(url, headers=headers).json()['count'], 4)
+
+
+@override_settings(IMAGE_WORKERS=0)
+class CityFilterTests(TestCase):
+    def setUp(self):
+        clear_caches()
+        self.orel = create_photographer('orel', city='  Орёл ')
+        self.oren = create_photographer('oren', city='Оренбург')
+        self.moscow = create_photographer('moscow', city='Москва')
+
+    def filtered(self, city):
+        photographers, _ = filter_photographers({'city': city})
+        return set(photographers.values_list('pk', flat=True))
+
+    def test_normalize_city(self):
+        self.assertEqual(normalize_city('  Нижний   НОВГОРОД '), 'нижний новгород')
+        self.assertEqual(normalize_city('Орёл'), 'орел')
+        self.assertEqual(normalize_city(None), '')
+        self.assertEqual(self.orel.city_normalized, 'орел')
+
+    def test_prefix_match(self):
+        self.assertEqual(self.filtered('ОРЕЛ'), {self.orel.pk})
+        self.assertEqual(self.filtered('ор'), {self.orel.pk, self.oren.pk})
+        self.assertEqual(self.filtered('Орё'), {self.orel.pk, self.oren.pk})
+        self.assertEqual(self.filtered('орел'), {self.orel.pk})
+        self.assertEqual(self.filtered('москва'), {self.moscow.pk})
+        # Only prefixes: no match in the middle of a name
+        self.assertEqual(self.filtered('ква'), set())
+        self.assertEqual(self.filtered('  '), {self.orel.pk, self.oren.pk, self.moscow.pk})
+
+    def test_autocomplete(self):
+        response = self.client.get(reverse('city_autocomplete'), {'q': 'ОР'})
+        self.assertEqual(response.json(), {'cities': ['Орёл', 'Оренбург']})
+        self.assertEqual(self.client.get(reverse('city_autocomplete'), {'q': 'орел'}).json(), {'cities': ['Орёл']})
+        self.assertEqual(self.client.get(reverse('city_autocomplete')).json(), {'cities': []})
+
+        # New cities show up once the index is invalidated by the save
+        create_photographer('omsk', city='Омск')
+        self.assertEqual(self.client.get(reverse('city_autocomplete'), {'q': 'ом'}).json(), {'cities': ['Омск']})
+
+
+@override_settings(IMAGE_WORKERS=0)
+class DashboardQueryTests(TestCase):
+    # Session, user with its profiles, active bookings, counters of both
+    # booking tables, photos, and the first page of completed bookings from
+    # the booking and archive tables for each box
+    QUERY_BUDGET = 10
+
+    def setUp(self):
+        self.photographer = create_photographer('studio', photos=3)
+        self.client.force_login(self.photographer.user)
+
+    def add_bookings(self, count):
+        for i in range(count):
+            client = User.objects.create_user(username=f'client_{BookingRequest.objects.count()}')
+            status = 'completed' if i % 2 else 'new'
+            BookingRequest.objects.create(
+                client=client, photographer=self.photographer, status=status,
+                message='Свадьба', contact_phone='+ 7 999 999 99 99',
+            )
+            BookingRequest.objects.create(
+                client=self.photographer.user, photographer=create_photographer(f'other_{i}_{client.pk}'),
+                status=status, message='Портрет', contact_phone='+ 7 999 999 99 99',
+            )
+
+    def count_queries(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('dashboard'))
+        self.assertEqual(response.status_code, 200)
+        return len(queries), response
+
+    def test_query_budget(self):
+        self.add_bookings(2)
+        few, _ = self.count_queries()
+        self.add_bookings(10)
+        many, response = self.count_queries()
+
+        self.assertEqual(few, many)
+        self.assertLessEqual(many, self.QUERY_BUDGET)
+        self.assertEqual(response.context['booking_counts']['received_total'], 12)
+        self.assertEqual(len(response.context['received_completed_bookings']), 6)
+        self.assertEqual(len(response.context['sent_active_bookings']), 6)
+
+
+@override_settings(VIEW_COUNTER_FLUSH_INTERVAL=0)
+class ViewCounterTests(TestCase):
+    def setUp(self):
+        # Views recorded by earlier tests (profile pages) must not count here
+        discard_views()
+        self.profile = create_photographer('counted')
+
+    def views(self):
+        self.profile.refresh_from_db()
+        return self.profile.views_count
+
+    def test_flush_adds_recorded_views(self):
+        for _ in range(7):
+            record_view(self.profile.pk)
+        self.assertEqual(pending_views(self.profile.pk), 7)
+        flush_views()
+        self.assertEqual((self.views(), pending_views(self.profile.pk)), (7, 0))
+        flush_views()
+        self.assertEqual(self.views(), 7)
+
+    def test_no_flusher_thread_when_disabled(self):
+        record_view(self.profile.pk)
+        self.assertNotIn('view-counter', [thread.name for thread in threading.enumerate()])
+
+    def test_flush_overlapping_other_increments(self):
+        for _ in range(3):
+            record_view(self.profile.pk)
+        update = QuerySet.update
+        overlapped = []
+
+        def update_during_flush(queryset, **kwargs):
+            if not overlapped:
+                overlapped.append(True)
+                # A request counts a view and another process flushes its own
+                # views while this flush is running
+                record_view(self.profile.pk)
+                update(PhotographerProfile.objects.filter(pk=self.profile.pk), views_count=F('views_count') + 5)
+            return update(queryset, **kwargs)
+
+        with mock.patch.object(QuerySet, 'update', update_during_flush):
+            flush_views()
+        self.assertEqual(self.views(), 8)
+        flush_views()
+        self.assertEqual(self.views(), 9)
+
+
+@override_settings(IMAGE_WORKERS=0, FEATURED_POOL_SIZE=3)
+class FeaturedPhotoTests(TestCase):
+    def setUp(self):
+        clear_caches()
+        self.profile = create_photographer('featured', photos=5)
+
+    def test_pool_is_a_sample_of_ready_photos(self):
+        Photo.objects.filter(pk=Photo.objects.first().pk).update(status=Photo.STATUS_PROCESSING)
+        pool = get_featured_pool()
+        self.assertEqual(len(pool), 3)
+        self.assertTrue(set(pool) <= set(Photo.objects.filter(status=Photo.STATUS_READY).values_list('pk', flat=True)))
+
+    def test_deleted_photos_leave_the_pool(self):
+        pool = get_featured_pool()
+        Photo.objects.get(pk=pool[0]).delete()
+        self.assertNotIn(pool[0], get_featured_pool())
+        self.assertEqual(len(get_featured_photos(6)), 3)
+
+    def test_unpublished_photos_are_not_shown(self):
+        pool = get_featured_pool()
+        # update() skips the signals, so the pool still holds the photo
+        Photo.objects.filter(pk=pool[0]).update(status=Photo.STATUS_FAILED)
+        shown = [photo.pk for photo in get_featured_photos(6)]
+        self.assertEqual(sorted(shown), sorted(pool[1:]))
+
+
+@override_settings(IMAGE_WORKERS=0)
+class GalleryPaginationTests(TestCase):
+    def setUp(self):
+        clear_caches()
+        profile = create_photographer('gallery', photos=GALLERY_PAGE_SIZE + 5)
+        # Bulk uploads share a timestamp; the id breaks the tie
+        Photo.objects.filter(photographer=profile).update(uploaded_at=timezone.now())
+
+    def test_pages_do_not_overlap_on_equal_timestamps(self):
+        photos = Photo.objects.filter(status=Photo.STATUS_READY)
+        seen, cursor = [], None
+        while True:
+            page, cursor = keyset_page(photos, cursor, 10, 'uploaded_at')
+            seen.extend(photo.pk for photo in page)
+            if not cursor:
+                break
+        self.assertEqual(len(seen), GALLERY_PAGE_SIZE + 5)
+        self.assertEqual(seen, sorted(set(seen), reverse=True))
+
+    def test_last_page_has_no_cursor(self):
+        response = self.client.get(reverse('gallery'))
+        cursor = response.context['next_cursor']
+        self.assertEqual(len(response.context['photos']), GALLERY_PAGE_SIZE)
+
+        data = self.client.get(reverse('gallery_page'), {'cursor': cursor}).json()
+        self.assertEqual(data['html'].count('class="masonry-item"'), 5)
+        self.assertIsNone(data['next_cursor'])
+
+    def test_invalid_cursors_give_an_empty_page(self):
+        naive = encode_cursor(timezone.now().replace(tzinfo=None), 1)
+        for cursor in ('garbage', 'Zm9vfGJhcg==', naive, encode_cursor(timezone.now(), 2 ** 70)):
+            response = self.client.get(reverse('gallery_page'), {'cursor': cursor})
+            data = response.json()
+            self.assertEqual((data['html'].strip(), data['next_cursor']), ('', None), cursor)
+
+
+@override_settings(IMAGE_WORKERS=0)
+class BookingHistoryTests(TestCase):
+    def setUp(self):
+        self.photographer = create_photographer('archive')
+        self.booking_client = User.objects.create_user(username='archive_client')
+
+    def add_completed(self, count, archived=0):
+        """Adds `count` completed bookings and archives the oldest `archived` of them."""
+        for i in range(count):
+            BookingRequest.objects.create(
+                client=self.booking_client, photographer=self.photographer, status='completed',
+                message=f'Съёмка {i}', contact_phone='+ 7 999 999 99 99',
+            )
+        if archived:
+            oldest = list(BookingRequest.objects.order_by('created_at', 'id')[:archived])
+            BookingRequest.objects.filter(pk__in=[b.pk for b in oldest]).update(
+                created_at=oldest[0].created_at.replace(year=2000)
+            )
+            call_command('archive_bookings', days=365, stdout=StringIO())
+
+    def all_pages(self, page_size):
+        pages, cursor = [], None
+        while True:
+            page, cursor = booking_history(self.booking_client, self.photographer, 'sent', cursor, page_size=page_size)
+            pages.append(page)
+            if not cursor:
+                return pages
+
+    def test_pages_continue_into_archive(self):
+        self.add_completed(5, archived=3)
+        self.assertEqual(ArchivedBooking.objects.count(), 3)
+
+        seen = [b for page in self.all_pages(2) for b in page]
+        self.assertEqual(len({b.pk for b in seen}), 5)
+        self.assertEqual([b.is_archived for b in seen], [False, False, True, True, True])
+
+    def test_full_last_page_without_archive(self):
+        self.add_completed(4)
+        self.assertEqual([len(page) for page in self.all_pages(2)], [2, 2])
+
+    def test_invalid_cursor_ends_the_history(self):
+        self.add_completed(3, archived=1)
+        for cursor in ('garbage', 'archive-garbage'):
+            self.assertEqual(booking_history(self.booking_client, self.photographer, 'sent', cursor), ([], None))
+
+    def test_page_boundary_between_tables(self):
+        # The hot rows exactly fill the first page; the archive follows on the next
+        self.add_completed(4, archived=2)
+        pages = self.all_pages(2)
+        self.assertEqual([[b.is_archived for b in page] for page in pages], [[False, False], [True, True]])
+
+    def test_booking_completed_after_archiving(self):
+        # Archived at 300 and 190 days old; a 250-day-old booking is only
+        # completed after that run, so it stays in the booking table
+        now = timezone.now()
+        for days in (300, 190):
+            booking = BookingRequest.objects.create(
+                client=self.booking_client, photographer=self.photographer, status='completed',
+                message=f'{days}', contact_phone='+ 7 999 999 99 99',
+            )
+            BookingRequest.objects.filter(pk=booking.pk).update(created_at=now - timedelta(days=days))
+        call_command('archive_bookings', days=180, stdout=StringIO())
+        late = BookingRequest.objects.create(
+            client=self.booking_client, photographer=self.photographer, status='in_progress',
+            message='250', contact_phone='+ 7 999 999 99 99',
+        )
+        BookingRequest.objects.filter(pk=late.pk).update(created_at=now - timedelta(days=250), status='completed')
+
+        for page_size in (1, 2, 3, 20):
+            pages = self.all_pages(page_size)
+            self.assertEqual([b.message for page in pages for b in page], ['190', '250', '300'], page_size)
+
+    def test_archived_bookings_on_dashboard(self):
+        self.add_completed(3, archived=2)
+        archived = ArchivedBooking.objects.first()
+        self.client.force_login(self.photographer.user)
+        response = self.client.get(reverse('dashboard'))
+
+        counts = response.context['booking_counts']
+        self.assertEqual((counts['received_completed'], counts['received_total']), (3, 3))
+        self.assertEqual(len(response.context['received_completed_bookings']), 3)
+        # Archived bookings can't be deleted, so they get no delete form
+        self.assertNotContains(response, f'name="booking_id" value="{archived.pk}"')
+        hot = BookingRequest.objects.get()
+        self.assertContains(response, f'name="booking_id" value="{hot.pk}"')
+
+        response = self.client.post(reverse('dashboard'), {'cancel_booking': '', 'booking_id': hot.pk})
+        self.assertRedirects(response, reverse('dashboard'))
+        self.assertTrue(BookingRequest.objects.get().is_deleted_by_photographer)
+
+
+@override_settings(IMAGE_WORKERS=0)
+class PublicPageCacheTests(TestCase):
+    def setUp(self):
+        clear_caches()
+
+    def test_anonymous_pages_served_from_cache(self):
+        create_photographer('cached', photos=2)
+        self.client.get(reverse('specialists'))
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('specialists'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(queries), 0)
+        # Pages stay out of the default cache and its small bookkeeping entries
+        self.assertFalse(any(key.startswith(':1:page:') for key in cache._cache))
+
+    def test_renaming_a_photographer_invalidates_cached_pages(self):
+        profile = create_photographer('oldname')
+        self.assertContains(self.client.get(reverse('specialists')), 'oldname')
+        profile.user.username = 'newname'
+        profile.user.save()
+        self.assertContains(self.client.get(reverse('specialists')), 'newname')
+
+    def test_saving_news_invalidates_cached_pages(self):
+        News.objects.create(title='Первая', content='Текст')
+        self.assertContains(self.client.get(reverse('news')), 'Первая')
+
+        News.objects.create(title='Вторая', content='Текст')
+        self.assertContains(self.client.get(reverse('news')), 'Вторая')
+
+    def test_logged_in_users_bypass_page_cache(self):
+        profile = create_photographer('member')
+        self.client.force_login(profile.user)
+        self.client.get(reverse('news'))
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(reverse('news'))
+        self.assertGreater(len(queries), 0)
+
+
+@override_settings(IMAGE_WORKERS=0)
+class ConditionalGetTests(TestCase):
+    def setUp(self):
+        clear_caches()
+
+    def test_unchanged_news_answers_not_modified(self):
+        news = News.objects.create(title='Выставка', content='Текст')
+        response = self.client.get(reverse('news_detail', args=[news.pk]))
+        etag = response.headers['ETag']
+
+        response = self.client.get(reverse('news_detail', args=[news.pk]), headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 304)
+
+        news.title = 'Выставка переносится'
+        news.save()
+        response = self.client.get(reverse('news_detail', args=[news.pk]), headers={'If-None-Match': etag})
+        self.assertContains(response, 'Выставка переносится')
+
+    def test_deleting_a_photo_changes_the_gallery_etag(self):
+        create_photographer('gallery', photos=2)
+        etag = self.client.get(reverse('gallery')).headers['ETag']
+        self.assertEqual(self.client.get(reverse('gallery'), headers={'If-None-Match': etag}).status_code, 304)
+
+        Photo.objects.first().delete()
+        self.assertEqual(self.client.get(reverse('gallery'), headers={'If-None-Match': etag}).status_code, 200)
+
+    def test_not_modified_gallery_runs_no_queries(self):
+        create_photographer('gallery', photos=2)
+        etag = self.client.get(reverse('gallery')).headers['ETag']
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get(reverse('gallery'), headers={'If-None-Match': etag}).status_code, 304)
+
+    def test_deleting_news_changes_the_news_etag(self):
+        News.objects.create(title='Первая', content='Текст')
+        second = News.objects.create(title='Вторая', content='Текст')
+        etag = self.client.get(reverse('news')).headers['ETag']
+        second.delete()
+        self.assertEqual(self.client.get(reverse('news'), headers={'If-None-Match': etag}).status_code, 200)
+
+    def test_lost_cache_versions_are_not_reused(self):
+        before = get_versions('news')
+        cache.clear()
+        self.assertNotEqual(get_versions('news'), before)
+
+    def test_new_login_changes_the_etag(self):
+        # A 304 would keep a page whose forms hold the previous CSRF token
+        profile = create_photographer('member')
+        url = reverse('photographer_detail', args=[profile.pk])
+        self.client.force_login(profile.user)
+        etag = self.client.get(url).headers['ETag']
+        self.assertEqual(self.client.get(url, headers={'If-None-Match': etag}).status_code, 304)
+
+        self.client.logout()
+        self.client.force_login(profile.user)
+        self.assertEqual(self.client.get(url, headers={'If-None-Match': etag}).status_code, 200)
+
+
+@override_settings(IMAGE_WORKERS=0, MEDIA_ROOT=tempfile.mkdtemp())
+class AvatarTests(TestCase):
+    def setUp(self):
+        clear_caches()
+
+    def test_initials_avatar_is_generated_once_locally(self):
+        user = User.objects.create_user(username='anna', first_name='Анна', last_name='Иванова')
+        with self.assertNumQueries(1):
+            url = get_avatar_url(user)
+        self.assertTrue(url.startswith('/media/avatars/'))
+        self.assertEqual(get_avatar_url(User.objects.get(pk=user.pk)), url)
+
+    def test_loaded_profile_needs_no_query(self):
+        profile = create_photographer('loaded')
+        user = User.objects.select_related('photographerprofile', 'clientprofile').get(pk=profile.user.pk)
+        with self.assertNumQueries(0):
+            get_avatar_url(user)
+
+
+@override_settings(IMAGE_WORKERS=0)
+class CurrentProfileTests(TestCase):
+    def test_profiles_load_with_the_request_user(self):
+        user = User.objects.create_user(username='visitor')
+        ClientProfile.objects.create(user=user, phone_number='+ 7 999 999 99 99')
+        self.client.force_login(user)
+
+        for name in ('dashboard', 'news', 'gallery'):
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get(reverse(name))
+            self.assertEqual(response.status_code, 200)
+            profile_lookups = [q['sql'] for q in queries if '"user_id" = ' in q['sql'] and (
+                'FROM "users_clientprofile"' in q['sql'] or 'FROM "users_photographerprofile"' in q['sql']
+            )]
+            self.assertEqual(profile_lookups, [], name)
+
+    def test_sessions_from_model_backend_stay_signed_in(self):
+        user = User.objects.create_user(username='returning', password='password123')
+        self.client.force_login(user, backend='django.contrib.auth.backends.ModelBackend')
+        response = self.client.get(reverse('dashboard'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['user'], user)
+
+    def test_new_logins_use_profile_backend(self):
+        User.objects.create_user(username='returning', password='password123')
+        self.assertTrue(self.client.login(username='returning', password='password123'))
+        self.assertEqual(self.client.session[BACKEND_SESSION_KEY], 'users.backends.ProfileBackend')
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp(), IMMUTABLE_MEDIA_PREFIXES=['avatars/'])
+class AssetDeliveryTests(SimpleTestCase):
+    def setUp(self):
+        for name in ('avatars/a.png', 'photographs/b.jpg'):
+            path = Path(settings.MEDIA_ROOT, name)
+            path.parent.mkdir(parents=True, exist_ok=True)
+            path.write_bytes(bytes(range(256)) * 4)
+        self.factory = RequestFactory()
+
+    def test_byte_ranges(self):
+        response = serve_media(self.factory.get('/', headers={'Range': 'bytes=10-19'}), 'photographs/b.jpg')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response['Content-Range'], 'bytes 10-19/1024')
+        self.assertEqual(b''.join(response.streaming_content), bytes(range(10, 20)))
+
+        response = serve_media(self.factory.get('/', headers={'Range': 'bytes=2000-'}), 'photographs/b.jpg')
+        self.assertEqual(response.status_code, 416)
+
+    def test_cache_headers(self):
+        response = serve_media(self.factory.get('/'), 'avatars/a.png')
+        self.assertIn('immutable', response['Cache-Control'])
+        response = serve_media(self.factory.get('/'), 'photographs/b.jpg')
+        self.assertEqual(response['Cache-Control'], 'public, no-cache')
+
+        response = serve_media(self.factory.get('/', headers={'If-None-Match': response['ETag']}), 'photographs/b.jpg')
+        self.assertEqual(response.status_code, 304)
+
+
+@override_settings(IMAGE_WORKERS=0, MEDIA_ROOT=tempfile.mkdtemp(), RENDITION_FORMATS=['webp', 'jpeg'])
+class PictureTagTests(TestCase):
+    def setUp(self):
+        clear_caches()
+
+    def test_modern_formats_offered_as_picture_sources(self):
+        output = BytesIO()
+        Image.new('RGBA', (1000, 500), (200, 0, 0, 128)).save(output, 'PNG')
+        news = News.objects.create(title='Баннер', content='Текст', image=ContentFile(output.getvalue(), 'banner.png'))
+        build_renditions(news.image.name)
+
+        html = Template('{% load renditions %}{% responsive_img image width=400 %}').render(
+            Context({'image': news.image})
+        )
+        self.assertTrue(html.startswith('<picture><source type="image/webp"'))
+        self.assertIn('400.webp 400w', html)
+        self.assertIn('400.jpg 400w', html)
+
+    def test_renditions_survive_a_cache_miss(self):
+        output = BytesIO()
+        Image.new('RGB', (1000, 500), 'red').save(output, 'JPEG')
+        news = News.objects.create(title='Баннер', content='Текст', image=ContentFile(output.getvalue(), 'banner.jpg'))
+        built = build_renditions(news.image.name)
+
+        # As after a restart or in another worker: the manifest on disk is enough
+        cache.clear()
+        self.assertEqual(get_renditions(news.image.name), built)
+        cache.clear()
+        with mock.patch('users.renditions.Image.open') as image_open:
+            self.assertEqual(build_renditions(news.image.name), built)
+        image_open.assert_not_called()
+
+    def test_reused_legacy_name_gets_new_renditions(self):
+        # Renditions are served as immutable, so a name reused for other
+        # bytes must not point at the old ones
+        def store(color):
+            output = BytesIO()
+            Image.new('RGB', (1000, 500), color).save(output, 'JPEG')
+            return default_storage.save('photographs/legacy.jpg', ContentFile(output.getvalue()))
+
+        name = store('red')
+        before = build_renditions(name)
+        default_storage.delete(name)
+        self.assertEqual(store('blue'), name)
+
+        after = build_renditions(name)
+        self.assertNotEqual(after[400], before[400])
+        self.assertEqual(get_renditions(name), after)
+        with default_storage.open(after[400].removeprefix(settings.MEDIA_URL)) as f, Image.open(f) as img:
+            red, green, blue = img.getpixel((10, 10))
+        self.assertGreater(blue, red)
+
+
+class ImageCompressionTests(SimpleTestCase):
+    def test_unreadable_image_is_logged_and_kept(self):
+        upload = SimpleUploadedFile('broken.jpg', b'not an image', content_type='image/jpeg')
+        with self.assertLogs('users.images', 'ERROR') as logs:
+            self.assertIs(compress_image(upload), upload)
+        self.assertIn('broken.jpg', logs.output[0])
+
+    def jpeg(self, width, height):
+        output = BytesIO()
+        Image.new('RGB', (width, height), 'teal').save(output, format='JPEG')
+        return SimpleUploadedFile('camera.jpg', output.getvalue(), content_type='image/jpeg')
+
+    def test_large_jpeg_is_decoded_at_reduced_scale(self):
+        with mock.patch.object(images._decode_budget, 'acquire', wraps=images._decode_budget.acquire) as acquire:
+            compressed = compress_image(self.jpeg(4000, 3000), max_width=1000)
+        # Draft mode decoded 1/2 of the width at most, not the full frame
+        self.assertLessEqual(acquire.call_args.args[0], 2000 * 1500 * 3 * 2)
+        with Image.open(compressed) as result:
+            self.assertEqual(result.size, (1000, 750))
+
+    def test_size_matches_the_encoded_bytes(self):
+        compressed = compress_image(self.jpeg(800, 600))
+        self.assertEqual(compressed.size, len(compressed.read()))
+        self.assertEqual(compressed.name, 'camera.jpg')
+
+    def test_images_over_the_pixel_limit_are_rejected(self):
+        with mock.patch('users.images.MAX_IMAGE_PIXELS', 800 * 600 - 1):
+            with self.assertRaisesMessage(ValueError, '800x600'):
+                encode_jpeg(self.jpeg(800, 600), BytesIO())
+
+    def test_memory_budget_holds_back_decodes_over_the_limit(self):
+        budget = _MemoryBudget(100)
+        self.assertEqual(budget.acquire(60), 60)
+        acquired = threading.Event()
+
+        def second_decode():
+            budget.acquire(60)
+            acquired.set()
+
+        thread = threading.Thread(target=second_decode)
+        thread.start()
+        self.assertFalse(acquired.wait(0.1))
+        budget.release(60)
+        self.assertTrue(acquired.wait(5))
+        thread.join()
+        budget.release(60)
+        # More than the whole budget runs on its own rather than waiting forever
+        self.assertEqual(budget.acquire(500), 100)
+
+
+@override_settings(IMAGE_WORKERS=0, IMAGE_PROCESSES=1, MEDIA_ROOT=tempfile.mkdtemp())
+class DeduplicatedUploadTests(TestCase):
+    def setUp(self):
+        clear_caches()
+        output = BytesIO()
+        Image.new('RGB', (2000, 1000), (40, 90, 160)).save(output, 'JPEG', quality=95)
+        self.jpeg = output.getvalue()
+
+    def upload(self, profile, count):
+        upload_photos(profile, [SimpleUploadedFile(f'IMG_{i}.jpg', self.jpeg) for i in range(count)])
+        process_pending_photos()
+
+    def test_identical_uploads_share_one_compressed_file(self):
+        first, second = create_photographer('first'), create_photographer('second')
+        self.upload(first, 2)
+        names = set(Photo.objects.values_list('image', flat=True))
+        self.assertEqual(len(names), 1)
+        name = names.pop()
+        self.assertEqual(len(list(Path(settings.MEDIA_ROOT, 'photographs').rglob('*.jpg'))), 1)
+
+        # Known bytes are not compressed again
+        with mock.patch('users.tasks.compress_batch') as compress_batch:
+            self.upload(second, 1)
+        compress_batch.assert_not_called()
+        self.assertEqual(second.photos.get().image.name, name)
+        self.assertEqual(StoredFile.objects.get(name=name).refs, 3)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Photo.objects.filter(photographer=first).delete()
+        self.assertTrue(Path(settings.MEDIA_ROOT, name).exists())
+        with self.captureOnCommitCallbacks(execute=True):
+            second.photos.get().delete()
+        self.assertFalse(Path(settings.MEDIA_ROOT, name).exists())
+
+    def test_replaced_profile_images_are_released(self):
+        profile = create_photographer('avatar')
+        self.client.force_login(profile.user)
+
+        def upload(color):
+            output = BytesIO()
+            Image.new('RGB', (400, 400), color).save(output, 'JPEG')
+            with self.captureOnCommitCallbacks(execute=True):
+                self.client.post(reverse('dashboard'), {
+                    'update_profile': '', 'email': 'avatar@example.com', 'short_intro': 'Фотограф', 'bio': 'Био',
+                    'specialization': 'wedding', 'price': 1000, 'language': 'ru',
+                    'profile_image': SimpleUploadedFile('me.jpg', output.getvalue()),
+                })
+            profile.refresh_from_db()
+            return profile.profile_image.name
+
+        first = upload('red')
+        second = upload('blue')
+        self.assertNotEqual(first, second)
+        self.assertEqual(StoredFile.objects.get(name=first).refs, 0)
+        self.assertFalse(Path(settings.MEDIA_ROOT, first).exists())
+        # Uploading the same bytes again keeps exactly one reference
+        self.assertEqual(upload('blue'), second)
+        self.assertEqual(StoredFile.objects.get(name=second).refs, 1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('delete_profile_image'))
+        self.assertEqual(StoredFile.objects.get(name=second).refs, 0)
+        self.assertFalse(Path(settings.MEDIA_ROOT, second).exists())
+
+
+@override_settings(IMAGE_WORKERS=0, IMAGE_PROCESSES=1, MEDIA_ROOT=tempfile.mkdtemp(), RENDITION_WIDTHS=[160], RENDITION_FORMATS=['jpeg'])
+class BackgroundCompressionTests(TestCase):
+    def setUp(self):
+        clear_caches()
+        self.profile = create_photographer('queued')
+
+    def upload(self, *contents):
+        with self.captureOnCommitCallbacks(execute=True):
+            photos = upload_photos(self.profile, [
+                SimpleUploadedFile(f'IMG_{i}.jpg', content) for i, content in enumerate(contents)
+            ])
+        return [photo.pk for photo in photos]
+
+    def jpeg(self, color):
+        output = BytesIO()
+        Image.new('RGB', (2400, 1200), color).save(output, 'JPEG', quality=95)
+        return output.getvalue()
+
+    def test_without_workers_the_command_processes_the_queue(self):
+        good, broken = self.upload(self.jpeg('green'), b'not an image')
+        # IMAGE_WORKERS = 0: nothing runs in the request, the rows wait
+        self.assertEqual(set(Photo.objects.values_list('status', flat=True)), {Photo.STATUS_PROCESSING})
+        raw_name = Photo.objects.get(pk=good).image.name
+
+        out = StringIO()
+        with self.assertLogs('users.tasks', 'ERROR'):
+            call_command('process_images', once=True, stdout=out)
+        self.assertIn('Processed 2 photo(s)', out.getvalue())
+
+        photo = Photo.objects.get(pk=good)
+        self.assertEqual(photo.status, Photo.STATUS_READY)
+        self.assertNotEqual(photo.image.name, raw_name)
+        self.assertEqual(Image.open(photo.image.path).width, Photo.IMAGE_MAX_WIDTH)
+        self.assertFalse(Path(settings.MEDIA_ROOT, raw_name).exists())
+        self.assertEqual(Photo.objects.get(pk=broken).status, Photo.STATUS_FAILED)
+        # Nothing left in the queue
+        self.assertEqual(process_pending_photos(), 0)
+
+    @override_settings(IMAGE_WORKERS=2)
+    def test_workers_pick_up_uploads_after_commit(self):
+        with mock.patch('users.tasks._get_executor') as get_executor:
+            ids = self.upload(self.jpeg('red'), self.jpeg('blue'))
+        get_executor.return_value.submit.assert_called_once_with(_run, process_photos, ids)
+
+    def test_finished_photos_are_not_processed_again(self):
+        pk, = self.upload(self.jpeg('red'))
+        process_pending_photos()
+        name = Photo.objects.get(pk=pk).image.name
+        with mock.patch('users.tasks.compress_batch') as compress_batch:
+            process_photos([pk])
+        compress_batch.assert_not_called()
+        self.assertEqual(Photo.objects.get(pk=pk).image.name, name)
+
+
+class SQLiteProfileTests(SimpleTestCase):
+    def test_production_profile_applies_pragmas_and_immediate_transactions(self):
+        from django.db.backends.sqlite3.base import DatabaseWrapper
+
+        with tempfile.TemporaryDirectory() as tmp:
+            wrapper = DatabaseWrapper(
+                {**connection.settings_dict, **settings.SQLITE_PRODUCTION_PROFILE, 'NAME': str(Path(tmp, 'db.sqlite3'))},
+                alias='profile-test',
+            )
+            try:
+                with wrapper.cursor() as cursor:
+                    pragmas = {}
+                    for pragma in ('journal_mode', 'synchronous', 'busy_timeout'):
+                        cursor.execute(f'PRAGMA {pragma}')
+                        pragmas[pragma] = cursor.fetchone()[0]
+                self.assertEqual(pragmas, {'journal_mode': 'wal', 'synchronous': 1, 'busy_timeout': 10000})
+                self.assertEqual(wrapper.transaction_mode, 'IMMEDIATE')
+            finally:
+                wrapper.close()
+
+    def test_write_transaction_only_with_immediate_transactions(self):
+        view = write_transaction(lambda request: HttpResponse())
+        request = RequestFactory().post('/')
+        for mode, wrapped in ((None, False), ('DEFERRED', False), ('IMMEDIATE', True)):
+            with mock.patch.dict(connection.settings_dict, OPTIONS={'transaction_mode': mode}), \
+                    mock.patch('users.transactions.transaction.atomic') as atomic:
+                view(request)
+            self.assertEqual(atomic.called, wrapped, mode)
+        # Reads never start a transaction
+        with mock.patch.dict(connection.settings_dict, OPTIONS={'transaction_mode': 'IMMEDIATE'}), \
+                mock.patch('users.transactions.transaction.atomic') as atomic:
+            view(RequestFactory().get('/'))
+        self.assertFalse(atomic.called)
+
+
+@override_settings(IMAGE_WORKERS=0)
+class SearchTests(TestCase):
+    def setUp(self):
+        clear_caches()
+        self.anna = create_photographer('anna', city='Казань', short_intro='Свадебная фотография', bio='Снимаю свадьбы и портреты')
+        self.anna.user.first_name, self.anna.user.last_name = 'Анна', 'Смирнова'
+        self.anna.user.save()
+        self.oleg = create_photographer('oleg', city='Москва', short_intro='Репортажи', bio='Городские прогулки')
+        self.news = News.objects.create(title='Выставка городских фотографов', content='<p>Открылась выставка.</p>')
+
+    def found(self, query, **kwargs):
+        return [(hit.kind, hit.object.pk) for hit in search_documents(query, **kwargs)[:20]]
+
+    def check_search(self):
+        # Other word forms, names and prefixes match; every word has to match
+        self.assertEqual(self.found('свадебные фотографии'), [('photographer', self.anna.pk)])
+        self.assertEqual(self.found('смирновой'), [('photographer', self.anna.pk)])
+        self.assertEqual(self.found('казан'), [('photographer', self.anna.pk)])
+        self.assertEqual(self.found('свадебные москва'), [])
+        # The title outranks the body
+        self.assertEqual(self.found('городской'), [('news', self.news.pk), ('photographer', self.oleg.pk)])
+        self.assertEqual(self.found('городской', kind='photographer'), [('photographer', self.oleg.pk)])
+        self.assertEqual(search_documents('и в на').count(), 0)
+
+        # Kept in sync by signals
+        self.oleg.bio = 'Свадебные репортажи'
+        self.oleg.save()
+        self.assertEqual(len(self.found('свадебный')), 2)
+        self.anna.user.last_name = 'Иванова'
+        self.anna.user.save(update_fields=['last_name'])
+        self.assertEqual(self.found('смирнова'), [])
+        self.news.delete()
+        self.assertEqual(self.found('выставка'), [])
+
+    def test_fts5(self):
+        self.assertTrue(fts_enabled())
+        self.check_search()
+
+    @override_settings(SEARCH_USE_FTS5=False)
+    def test_in_process_index(self):
+        self.check_search()
+
+    def test_search_page(self):
+        response = self.client.get(reverse('search'), {'q': 'фотограф', 'type': 'news'})
+        self.assertContains(response, 'Выставка городских фотографов')
+        self.assertNotContains(response, 'Анна Смирнова')
+        response = self.client.get(reverse('search'), {'q': 'фотограф'}, headers={'x-requested-with': 'XMLHttpRequest'})
+        self.assertEqual(response.json()['count'], 2)
+
+
+@override_settings(IMAGE_WORKERS=0, MEDIA_ROOT=tempfile.mkdtemp(), RENDITION_WIDTHS=[160], RENDITION_FORMATS=['jpeg'])
+class SeedContentTests(TestCase):
+    def seed(self):
+        call_command(
+            'seed_content', photographers=5, photos=3, clients=4, bookings=10, news=2, stdout=StringIO(),
+        )
+
+    def test_seeding_is_idempotent(self):
+        self.seed()
+        counts = (PhotographerProfile.objects.count(), Photo.objects.count(), BookingRequest.objects.count(), News.objects.count())
+        self.assertEqual(counts, (5, 15, 10, 2))
+        self.assertEqual(ClientProfile.objects.count(), 4)
+        self.assertEqual(PhotographerProfile.objects.filter(city_normalized='').count(), 0)
+        self.assertGreater(search_documents('фотограф').count(), 0)
+
+        self.seed()
+        self.assertEqual(
+            (PhotographerProfile.objects.count(), Photo.objects.count(), BookingRequest.objects.count(), News.objects.count()),
+            counts,
+        )
+        # Every row holds exactly one reference to the shared file
+        for stored in StoredFile.objects.filter(name__startswith='photographs/'):
+            self.assertEqual(stored.refs, Photo.objects.filter(image=stored.name).count())
+
+
+@override_settings(IMAGE_WORKERS=0, METRICS_TOKEN='scrape-secret')
+class MetricsTests(TestCase):
+    def test_requests_are_measured_by_url_name(self):
+        create_photographer('anna', photos=2)
+        before = REQUESTS.values[('specialists', 200)]
+        self.client.get(reverse('specialists'))
+        self.assertEqual(REQUESTS.values[('specialists', 200)], before + 1)
+
+        response = self.client.get(reverse('metrics'), headers={'Authorization': 'Bearer scrape-secret'})
+        self.assertEqual(response['Content-Type'], 'text/plain; version=0.0.4; charset=utf-8')
+        lines = response.content.decode().splitlines()
+        self.assertIn('# TYPE worldphoto_request_duration_seconds histogram', lines)
+        self.assertIn(f'worldphoto_requests_total{{view="specialists",status="200"}} {before + 1}', lines)
+        for metric in ('db_queries_per_request', 'db_query_duration_seconds', 'template_render_seconds'):
+            self.assertTrue(any(line.startswith(f'worldphoto_{metric}_bucket{{view="specialists",le="+Inf"}}') for line in lines))
+        queries = next(line for line in lines if line.startswith('worldphoto_db_queries_per_request_sum{view="specialists"}'))
+        self.assertGreater(float(queries.split()[-1]), 0)
+
+    def test_metrics_require_the_token(self):
+        # Requests through a reverse proxy on the same host come from 127.0.0.1
+        self.assertEqual(self.client.get(reverse('metrics'), REMOTE_ADDR='127.0.0.1').status_code, 403)
+        response = self.client.get(reverse('metrics'), headers={'Authorization': 'Bearer wrong'})
+        self.assertEqual(response.status_code, 403)
+
+    @override_settings(METRICS_TOKEN='')
+    def test_metrics_are_off_without_a_token(self):
+        response = self.client.get(reverse('metrics'), headers={'Authorization': 'Bearer '})
+        self.assertEqual(response.status_code, 404)
+
+    @override_settings(SLOW_REQUEST_THRESHOLD=0)
+    def test_slow_requests_are_logged_with_their_sql(self):
+        create_photographer('anna')
+        with self.assertLogs('users.metrics', 'WARNING') as logs:
+            self.client.get(reverse('specialists'))
+        self.assertIn('(specialists)', logs.output[0])
+        self.assertIn('SELECT', logs.output[0])
@@ -0,0 +1,38 @@
+"""
+Transactions for views that read rows and then change them.
+
+Outside a transaction every query commits on its own, so a view that checks
+a row and then updates it can interleave with another request doing the
+same. Inside a plain (deferred) SQLite transaction it is worse: the read
+takes a shared lock, and when the write then needs the write lock held by
+another connection SQLite fails at once with "database is locked", without
+waiting out busy_timeout.
+
+The production database profile starts transactions with BEGIN IMMEDIATE
+(OPTIONS['transaction_mode']), which takes the write lock up front and
+waits for it like any other write. write_transaction() puts the unsafe
+requests of a view in one such transaction; GETs stay outside it, so page
+views never queue behind writers. With deferred transactions (the default
+profile) it does nothing, since that would only make the error likelier.
+"""
+from functools import wraps
+
+from django.db import connection, transaction
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+
+def _begins_immediate():
+    # Other databases lock rows, not the whole file, so a transaction is safe there
+    mode = connection.settings_dict.get('OPTIONS', {}).get('transaction_mode') or ''
+    return connection.vendor != 'sqlite' or mode.upper() == 'IMMEDIATE'
+
+
+def write_transaction(view):
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        if request.method in SAFE_METHODS or not _begins_immediate():
+            return view(request, *args, **kwargs)
+        with transaction.atomic():
+            return view(request, *args, **kwargs)
+    return wrapper
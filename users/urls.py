@@ -4,12 +4,16 @@ from . import views
 urlpatterns = [
     path('register/', views.register, name='register'),
     path('specialists/', views.specialists, name='specialists'),
+    path('specialists/cities/', views.city_autocomplete, name='city_autocomplete'),
     path('specialists/<int:pk>/', views.photographer_detail, name='photographer_detail'),
     path('specialists/<int:pk>/favorite/', views.toggle_favorite, name='toggle_favorite'),
     path('news/', views.news, name='news'),
     path('news/<int:pk>/', views.news_detail, name='news_detail'),
+    path('search/', views.search, name='search'),
     path('gallery/', views.gallery, name='gallery'),
+    path('gallery/page/', views.gallery_page, name='gallery_page'),
     path('dashboard/', views.dashboard, name='dashboard'),
+    path('dashboard/bookings/', views.dashboard_bookings, name='dashboard_bookings'),
     path('profile/delete-image/', views.delete_profile_image, name='delete_profile_image'),
     path('', include('django.contrib.auth.urls')),
 ]
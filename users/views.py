@@ -3,19 +3,28 @@ from django.contrib.auth import login, logout
 from django.contrib.auth.decorators import login_required
 from .forms import UserRegistrationForm, PhotographerProfileForm, PhotoUploadForm, BookingRequestForm, ClientProfileForm
 from .models import PhotographerProfile, Photo, News, BookingRequest, Favorite, ClientProfile
-import random
+from .caching import cache_public_page, conditional_page, get_versions
+from .cities import suggest_cities
+from .counters import record_view
+from .featured import get_featured_photos
+from .pagination import keyset_page, CachedCountPaginator
+from .profiles import get_photographer_profile, get_profile
+from .search import search_documents
+from .services import attach_portfolio_previews, booking_history, build_dashboard, filter_photographers, upload_photos, filters_cache_key, SPECIALISTS_ORDERING
+from .transactions import write_transaction
+from django.core.paginator import Paginator
 from django.http import JsonResponse
 from django.template.loader import render_to_string
-from django.db.models import Q
+from django.db.models import Q, Count, Exists, Max, OuterRef
 from django.contrib.auth.forms import PasswordChangeForm
 from django.contrib.auth import update_session_auth_hash
 from django.contrib import messages
+from django.conf import settings
 
+@cache_public_page('photos', 'photographers')
 def home(request):
-    # Get random photos for "Best Photos" simulation or just latest
-    all_photos = list(Photo.objects.all())
-    # Return up to 6 random photos
-    best_photos = random.sample(all_photos, min(len(all_photos), 6))
+    # Random photos for "Best Photos", picked from a cached pool of IDs
+    best_photos = get_featured_photos(6)
     
     specializations = PhotographerProfile.SPECIALIZATION_CHOICES
     
@@ -50,26 +59,23 @@ def register(request):
     return render(request, 'users/register.html', {'form': form})
 
 @login_required
+@write_transaction
 def dashboard(request):
     # Check if user is photographer
-    try:
-        profile = request.user.photographerprofile
-        is_photographer = True
-        client_profile = None
-    except PhotographerProfile.DoesNotExist:
-        profile = None
-        is_photographer = False
+    profile = get_photographer_profile(request.user)
+    is_photographer = profile is not None
+    client_profile = None
+    if not is_photographer:
         # Get or create ClientProfile
-        client_profile, created = ClientProfile.objects.get_or_create(user=request.user)
+        client_profile = get_profile(request.user)
+        if client_profile is None:
+            client_profile = ClientProfile.objects.create(user=request.user)
 
     password_form = PasswordChangeForm(request.user)
     
     # Forms for photographer
     p_form = None
     photo_form = None
-    photos = []
-    received_active_bookings = []
-    received_completed_bookings = []
     
     # Forms for client
     client_form = None
@@ -77,18 +83,9 @@ def dashboard(request):
     if is_photographer:
         p_form = PhotographerProfileForm(instance=profile)
         photo_form = PhotoUploadForm()
-        photos = profile.photos.all().order_by('-uploaded_at')
-        all_received = BookingRequest.objects.filter(photographer=profile, is_deleted_by_photographer=False).order_by('-created_at')
-        received_active_bookings = all_received.exclude(status='completed')
-        received_completed_bookings = all_received.filter(status='completed')
     else:
         client_form = ClientProfileForm(instance=client_profile)
 
-    # Common data
-    all_sent = BookingRequest.objects.filter(client=request.user, is_deleted_by_client=False).order_by('-created_at')
-    sent_active_bookings = all_sent.exclude(status='completed')
-    sent_completed_bookings = all_sent.filter(status='completed')
-    
     favorites = Favorite.objects.filter(user=request.user)
 
     if request.method == 'POST':
@@ -213,12 +210,11 @@ def dashboard(request):
                 photo_form = PhotoUploadForm(request.POST, request.FILES)
                 if photo_form.is_valid():
                     images = request.FILES.getlist('image')
-                    for img in images:
-                        Photo.objects.create(photographer=profile, image=img)
+                    upload_photos(profile, images)
                     
                     count = len(images)
                     if count > 0:
-                        messages.success(request, f'Добавлено фото: {count} шт.')
+                        messages.success(request, f'Добавлено фото: {count} шт. Они появятся в портфолио после обработки.')
                     else:
                         messages.warning(request, 'Не выбрано ни одного фото.')
                         
@@ -232,85 +228,164 @@ def dashboard(request):
                     messages.success(request, 'Профиль обновлен.')
                     return redirect('dashboard')
     
+    # Photos, bookings and counters, loaded only when the page is actually rendered
+    dashboard_data = build_dashboard(request.user, profile)
+
     return render(request, 'users/dashboard.html', {
         'is_photographer': is_photographer,
         'p_form': p_form,
         'photo_form': photo_form,
-        'photos': photos,
         'password_form': password_form,
-        'received_bookings': received_active_bookings, # Backward compatibility if needed, but we'll use new names in template
-        'received_active_bookings': received_active_bookings,
-        'received_completed_bookings': received_completed_bookings,
-        'sent_bookings': sent_active_bookings, # Backward compatibility
-        'sent_active_bookings': sent_active_bookings,
-        'sent_completed_bookings': sent_completed_bookings,
+        'received_bookings': dashboard_data['received_active_bookings'], # Backward compatibility if needed, but we'll use new names in template
+        'sent_bookings': dashboard_data['sent_active_bookings'], # Backward compatibility
         'favorites': favorites,
         'client_form': client_form,
         'client_profile': client_profile,
+        **dashboard_data,
     })
 
+SPECIALISTS_PAGE_SIZE = 12
+
+
+@cache_public_page('photographers', 'photos')
 def specialists(request):
-    photographers = PhotographerProfile.objects.all()
+    photographers, filters = filter_photographers(request.GET)
 
-    # Filtering
-    specialization = request.GET.get('specialization')
-    price_min = request.GET.get('price_min')
-    price_max = request.GET.get('price_max')
-    city = request.GET.get('city')
-    language = request.GET.get('language')
+    sort = request.GET.get('sort')
+    if sort not in SPECIALISTS_ORDERING:
+        sort = 'newest'
+    photographers = photographers.order_by(*SPECIALISTS_ORDERING[sort])
 
-    if specialization and specialization != 'any':
-        photographers = photographers.filter(specialization=specialization)
+    # Annotate favorites in the same query
+    if request.user.is_authenticated:
+        photographers = photographers.annotate(is_favorite=Exists(
+            Favorite.objects.filter(user=request.user, photographer=OuterRef('pk'))
+        ))
+
+    # Match counts depend only on the filters, so they are shared between users and sort orders
+    paginator = CachedCountPaginator(
+        photographers,
+        SPECIALISTS_PAGE_SIZE,
+        cache_key=filters_cache_key('specialists_count', filters),
+        timeout=settings.SPECIALISTS_COUNT_TTL,
+    )
+    page = paginator.get_page(request.GET.get('page'))
+    page.object_list = attach_portfolio_previews(page.object_list)
+
+    context = {
+        'photographers': page.object_list,
+        'page_obj': page,
+        'sort': sort,
+    }
 
-    if language and language != 'any':
-        photographers = photographers.filter(language=language)
+    if request.headers.get('x-requested-with') == 'XMLHttpRequest':
+        html = render_to_string('users/specialists_list.html', context, request=request)
+        return JsonResponse({
+            'html': html,
+            'count': paginator.count,
+            'page': page.number,
+            'num_pages': paginator.num_pages,
+        })
 
-    if city:
-        photographers = photographers.filter(city__icontains=city)
+    return render(request, 'users/specialists.html', context)
 
-    if price_min:
-        try:
-            photographers = photographers.filter(price__gte=int(price_min))
-        except ValueError:
-            pass
-            
-    if price_max:
-        try:
-            photographers = photographers.filter(price__lte=int(price_max))
-        except ValueError:
-            pass
 
-    # Annotate favorites
-    if request.user.is_authenticated:
-        favorite_ids = Favorite.objects.filter(user=request.user).values_list('photographer_id', flat=True)
-        for p in photographers:
-            p.is_favorite = p.id in favorite_ids
+SEARCH_PAGE_SIZE = 20
+# ?type= value -> kind of document in users.search
+SEARCH_TYPES = {'photographers': 'photographer', 'news': 'news'}
+
+
+@cache_public_page('photographers', 'news')
+def search(request):
+    query = request.GET.get('q', '').strip()
+    search_type = request.GET.get('type')
+    if search_type not in SEARCH_TYPES:
+        search_type = ''
+
+    paginator = Paginator(search_documents(query, SEARCH_TYPES.get(search_type)), SEARCH_PAGE_SIZE)
+    page = paginator.get_page(request.GET.get('page'))
+
+    context = {
+        'query': query,
+        'search_type': search_type,
+        'results': page.object_list,
+        'page_obj': page,
+        'count': paginator.count,
+    }
 
     if request.headers.get('x-requested-with') == 'XMLHttpRequest':
-        html = render_to_string('users/specialists_list.html', {'photographers': photographers, 'user': request.user})
-        return JsonResponse({'html': html})
+        html = render_to_string('users/search_results.html', context, request=request)
+        return JsonResponse({
+            'html': html,
+            'count': paginator.count,
+            'page': page.number,
+            'num_pages': paginator.num_pages,
+        })
+
+    return render(request, 'users/search.html', context)
 
-    return render(request, 'users/specialists.html', {'photographers': photographers})
 
+def city_autocomplete(request):
+    return JsonResponse({'cities': suggest_cities(request.GET.get('q', ''))})
 
+
+@write_transaction
 def photographer_detail(request, pk):
+    response = _photographer_page(request, pk)
+    # Counted outside the page cache and the 304 check so those hits count too.
+    # Buffered; written to the database in batches by users.counters
+    record_view(pk)
+    return response
+
+def _latest(*timestamps):
+    timestamps = [t for t in timestamps if t is not None]
+    return max(timestamps) if timestamps else None
+
+# Validators for conditional_page. Photo counts catch deletions, which
+# leave MAX(updated_at) unchanged. The buffered view counter isn't part of
+# them, so a 304 may show a slightly older count.
+
+def _photographer_validator(request, pk):
+    row = (
+        PhotographerProfile.objects.filter(pk=pk)
+        .annotate(photos_updated=Max('photos__updated_at'), photo_count=Count('photos'))
+        .values_list('updated_at', 'photos_updated', 'photo_count')
+        .first()
+    )
+    if row is None:
+        return None
+    updated_at, photos_updated, photo_count = row
+    return _latest(updated_at, photos_updated), photo_count
+
+def _namespace_validator(*namespaces):
+    # Pages over whole tables: the cache versions the signals bump on every
+    # change, one cache round trip instead of an aggregate over the table
+    def validator(request):
+        versions = get_versions(*namespaces)
+        return None, ','.join(f"{namespace}={versions[namespace]}" for namespace in namespaces)
+    return validator
+
+# Signed-in visitors see their favourites in the gallery
+_gallery_validator = _namespace_validator('photos', 'photographers', 'favorites')
+_news_validator = _namespace_validator('news')
+
+def _news_detail_validator(request, pk):
+    updated_at = News.objects.filter(pk=pk).values_list('updated_at', flat=True).first()
+    return None if updated_at is None else (updated_at, '')
+
+@conditional_page(_photographer_validator)
+@cache_public_page('photographers', 'photos')
+def _photographer_page(request, pk):
     photographer = get_object_or_404(PhotographerProfile, pk=pk)
-    
-    # Increment views
-    photographer.views_count += 1
-    photographer.save(update_fields=['views_count'])
-    
+
     is_favorite = False
     if request.user.is_authenticated:
         is_favorite = Favorite.objects.filter(user=request.user, photographer=photographer).exists()
 
     initial_data = {}
-    if request.user.is_authenticated:
-        try:
-            if hasattr(request.user, 'clientprofile'):
-                 initial_data['contact_phone'] = request.user.clientprofile.phone_number
-        except Exception:
-            pass
+    profile = get_profile(request.user)
+    if isinstance(profile, ClientProfile):
+        initial_data['contact_phone'] = profile.phone_number
 
     form = BookingRequestForm(initial=initial_data)
 
@@ -328,13 +403,17 @@ def photographer_detail(request, pk):
                 messages.success(request, 'Ваша заявка успешно отправлена!')
                 return redirect('photographer_detail', pk=pk)
 
+    portfolio = photographer.photos.filter(status=Photo.STATUS_READY).order_by('-uploaded_at')
+
     return render(request, 'users/photographer_detail.html', {
         'photographer': photographer,
+        'portfolio': portfolio,
         'booking_form': form,
         'is_favorite': is_favorite
     })
 
 @login_required
+@write_transaction
 def toggle_favorite(request, pk):
     if request.method == 'POST':
         photographer = get_object_or_404(PhotographerProfile, pk=pk)
@@ -350,21 +429,17 @@ def toggle_favorite(request, pk):
     return JsonResponse({'status': 'error'}, status=400)
 
 @login_required
+@write_transaction
 def delete_profile_image(request):
     if request.method == 'POST':
         try:
-            # Try photographer profile first
-            try:
-                profile = request.user.photographerprofile
-            except PhotographerProfile.DoesNotExist:
-                # Try client profile
-                try:
-                    profile = request.user.clientprofile
-                except ClientProfile.DoesNotExist:
-                    return JsonResponse({'status': 'error', 'message': 'Profile not found'}, status=404)
+            # Photographer profile first, then client profile
+            profile = get_profile(request.user)
+            if profile is None:
+                return JsonResponse({'status': 'error', 'message': 'Profile not found'}, status=404)
 
             if profile.profile_image:
-                profile.profile_image.delete(save=False) # Delete file
+                # save() releases the stored file
                 profile.profile_image = None
                 profile.save()
             return JsonResponse({'status': 'ok'})
@@ -372,20 +447,53 @@ def delete_profile_image(request):
             return JsonResponse({'status': 'error', 'message': str(e)}, status=500)
     return JsonResponse({'status': 'error', 'message': 'Invalid method'}, status=405)
 
-def gallery(request):
-    photos = Photo.objects.all().order_by('-uploaded_at')
-    
+@login_required
+def dashboard_bookings(request):
+    # Next page of completed bookings for the "Показать ещё" buttons
+    box = request.GET.get('box')
+    if box not in ('received', 'sent'):
+        return JsonResponse({'status': 'error'}, status=400)
+
+    profile = get_photographer_profile(request.user)
+    bookings, next_cursor = booking_history(request.user, profile, box, request.GET.get('cursor'))
+    html = render_to_string(f'users/bookings_{box}_completed.html', {'bookings': bookings}, request=request)
+    return JsonResponse({'html': html, 'next_cursor': next_cursor})
+
+GALLERY_PAGE_SIZE = 24
+
+
+def _gallery_page(request):
+    photos = Photo.objects.filter(status=Photo.STATUS_READY).select_related('photographer__user')
+
     if request.user.is_authenticated:
-        favorite_ids = Favorite.objects.filter(user=request.user).values_list('photographer_id', flat=True)
-        for photo in photos:
-            photo.is_favorite = photo.photographer.id in favorite_ids
-            
-    return render(request, 'users/gallery.html', {'photos': photos})
+        photos = photos.annotate(is_favorite=Exists(
+            Favorite.objects.filter(user=request.user, photographer=OuterRef('photographer_id'))
+        ))
 
+    return keyset_page(photos, request.GET.get('cursor'), GALLERY_PAGE_SIZE, 'uploaded_at')
+
+@conditional_page(_gallery_validator)
+@cache_public_page('photos', 'photographers')
+def gallery(request):
+    photos, next_cursor = _gallery_page(request)
+    return render(request, 'users/gallery.html', {'photos': photos, 'next_cursor': next_cursor})
+
+@conditional_page(_gallery_validator)
+@cache_public_page('photos', 'photographers')
+def gallery_page(request):
+    # Next page of the gallery for infinite scroll
+    photos, next_cursor = _gallery_page(request)
+    html = render_to_string('users/gallery_items.html', {'photos': photos}, request=request)
+    return JsonResponse({'html': html, 'next_cursor': next_cursor})
+
+@conditional_page(_news_validator)
+@cache_public_page('news')
 def news(request):
     news_items = News.objects.all().order_by('-created_at')
     return render(request, 'users/news.html', {'news_items': news_items})
 
+@conditional_page(_news_detail_validator)
+@cache_public_page('news')
 def news_detail(request, pk):
     news_item = get_object_or_404(News, pk=pk)
     return render(request, 'users/news_detail.html', {'news': news_item})